@@ -0,0 +1,155 @@
+import asyncio
+import signal
+import time
+
+from metrics import dump_metrics
+
+# ----------------------------
+# AuctionProtocol
+# ----------------------------
+class AuctionProtocol(asyncio.DatagramProtocol):
+    """
+    Feeds datagrams straight into the engine's dispatcher. Handlers reply
+    through transport.sendto, which never blocks the loop.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+
+    def datagram_received(self, data, addr):
+        self.engine.handle_datagram(data, addr)
+
+    def error_received(self, exc):
+        self.engine.log(f"(UDP) Socket error: {exc}")
+
+# ----------------------------
+# AsyncAuctionServer
+# ----------------------------
+class AsyncAuctionServer:
+    """
+    Hosts an AuctionEngine on a single asyncio event loop: the UDP endpoint,
+    announcement publishing, expiry timers and journal group commits all run
+    as loop callbacks/tasks, so command handling never races another thread.
+    Only snapshot compaction is pushed to the default executor, since it
+    serializes the whole store, and session channel writes stay on the
+    session pool's threads (they only ever queue from the loop).
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = None
+        self.transport = None
+        self.tasks = []
+        self.expiry_timer = None
+        self.expiry_deadline = None
+        self.publish_event = None
+        self.stopped = None
+
+    async def serve(self):
+        engine = self.engine
+        self.loop = asyncio.get_running_loop()
+        self.publish_event = asyncio.Event()
+        self.stopped = self.loop.create_future()
+
+        self.transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: AuctionProtocol(engine), local_addr=(engine.host, engine.port))
+        engine.sendto = self.transport.sendto
+        engine.sendto_threadsafe = lambda data, addr: self.loop.call_soon_threadsafe(
+            self.transport.sendto, data, addr)
+        engine.publisher.wakeup = self.publish_event.set
+        engine.expiry.on_earliest = self.arm_expiry_timer
+        engine.begin(sync_thread=False)
+
+        self.tasks = [
+            self.loop.create_task(self.publish_task()),
+            self.loop.create_task(self.compaction_task()),
+        ]
+        if engine.journal.fsync_mode != "always":
+            self.tasks.append(self.loop.create_task(self.journal_sync_task()))
+        if engine.publisher.keepalive_interval > 0:
+            self.tasks.append(self.loop.create_task(self.keepalive_task()))
+        if engine.metrics_file:
+            self.tasks.append(self.loop.create_task(self.metrics_task()))
+        self.arm_expiry_timer(engine.expiry.next_deadline())
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self.shutdown)
+        except (NotImplementedError, RuntimeError):
+            pass  # no signal handlers on Windows event loops
+
+        try:
+            await self.stopped
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            if self.expiry_timer:
+                self.expiry_timer.cancel()
+            engine.stop()
+            self.transport.close()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    def shutdown(self):
+        if self.stopped and not self.stopped.done():
+            self.stopped.set_result(None)
+
+    # ----- Expiry -----
+
+    def arm_expiry_timer(self, deadline):
+        if deadline is None:
+            return
+        if self.expiry_timer and self.expiry_deadline <= deadline:
+            return
+        if self.expiry_timer:
+            self.expiry_timer.cancel()
+        self.expiry_deadline = deadline
+        delay = max(0, deadline - time.time())
+        self.expiry_timer = self.loop.call_later(delay, self.fire_expiry_timer)
+
+    def fire_expiry_timer(self):
+        self.expiry_timer = None
+        self.expiry_deadline = None
+        due = self.engine.expiry.pop_due()
+        if due:
+            self.engine.expire_items(due)
+        self.arm_expiry_timer(self.engine.expiry.next_deadline())
+
+    # ----- Background tasks -----
+
+    async def publish_task(self):
+        publisher = self.engine.publisher
+        while True:
+            await self.publish_event.wait()
+            self.publish_event.clear()
+            if publisher.coalesce_delay:
+                await asyncio.sleep(publisher.coalesce_delay)
+            publisher.flush_pending()
+
+    async def keepalive_task(self):
+        publisher = self.engine.publisher
+        while True:
+            await asyncio.sleep(publisher.keepalive_interval)
+            publisher.refresh_all()
+
+    async def journal_sync_task(self):
+        journal = self.engine.journal
+        while True:
+            await asyncio.sleep(journal.fsync_interval)
+            journal.sync()
+
+    async def metrics_task(self):
+        engine = self.engine
+        while True:
+            await asyncio.sleep(engine.metrics_interval)
+            try:
+                await self.loop.run_in_executor(None, dump_metrics, engine.metrics, engine.metrics_file)
+            except OSError:
+                pass
+
+    async def compaction_task(self):
+        engine = self.engine
+        while True:
+            await asyncio.sleep(engine.compact_interval)
+            if engine.journal.records_since_snapshot:
+                await self.loop.run_in_executor(None, engine.compact)
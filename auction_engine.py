@@ -0,0 +1,941 @@
+import contextlib
+import math
+import socket
+import threading
+import json
+import os
+import random
+import time
+
+from store import AuctionStore
+from journal import Journal
+from snapshot import SnapshotError
+from records import User, Item, Subscription, validate_ports
+from expiry import ExpiryScheduler, time_left
+from publisher import AnnouncementPublisher
+from reply_cache import ReplyCache
+from log_pipeline import LogPipeline
+from metrics import Metrics, dump_loop
+from profiler import Profiler
+from session_channel import SessionPool, SESSION_CONNECTIONS, session_port
+from multicast import MULTICAST_VERSION
+from pattern_index import is_pattern
+from search_index import (ORDERS, MAX_PAGE, FIRST_PAGE, tokenize, parse_cursor, format_cursor,
+                          result_row)
+from protocol import (decode, encode, describe, command_name, negotiate, pack_batches, MAX_DATAGRAM, TEXT_VERSION,
+                      OP_BATCH, OP_STATS, OP_STATS_REPLY, OP_PROFILE, OP_PROFILE_REPLY, DENIALS,
+                      OP_REGISTER, OP_REGISTERED, OP_REGISTER_DENIED, OP_LOGIN, OP_LOGIN_OK,
+                      OP_LOGIN_FAIL, OP_DE_REGISTER, OP_DE_REGISTERED, OP_LIST_ITEM,
+                      OP_ITEM_LISTED, OP_LIST_DENIED, OP_SUBSCRIBE, OP_SUBSCRIBED,
+                      OP_SUBSCRIPTION_DENIED, OP_DE_SUBSCRIBE, OP_SEARCH, OP_BROWSE,
+                      OP_SEARCH_RESULTS, OP_SEARCH_DENIED, OP_BID, OP_BID_ACCEPTED, OP_BID_REJECTED,
+                      OP_SESSION, OP_SESSION_OK, OP_SESSION_DENIED, OP_SYNC, OP_WINNER, OP_SOLD,
+                      OP_NON_OFFER, OP_MCAST_INFO, OP_MCAST_CONFIG, OP_MCAST_JOIN, OP_MCAST_OK,
+                      OP_MCAST_DENIED, OP_AUCTION_SNAPSHOT, OP_RESYNC, OP_RESYNC_DENIED)
+
+SERVER_IP = "127.0.0.1"
+SERVER_PORT = 5000
+MAX_USERS = 4
+MAX_ITEMS_PER_SELLER = 4
+BID_STRIPES = 64
+# Longest auction accepted, in seconds: durations and times left travel as int32
+MAX_DURATION = 2**31 - 1
+# A bid accepted with less than this many seconds left pushes the deadline
+# out to this many seconds from now (0 disables anti-sniping)
+SNIPE_WINDOW = 30
+BID_INCREMENT = 0.01
+# Read-only commands: running one twice is harmless, so their replies are
+# not kept in the reply cache
+UNCACHED_OPCODES = frozenset((OP_STATS, OP_SEARCH, OP_BROWSE, OP_RESYNC, OP_MCAST_INFO))
+
+USERS_DATA_FILE = "users_data.json"
+ITEMS_DATA_FILE = "items_data.json"
+SUBSCRIPTIONS_DATA_FILE = "subscriptions_data.json"
+
+# One item in SYNC, as in SEARCH_RESULTS: [item_id, item, description, price, time_left]
+def sync_row(item, now):
+    return [item.item_id, item.item_name, item.description, item.current_price, time_left(item, now)]
+
+# ----------------------------
+# Legacy JSON import
+# ----------------------------
+# State now lives in a storage backend (see journal.py). These loaders only
+# run once, on a node whose storage is still empty.
+def load_users(store):
+    if os.path.exists(USERS_DATA_FILE):
+        try:
+            with open(USERS_DATA_FILE, "r") as f:
+                loaded = json.load(f)
+        except ValueError as e:
+            # Refuse to start rather than import an empty catalog
+            raise SnapshotError(f"{USERS_DATA_FILE}: {e!r}") from e
+        try:
+            users = [User.from_dict(user) for user in loaded]
+        except (ValueError, KeyError, TypeError) as e:
+            raise SnapshotError(f"{USERS_DATA_FILE}: {e!r}") from e
+        for user in users:
+            store.add_user(user)
+
+def load_items(store):
+    if os.path.exists(ITEMS_DATA_FILE):
+        try:
+            with open(ITEMS_DATA_FILE, "r") as f:
+                loaded = json.load(f)
+            items = []
+            for item in loaded:
+                duration = int(item["duration"])
+                # Legacy files store the remaining seconds, not a deadline
+                items.append(Item(item.get("item_id", str(random.randint(10000,99999))), item["seller_name"],
+                                  item["item_name"], item["description"], item["start_price"], duration,
+                                  time.time() + duration))
+        except (ValueError, KeyError, TypeError) as e:
+            raise SnapshotError(f"{ITEMS_DATA_FILE}: {e!r}") from e
+        for item in items:
+            store.add_item(item)
+
+def load_subscriptions(store):
+    if os.path.exists(SUBSCRIPTIONS_DATA_FILE):
+        try:
+            with open(SUBSCRIPTIONS_DATA_FILE, "r") as f:
+                subs = [Subscription.from_dict(sub) for sub in json.load(f)]
+        except (ValueError, KeyError, TypeError) as e:
+            raise SnapshotError(f"{SUBSCRIPTIONS_DATA_FILE}: {e!r}") from e
+        for sub in subs:
+            store.add_subscription(sub)
+
+# ----------------------------
+# AuctionEngine
+# ----------------------------
+class AuctionEngine:
+    """
+    The auction server without any UI:
+    - Owns the command handlers and, in threaded mode, the UDP socket
+      (async_server.AsyncAuctionServer hosts it on an asyncio loop instead)
+    - Expires auctions at their deadlines and runs the announcement publisher
+    - Persists every mutation through a storage backend (`journal`: a
+      journal.Journal by default, or sqlite_storage.SqliteStorage)
+    - Counts commands, denials and latencies (metrics.py), served by STATS
+    - Profiles hot paths on demand (profiler.py), switched by PROFILE/SIGUSR1
+    - Serializes BIDs per item with striped locks instead of the engine lock
+    - Sends auction results and SYNC over pooled TCP session connections
+      to the clients' tcp_ports (session_channel.py)
+    - Announces changes as per-item versioned deltas to clients that can
+      read them, with RESYNC for a client that missed one (publisher.py)
+    - Optionally announces through IP multicast groups (multicast.py)
+    - Emits events (users_changed, items_changed, subscriptions_changed)
+      to any registered listeners, e.g. the Tk ServerApp
+    """
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, journal=None, compact_interval=60,
+                 keepalive_interval=0, reply_cache=None, logs=None, max_users=MAX_USERS,
+                 max_items_per_seller=MAX_ITEMS_PER_SELLER, metrics_file=None, metrics_interval=10,
+                 profile_dir=".", bid_stripes=BID_STRIPES, snipe_window=SNIPE_WINDOW,
+                 session_connections=SESSION_CONNECTIONS, multicast=None):
+        self.host = host
+        self.port = port
+        self.journal = journal or Journal()
+        self.compact_interval = compact_interval
+        self.max_users = max_users
+        self.max_items_per_seller = max_items_per_seller
+        self.sock = None
+        self.sendto = None
+        # sendto for other threads (the session lanes); the asyncio host
+        # replaces it with a call_soon_threadsafe wrapper
+        self.sendto_threadsafe = None
+        self.snipe_window = snipe_window
+        # Per-thread: a BID can run while another thread executes under self.lock
+        self.reply_context = threading.local()
+        # Replays answers to retransmitted commands (see reply_cache.py)
+        self.replies = reply_cache or ReplyCache()
+        self.listeners = []
+        # Log records go to consumers (Tk view, stdout/file sinks) off-thread
+        self.logs = logs or LogPipeline()
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.journal.metrics = self.metrics
+        self.profiler = Profiler(profile_dir)
+        self.journal.profiler = self.profiler
+        self.sessions = SessionPool(session_connections)
+        self.sessions.metrics = self.metrics
+        self.sessions.on_undeliverable = self.session_fallback
+        # multicast.MulticastGroups, or None for unicast-only announcements
+        self.multicast = multicast
+        self.running = False
+
+        # Handlers run on the UDP thread, expiry and publisher on
+        # their own threads, so every state mutation goes through this lock.
+        self.lock = threading.RLock()
+        self.compact_lock = threading.Lock()
+        # BIDs take only their item's stripe. Lock order: self.lock, then a
+        # stripe, then the leaf locks (journal, index, publisher, expiry).
+        self.item_locks = [threading.Lock() for _ in range(bid_stripes)]
+
+        self.store = AuctionStore()
+        self.needs_snapshot = False
+        if not self.journal.recover(self.store):
+            load_users(self.store)
+            load_items(self.store)
+            load_subscriptions(self.store)
+            self.needs_snapshot = True
+
+        # opcode -> handler(rq, *fields, addr)
+        self.handlers = {
+            OP_REGISTER: self.handle_register,
+            OP_LOGIN: self.handle_login,
+            OP_DE_REGISTER: self.handle_deregister,
+            OP_LIST_ITEM: self.handle_list_item,
+            OP_SUBSCRIBE: self.handle_subscribe,
+            OP_DE_SUBSCRIBE: self.handle_de_subscribe,
+            OP_STATS: self.handle_stats,
+            OP_PROFILE: self.handle_profile,
+            OP_SEARCH: self.handle_search,
+            OP_BROWSE: self.handle_browse,
+            OP_BID: self.handle_bid,
+            OP_SESSION: self.handle_session,
+            OP_MCAST_INFO: self.handle_mcast_info,
+            OP_MCAST_JOIN: self.handle_mcast_join,
+            OP_RESYNC: self.handle_resync,
+        }
+
+        self.publisher = AnnouncementPublisher(self, keepalive_interval)
+        self.expiry = ExpiryScheduler()
+        for item in self.store.items.values():
+            self.expiry.schedule(item.item_id, item.end_time)
+
+        store = self.store
+        for name, read in (
+            ("users", lambda: len(store.users)),
+            ("items", lambda: len(store.items)),
+            ("subscriptions", lambda: len(store.subscriptions)),
+            ("announce_queue", self.publisher.queue_depth),
+            ("announce_versions", lambda: len(self.publisher.versions)),
+            ("expiry_heap", lambda: len(self.expiry)),
+            ("reply_cache_entries", lambda: len(self.replies)),
+            ("reply_cache_bytes", lambda: self.replies.bytes),
+            ("journal_records_since_snapshot", lambda: self.journal.records_since_snapshot),
+            ("session_connections", self.sessions.connection_count),
+            ("session_queue", self.sessions.queue_depth),
+        ):
+            self.metrics.gauge(name, read)
+        if multicast is not None:
+            self.metrics.gauge("multicast_members", multicast.member_count)
+
+    # ----- Events -----
+
+    def add_listener(self, callback):
+        """
+        callback(event, data) is called from engine threads, so listeners
+        must not touch widgets directly. For the *_changed events data lists
+        the affected keys (user names, item ids, (buyer, item_name) pairs);
+        None means anything may have changed.
+        """
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def emit(self, event, data=None):
+        for callback in self.listeners:
+            callback(event, data)
+
+    def log(self, message, kind="info"):
+        # message: str, or a callable producing it (see LogPipeline.push)
+        self.logs.push(kind, message)
+
+    # ----- Lifecycle -----
+
+    def begin(self, sync_thread=True):
+        """
+        Transport-independent startup: open the journal and write the first
+        snapshot after a legacy import. self.sendto must already be set.
+        """
+        self.running = True
+        self.journal.open(sync_thread)
+        self.sessions.start()
+        if self.multicast is not None:
+            self.multicast.open()
+        if self.needs_snapshot:
+            self.compact()
+            self.needs_snapshot = False
+        self.log(f"(UDP) Server listening on {self.host}:{self.port}")
+
+    def bind_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.host, self.port))
+        return sock
+
+    def start(self):
+        self.sock = self.bind_socket()
+        self.sendto = self.sock.sendto
+        self.begin()
+
+        # Start listening, item expiry, and announcements
+        threading.Thread(target=self.listen_udp, daemon=True).start()
+        threading.Thread(target=self.expiry_loop, daemon=True).start()
+        self.publisher.start()
+        threading.Thread(target=self.compaction_loop, daemon=True).start()
+        if self.metrics_file:
+            threading.Thread(target=dump_loop, daemon=True,
+                             args=(self.metrics, self.metrics_file, self.metrics_interval,
+                                   lambda: self.running)).start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.expiry.wake()
+        self.publisher.stop()
+        self.sessions.stop()
+        if self.multicast is not None:
+            self.multicast.close()
+        self.compact()
+        with self.compact_lock:
+            self.journal.close()
+        if self.sock:
+            self.sock.close()
+
+    def serve_forever(self):
+        """
+        Blocks the calling thread until interrupted (used by --headless).
+        """
+        try:
+            while self.running:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    # ----- Locking -----
+
+    def item_lock(self, item_id):
+        return self.item_locks[hash(item_id) % len(self.item_locks)]
+
+    def command_lock(self, opcode, fields):
+        """
+        The lock a command runs under: its item's stripe for BID (fields[1]
+        is the item id), so bids on a hot item queue only behind each other,
+        not behind other commands, expiry passes or announcement flushes.
+        """
+        if opcode == OP_BID:
+            return self.item_lock(fields[1])
+        return self.lock
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """
+        Holds self.lock and every stripe: nothing can change state.
+        """
+        with self.lock, contextlib.ExitStack() as stack:
+            for lock in self.item_locks:
+                stack.enter_context(lock)
+            yield
+
+    @property
+    def reply_version(self):
+        return getattr(self.reply_context, "version", TEXT_VERSION)
+
+    @reply_version.setter
+    def reply_version(self, version):
+        self.reply_context.version = version
+
+    @property
+    def reply_sink(self):
+        return getattr(self.reply_context, "sink", None)
+
+    @reply_sink.setter
+    def reply_sink(self, sink):
+        self.reply_context.sink = sink
+
+    def reply(self, addr, opcode, rq, *fields):
+        """
+        Answers the request being handled, in the protocol version it was
+        negotiated at (text requests always get text). Inside a BATCH the
+        reply is collected for the multi-status answer instead of sent.
+        """
+        data = encode(self.reply_version, opcode, rq, fields)
+        self.metrics.incr(f"reply.{command_name(opcode)}")
+        if opcode in DENIALS:
+            self.metrics.incr(f"denied.{command_name(opcode)}.{fields[0]}")
+        if self.reply_sink is not None:
+            self.reply_sink.append(data)
+        else:
+            self.sendto(data, addr)
+
+    # ----- Receiving (UDP) -----
+
+    def listen_udp(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                break
+            self.handle_datagram(data, addr)
+
+    def handle_datagram(self, data, addr):
+        started = time.perf_counter()
+        message = decode(data)
+        if message is None:
+            self.metrics.incr("malformed")
+            self.log(f"(UDP) Dropped malformed datagram from {addr}")
+            return
+        version, opcode, rq, fields = message
+        name = command_name(opcode)
+        self.metrics.incr(f"received.{name}")
+        # Formatted only if a consumer will see it
+        self.log(lambda: f"(UDP) Received from {addr}: {describe(version, opcode, rq, fields)}", name)
+        try:
+            if not self.dispatch(message, data, addr):
+                return
+        except Exception as e:
+            # A handler bug must not end the receive loop: drop this datagram only
+            self.metrics.incr(f"failed.{name}")
+            self.log(f"(UDP) Dropped {name} from {addr}, handler failed: {e!r}", "error")
+            return
+        # Receipt to reply sent, including time spent waiting for the lock
+        self.metrics.observe(f"command.{name}", time.perf_counter() - started)
+        self.profiler.record(f"dispatch.{name}", started)
+
+    def dispatch(self, message, data, addr):
+        """
+        Runs or forwards one decoded datagram. Returns False if nothing here
+        answered it (forwarded or unknown command).
+        """
+        version, opcode, rq, fields = message
+        if opcode == OP_BATCH:
+            self.handle_batch(version, rq, fields, addr)
+        elif self.forward(message, data, addr):
+            self.metrics.incr(f"forwarded.{command_name(opcode)}")
+            return False
+        elif opcode in self.handlers:
+            with self.command_lock(opcode, fields):
+                replies = self.execute(version, opcode, rq, fields, addr)
+            for data in replies:
+                self.sendto(data, addr)
+        else:
+            return False
+        return True
+
+    def handle_batch(self, version, rq, frames, addr):
+        """
+        Runs every command in a BATCH and answers with one BATCH holding the
+        individual replies (split only if they overflow one datagram).
+        """
+        local = []
+        for frame in frames:
+            message = decode(frame)
+            if message is None or message[1] == OP_BATCH or message[1] not in self.handlers:
+                continue
+            # Forwarding may block on another process, so never under the lock
+            if not self.forward(message, frame, addr):
+                local.append(message)
+        replies = []
+        with self.lock:
+            for message in local:
+                with self.command_lock(message[1], message[3]):
+                    replies.extend(self.execute(*message, addr))
+        for datagram in pack_batches(negotiate(version), rq, replies):
+            self.sendto(datagram, addr)
+
+    def execute(self, version, opcode, rq, fields, addr):
+        """
+        Runs one command (caller holds the lock) and returns its encoded
+        replies. A retransmission of a command already answered gets the
+        cached replies back without running the handler again; read-only
+        commands just run again.
+        """
+        # The fields are part of the key: the text client picks rq at
+        # random, so two different commands can share one
+        key = (addr, opcode, rq, hash(tuple(fields)))
+        cacheable = rq and opcode not in UNCACHED_OPCODES
+        if cacheable:
+            cached = self.replies.get(key)
+            if cached is not None:
+                self.metrics.incr(f"replayed.{command_name(opcode)}")
+                self.log(f"(UDP) Replaying cached reply to {command_name(opcode)} {rq} from {addr}")
+                return cached
+        replies = []
+        self.reply_version = negotiate(version)
+        self.reply_sink = replies
+        try:
+            self.handlers[opcode](rq, *fields, addr)
+        finally:
+            self.reply_sink = None
+        if cacheable:
+            self.replies.put(key, replies)
+        return replies
+
+    def forward(self, message, data, addr):
+        """
+        Returns True if another process owns this command and it was handed
+        off (see sharding.ShardedEngine); the base engine owns everything.
+        """
+        return False
+
+    # ----- Handlers -----
+
+    def handle_register(self, rq, name, role, ip, udp_port, tcp_port, addr):
+        store = self.store
+        # Check duplicates
+        if store.get_user(name) is not None:
+            self.reply(addr, OP_REGISTER_DENIED, rq, "NameInUse")
+            self.log(f"(UDP) Denied registration (duplicate name): {name}")
+            return
+        # Check capacity
+        if store.user_count() >= self.max_users:
+            self.reply(addr, OP_REGISTER_DENIED, rq, "ServerFull")
+            self.log("(UDP) Denied registration (server full).")
+            return
+
+        # Accept (ports are parsed here, once)
+        try:
+            new_user = User(name, role, ip, udp_port, tcp_port, self.reply_version)
+            validate_ports(new_user)
+        except ValueError:
+            self.reply(addr, OP_REGISTER_DENIED, rq, "InvalidPort")
+            self.log(f"(UDP) Denied registration (invalid port): {name}")
+            return
+        store.add_user(new_user)
+        self.journal.append("register", user=new_user)
+        self.emit("users_changed", [name])
+        self.reply(addr, OP_REGISTERED, rq)
+        self.log(f"(UDP) Registered new user: {name} ({role})")
+
+    def handle_login(self, rq, name, role, addr):
+        found_user = self.store.get_user(name)
+        if found_user and found_user.role == role:
+            if found_user.protocol != self.reply_version:
+                # Announcements follow the version negotiated at the latest login
+                found_user.protocol = self.reply_version
+                self.journal.append("register", user=found_user)
+            if self.multicast is not None:
+                # A new client process has joined no groups yet
+                self.multicast.forget(name)
+            self.reply(addr, OP_LOGIN_OK, rq)
+            self.log(f"(UDP) Login success for {name} ({role})")
+        else:
+            self.reply(addr, OP_LOGIN_FAIL, rq, "NotFound")
+            self.log(f"(UDP) Login fail for {name} ({role})")
+
+    def handle_session(self, rq, name, tcp_port, addr):
+        user = self.store.get_user(name)
+        if user is None:
+            self.reply(addr, OP_SESSION_DENIED, rq, "NotFound")
+            self.log(f"(UDP) SESSION denied for {name}, not found.")
+            return
+        try:
+            port = session_port(tcp_port)
+        except ValueError:
+            self.reply(addr, OP_SESSION_DENIED, rq, "InvalidPort")
+            self.log(f"(UDP) SESSION denied for {name} (invalid port).")
+            return
+        if user.tcp_port != port:
+            # A client that restarted listens on a new port
+            user.tcp_port = port
+            self.journal.append("register", user=user)
+            self.emit("users_changed", [name])
+        self.reply(addr, OP_SESSION_OK, rq)
+        self.send_sync(user)
+        self.log(f"(UDP) SESSION for {name} on TCP port {port}")
+
+    def handle_deregister(self, rq, name, addr):
+        removed = self.store.remove_user(name) is not None
+        self.reply(addr, OP_DE_REGISTERED, rq)
+        if removed:
+            self.journal.append("deregister", name=name)
+            if self.multicast is not None:
+                self.multicast.forget(name)
+            self.emit("users_changed", [name])
+            self.log(f"(UDP) De-registered user: {name}")
+        else:
+            self.log(f"(UDP) De-register requested but user not found: {name}")
+
+    def handle_list_item(self, rq, user_name, item_name, item_desc, start_price, duration, addr):
+        store = self.store
+        user = store.get_user(user_name)
+        if user is None:
+            self.reply(addr, OP_LIST_DENIED, rq, "UserNotFound")
+            self.log("(UDP) LIST_ITEM denied (username not found).")
+            return
+        if user.role.lower() != "seller":
+            self.reply(addr, OP_LIST_DENIED, rq, "NotSeller")
+            self.log("(UDP) LIST_ITEM denied (user not a seller).")
+            return
+
+        # Validate
+        if not item_name or item_name.isdigit():
+            self.reply(addr, OP_LIST_DENIED, rq, "InvalidName")
+            self.log("(UDP) LIST_ITEM denied (invalid name).")
+            return
+        try:
+            price = float(start_price)
+        except:
+            price = math.nan
+        # nan / inf would break the price order of the search index
+        if not math.isfinite(price):
+            self.reply(addr, OP_LIST_DENIED, rq, "InvalidPrice")
+            self.log("(UDP) LIST_ITEM denied (invalid price).")
+            return
+        try:
+            dur = int(duration)
+        except:
+            dur = 0
+        if not 0 < dur <= MAX_DURATION:
+            self.reply(addr, OP_LIST_DENIED, rq, "InvalidDuration")
+            self.log("(UDP) LIST_ITEM denied (invalid duration).")
+            return
+
+        # Check capacity
+        if not self.reserve_listing(user_name):
+            self.reply(addr, OP_LIST_DENIED, rq, "SellerAtCapacity")
+            self.log("(UDP) LIST_ITEM denied (seller at capacity).")
+            return
+
+        new_id = self.new_item_id()
+        new_item = Item(new_id, user.name, item_name, item_desc, price, dur, time.time() + dur)
+        store.add_item(new_item)
+        self.journal.append("list_item", item=new_item)
+        self.expiry.schedule(new_id, new_item.end_time)
+        self.publisher.notify_item(new_item)
+        self.emit("items_changed", [new_id])
+        self.reply(addr, OP_ITEM_LISTED, rq)
+        self.log(f"(UDP) Item listed: {item_name} by {user.name}")
+
+    def reserve_listing(self, seller_name):
+        """
+        True if seller_name may list one more item. Sharded workers override
+        this (and release_listing) to count across every shard.
+        """
+        return self.store.seller_item_count(seller_name) < self.max_items_per_seller
+
+    def release_listing(self, seller_name):
+        pass
+
+    def new_item_id(self):
+        new_id = str(random.randint(10000,99999))
+        while self.store.get_item(new_id) is not None:
+            new_id = str(random.randint(10000,99999))
+        return new_id
+
+    def handle_subscribe(self, rq, buyer_name, item_name, addr):
+        buyer = self.store.get_user(buyer_name)
+        if not buyer or buyer.role.lower() != "buyer":
+            self.reply(addr, OP_SUBSCRIPTION_DENIED, rq, "NotBuyerOrNotFound")
+            self.log(f"(UDP) SUBSCRIBE denied for {buyer_name}, not a buyer or not found.")
+            return
+
+        # Already subscribed?
+        if self.store.is_subscribed(buyer_name, item_name):
+            self.reply(addr, OP_SUBSCRIPTION_DENIED, rq, "AlreadySubscribed")
+            self.log(f"(UDP) SUBSCRIBE denied, already subscribed: {buyer_name} -> {item_name}")
+            return
+
+        new_sub = Subscription(buyer_name, item_name)
+        self.store.add_subscription(new_sub)
+        self.journal.append("subscribe", sub=new_sub)
+        self.publisher.notify_subscription(buyer_name, item_name)
+        self.emit("subscriptions_changed", [(buyer_name, item_name)])
+
+        self.reply(addr, OP_SUBSCRIBED, rq)
+        self.log(f"(UDP) SUBSCRIBE success: {buyer_name} -> {item_name}")
+
+    def handle_de_subscribe(self, rq, buyer_name, item_name, addr):
+        found = self.store.remove_subscription(buyer_name, item_name)
+        if not found:
+            self.reply(addr, OP_SUBSCRIPTION_DENIED, rq, "NoSubscription")
+            self.log(f"(UDP) DE-SUBSCRIBE denied, not subscribed: {buyer_name} -> {item_name}")
+            return
+
+        self.journal.append("de_subscribe", buyer_name=buyer_name, item_name=item_name)
+        if self.multicast is not None:
+            self.multicast.leave(buyer_name, item_name)
+        self.emit("subscriptions_changed", [(buyer_name, item_name)])
+
+        self.reply(addr, OP_SUBSCRIBED, rq)
+        self.log(f"(UDP) DE-SUBSCRIBE success: {buyer_name} -> {item_name}")
+
+    def handle_mcast_info(self, rq, addr):
+        multicast = self.multicast
+        if multicast is None:
+            self.reply(addr, OP_MCAST_DENIED, rq, "Disabled")
+            return
+        self.reply(addr, OP_MCAST_CONFIG, rq, multicast.base, multicast.groups, multicast.port)
+
+    def handle_mcast_join(self, rq, buyer_name, item_name, addr):
+        if self.multicast is None:
+            self.reply(addr, OP_MCAST_DENIED, rq, "Disabled")
+            return
+        buyer = self.store.get_user(buyer_name)
+        if not buyer or buyer.role.lower() != "buyer":
+            self.reply(addr, OP_MCAST_DENIED, rq, "NotBuyerOrNotFound")
+            return
+        if buyer.protocol < MULTICAST_VERSION:
+            self.reply(addr, OP_MCAST_DENIED, rq, "ProtocolTooOld")
+            return
+        # A pattern spans every group; its matches keep coming by unicast
+        if is_pattern(item_name):
+            self.reply(addr, OP_MCAST_DENIED, rq, "PatternSubscription")
+            return
+        if not self.store.is_subscribed(buyer_name, item_name):
+            self.reply(addr, OP_MCAST_DENIED, rq, "NoSubscription")
+            return
+        self.multicast.join(buyer_name, item_name)
+        self.reply(addr, OP_MCAST_OK, rq)
+        self.log(f"(UDP) MCAST_JOIN: {buyer_name} -> {item_name} via {self.multicast.group_for(item_name)}")
+
+    def handle_resync(self, rq, buyer_name, item_id, addr):
+        buyer = self.store.get_user(buyer_name)
+        if not buyer or buyer.role.lower() != "buyer":
+            self.reply(addr, OP_RESYNC_DENIED, rq, "NotBuyerOrNotFound")
+            return
+        item = self.store.get_item(item_id)
+        if item is None:
+            # Closed (its final delta was missed) or never existed
+            self.reply(addr, OP_RESYNC_DENIED, rq, "NoSuchItem")
+            return
+        self.reply(addr, OP_AUCTION_SNAPSHOT, rq, *self.publisher.versions.snapshot_fields(item))
+        self.log(f"(UDP) RESYNC: {item_id} for {buyer_name}")
+
+    def handle_search(self, rq, order, cursor, limit, query, addr):
+        tokens = tokenize(query)
+        if not tokens:
+            self.reply(addr, OP_SEARCH_DENIED, rq, "EmptyQuery")
+            return
+        self.answer_search(rq, tokens, order, cursor, limit, addr)
+
+    def handle_browse(self, rq, order, cursor, limit, addr):
+        self.answer_search(rq, [], order, cursor, limit, addr)
+
+    def answer_search(self, rq, tokens, order, cursor, limit, addr):
+        order = order.lower()
+        if order not in ORDERS:
+            self.reply(addr, OP_SEARCH_DENIED, rq, "InvalidOrder")
+            return
+        try:
+            after = parse_cursor(cursor)
+        except ValueError:
+            self.reply(addr, OP_SEARCH_DENIED, rq, "InvalidCursor")
+            return
+        try:
+            limit = min(max(int(limit), 1), MAX_PAGE)
+        except ValueError:
+            self.reply(addr, OP_SEARCH_DENIED, rq, "InvalidLimit")
+            return
+
+        # One extra row tells whether another page follows
+        total, rows = self.search_page(tokens, order, after, limit + 1)
+        next_cursor = format_cursor(rows[limit - 1][:2]) if len(rows) > limit else FIRST_PAGE
+        now = time.time()
+        results = [[item_id, item_name, description, price, max(0, int(end_time - now))]
+                   for _, item_id, item_name, description, price, end_time in rows[:limit]]
+        self.reply(addr, OP_SEARCH_RESULTS, rq, total, next_cursor,
+                   json.dumps(results, separators=(",", ":")))
+        self.log(f"(UDP) {'SEARCH ' + ' '.join(tokens) if tokens else 'BROWSE'} ({order}): "
+                 f"{min(len(rows), limit)} of {total}")
+
+    def search_page(self, tokens, order, after, limit):
+        """
+        (total matches, rows) for one page; rows are search_index.result_row
+        tuples. Sharded workers override this to merge every shard's page.
+        """
+        total, found = self.store.search.search(tokens, order, after, limit)
+        return total, [result_row(key, item) for key, item in found]
+
+    def handle_bid(self, rq, buyer_name, item_id, amount, addr):
+        # Runs under item_lock(item_id) only: reads the store's maps, changes
+        # nothing but this item, and leaves fan-out to the publisher thread.
+        buyer = self.store.get_user(buyer_name)
+        if not buyer or buyer.role.lower() != "buyer":
+            self.reply(addr, OP_BID_REJECTED, rq, "NotBuyerOrNotFound", 0)
+            self.log(f"(UDP) BID denied for {buyer_name}, not a buyer or not found.")
+            return
+        item = self.store.get_item(item_id)
+        now = time.time()
+        if item is None:
+            self.reply(addr, OP_BID_REJECTED, rq, "NoSuchItem", 0)
+            self.log(f"(UDP) BID denied, no such item: {item_id}")
+            return
+        if item.end_time <= now:
+            self.reply(addr, OP_BID_REJECTED, rq, "AuctionClosed", item.current_price)
+            self.log(f"(UDP) BID denied, auction closed: {item_id}")
+            return
+        try:
+            amount = float(amount)
+        except ValueError:
+            amount = math.nan
+        if not math.isfinite(amount):
+            self.reply(addr, OP_BID_REJECTED, rq, "InvalidAmount", item.current_price)
+            self.log("(UDP) BID denied (invalid amount).")
+            return
+        # The first bid may match the start price; later ones must beat the leader
+        minimum = item.current_price + BID_INCREMENT if item.high_bidder else item.start_price
+        if amount < minimum - 1e-9:
+            self.reply(addr, OP_BID_REJECTED, rq, "BidTooLow", item.current_price)
+            self.log(f"(UDP) BID denied (too low): {buyer_name} offered {amount} for {item_id}")
+            return
+
+        # Anti-sniping: a late bid leaves the others snipe_window seconds to answer
+        end_time = item.end_time
+        extended = end_time - now < self.snipe_window
+        if extended:
+            end_time = now + self.snipe_window
+        self.store.record_bid(item, amount, buyer_name, end_time)
+        self.journal.append("bid", item_id=item_id, bidder=buyer_name, price=amount, end_time=end_time)
+        if extended:
+            self.expiry.schedule(item_id, end_time)
+            self.metrics.incr("bids_extended")
+        self.publisher.notify_changed(item)
+        self.emit("items_changed", [item_id])
+        self.reply(addr, OP_BID_ACCEPTED, rq, item_id, amount, time_left(item, now))
+        self.log(f"(UDP) BID accepted: {buyer_name} -> {item_id} at {amount}")
+
+    def handle_stats(self, rq, addr):
+        self.reply(addr, OP_STATS_REPLY, rq, self.metrics.to_json())
+
+    def handle_profile(self, rq, action, addr):
+        # Admin command: only accepted from this host
+        if addr[0] not in ("127.0.0.1", "::1"):
+            self.reply(addr, OP_PROFILE_REPLY, rq, "denied: loopback only")
+            return
+        action = action.lower()
+        if action == "start":
+            message = "started" if self.profiler.start() else "already running"
+        elif action == "stop":
+            collected = self.profiler.finish()
+            if collected is None:
+                message = "not running"
+            else:
+                # Every command waits on the lock held here: write the report without it
+                threading.Thread(target=self.write_profile, args=(collected,), daemon=True).start()
+                message = f"writing {self.profiler.report_prefix(collected)}.folded / .json"
+        elif action == "status":
+            message = self.profiler.status()
+        else:
+            message = "usage: PROFILE start|stop|status"
+        self.reply(addr, OP_PROFILE_REPLY, rq, message)
+        self.log(f"(UDP) PROFILE {action}: {message}")
+
+    def write_profile(self, collected):
+        try:
+            prefix = self.profiler.write(collected)
+        except OSError as e:
+            self.log(f"(PROFILE) Could not write the report: {e!r}", "error")
+            return
+        self.log(f"(PROFILE) Report written to {prefix}.folded / .json")
+
+    # ----- Session channel -----
+
+    def deliver(self, user, opcode, *fields):
+        """
+        Sends an unsolicited message over user's session connection (a
+        datagram if they registered no tcp_port), in their protocol version.
+        Never blocks: the session pool sends from its own threads.
+        """
+        data = encode(user.protocol, opcode, 0, fields)
+        self.metrics.incr(f"deliver.{command_name(opcode)}")
+        if user.tcp_port:
+            self.sessions.send((user.ip, user.tcp_port), data, user.addr)
+        else:
+            self.session_fallback(None, data, user.addr)
+
+    def session_fallback(self, addr, data, udp_addr):
+        # Better a datagram that may be lost than nothing
+        self.metrics.incr("session.fallback")
+        if addr is not None:
+            self.log(f"(TCP) Session channel to {addr} unreachable; sending by UDP")
+        try:
+            (self.sendto_threadsafe or self.sendto)(data, udp_addr)
+        except OSError:
+            pass
+
+    def send_sync(self, user):
+        """
+        SYNC: the user's current state on this node, so a fresh login shows
+        the subscriptions, live matching items and listings it had.
+        """
+        now = time.time()
+        store = self.store
+        state = {"subscriptions": [], "items": [], "listings": []}
+        if user.role.lower() == "buyer":
+            seen = set()
+            for item_name in store.subscriptions_of(user.name):
+                state["subscriptions"].append(item_name)
+                for item in store.items_matching(item_name):
+                    if item.item_id not in seen:
+                        seen.add(item.item_id)
+                        # As last announced, plus its version, so deltas continue from it
+                        item_id, version, name, description, price, left = \
+                            self.publisher.versions.snapshot_fields(item, now)
+                        state["items"].append([item_id, name, description, price, left, version])
+        else:
+            state["listings"] = [sync_row(item, now) for item in store.items_of_seller(user.name)]
+        self.deliver(user, OP_SYNC, user.name, json.dumps(state, separators=(",", ":")))
+
+    def announce_result(self, item):
+        """
+        Close notices for an expired item: WINNER to the high bidder and
+        SOLD to the seller, or NON_OFFER to the seller if nobody bid.
+        """
+        seller = self.store.get_user(item.seller_name)
+        if item.high_bidder:
+            winner = self.store.get_user(item.high_bidder)
+            if winner is not None:
+                self.deliver(winner, OP_WINNER, winner.name, item.item_id, item.item_name,
+                             item.current_price, item.seller_name)
+            if seller is not None:
+                self.deliver(seller, OP_SOLD, seller.name, item.item_id, item.item_name,
+                             item.current_price, item.high_bidder)
+        elif seller is not None:
+            self.deliver(seller, OP_NON_OFFER, seller.name, item.item_id, item.item_name)
+
+    # ----- Background tasks -----
+
+    def expire_items(self, item_ids):
+        now = time.time()
+        expired = []
+        with self.profiler.span("expiry"), self.lock:
+            for item_id in item_ids:
+                # The stripe keeps a concurrent BID from extending it mid-check
+                with self.item_lock(item_id):
+                    item = self.store.get_item(item_id)
+                    # Skip items already gone or whose deadline moved later
+                    if item is None or item.end_time > now:
+                        continue
+                    self.store.remove_item(item_id)
+                self.release_listing(item.seller_name)
+                self.journal.append("expire", item_id=item_id)
+                # Final announcement (time left 0) tells buyers it closed. With
+                # no buyers left no flush will see it again: drop its version now
+                if not self.publisher.notify_item(item):
+                    self.publisher.versions.forget(item_id)
+                self.announce_result(item)
+                expired.append(item_id)
+        if expired:
+            self.metrics.incr("items_expired", len(expired))
+            self.emit("items_changed", expired)
+
+    def expiry_loop(self):
+        while self.running:
+            due = self.expiry.wait_due()
+            if due:
+                self.expire_items(due)
+
+    def compact(self):
+        """
+        Compacts storage: a snapshot plus journal truncation, or a WAL
+        checkpoint for SQLite (see journal.Journal.compact / SqliteStorage).
+        """
+        with self.compact_lock:
+            if not self.journal.running:
+                return
+            started = time.perf_counter()
+            self.journal.compact(self.store, self.exclusive())
+            self.metrics.observe("journal.compact", time.perf_counter() - started)
+            self.profiler.record("persist.compact", started)
+
+    def compaction_loop(self):
+        while self.running:
+            time.sleep(self.compact_interval)
+            if self.running and self.journal.records_since_snapshot:
+                self.compact()
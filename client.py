@@ -1,10 +1,29 @@
 import customtkinter as ctk
 import socket
 import threading
-import random
+import json
 import subprocess
 import sys
 import os
+import math
+import time
+
+from reliability import RequestTracker
+from session_channel import SessionListener
+from multicast import receiver_socket, join_group, leave_group, group_address
+from pattern_index import is_pattern
+from log_pipeline import LogPipeline, LogView
+from protocol import (decode, encode, describe, command_name, pack_batches, PROTOCOL_VERSION, MAX_DATAGRAM,
+                      BATCH_MIN_VERSION, OP_BATCH,
+                      OP_REGISTER, OP_REGISTERED, OP_REGISTER_DENIED, OP_LOGIN, OP_LOGIN_OK,
+                      OP_LOGIN_FAIL, OP_DE_REGISTER, OP_DE_REGISTERED, OP_LIST_ITEM,
+                      OP_ITEM_LISTED, OP_LIST_DENIED, OP_SUBSCRIBE, OP_SUBSCRIBED,
+                      OP_SUBSCRIPTION_DENIED, OP_DE_SUBSCRIBE, OP_AUCTION_ANNOUNCE,
+                      OP_BID, OP_BID_ACCEPTED, OP_BID_REJECTED, OP_SESSION, OP_SESSION_OK,
+                      OP_SESSION_DENIED, OP_SYNC, OP_WINNER, OP_SOLD, OP_NON_OFFER, OP_MCAST_INFO,
+                      OP_MCAST_CONFIG, OP_MCAST_JOIN, OP_MCAST_OK, OP_MCAST_DENIED, OP_AUCTION_SNAPSHOT,
+                      OP_AUCTION_DELTA, OP_RESYNC, OP_RESYNC_DENIED, CHANGED_PRICE, CHANGED_DEADLINE,
+                      CHANGED_CLOSED)
 
 SERVER_IP = "127.0.0.1"
 SERVER_PORT = 5000
@@ -15,7 +34,7 @@ SERVER_PORT = 5000
 class BuyerSubscriptionFrame(ctk.CTkFrame):
     """
     For buyers:
-    - Input to type an item name
+    - Input to type an item name (or several, comma-separated)
     - Subscribe button
     - Scrollable list of subscribed items with Unsubscribe buttons
     """
@@ -41,11 +60,14 @@ class BuyerSubscriptionFrame(ctk.CTkFrame):
         self.refresh_subscribed_list()
 
     def subscribe_item(self):
-        item_name = self.item_name_var.get().strip()
-        if not item_name:
+        item_names = [n.strip() for n in self.item_name_var.get().split(",") if n.strip()]
+        if not item_names:
             self.user_window.add_log("ERROR: Please enter an item name to subscribe.")
             return
-        self.user_window.send_subscribe(item_name)
+        if len(item_names) == 1:
+            self.user_window.send_subscribe(item_names[0])
+        else:
+            self.user_window.send_subscribe_many(item_names)
 
     def add_subscription(self, item_name):
         if item_name not in self.subscribed_items:
@@ -75,14 +97,14 @@ class BuyerSubscriptionFrame(ctk.CTkFrame):
 # ----------------------------------------------------------------------
 class BuyerSubscribedAnnouncementsFrame(ctk.CTkFrame):
     """
-    Shows each AUCTION_ANNOUNCE as a row:
-    RQ# item_id | item_name | description | Price: X | TimeLeft: Y
+    Shows each announced item as one row:
+    RQ# item_id | item_name | description | Price: X | TimeLeft: Y  [amount] [Bid]
     """
     def __init__(self, master, user_window):
         super().__init__(master)
         self.user_window = user_window
 
-        # If we want to update existing items by item_id, store them here
+        # item_id -> (label, [bid controls]) of its row
         self.announced_items = {}
 
         ctk.CTkLabel(self, text="Subscribed Items Announcements:").pack(anchor="w", padx=5, pady=2)
@@ -91,22 +113,47 @@ class BuyerSubscribedAnnouncementsFrame(ctk.CTkFrame):
 
     def update_announcement(self, item_id, item_name, description, current_price, time_left):
         """
-        If the item_id is already displayed, remove or update it.
-        Then create a new row or refresh existing.
+        Shows the latest state of item_id: a known row is updated in place
+        (keeping any amount typed in it) and loses its Bid controls once the
+        auction has closed.
         """
-        # If you want to remove the old row each time:
+        text = (f"RQ# {item_id} | {item_name} | {description} "
+                f"| Price: {current_price} | TimeLeft: {time_left}")
         if item_id in self.announced_items:
-            old_frame = self.announced_items[item_id]
-            old_frame.destroy()
+            label, controls = self.announced_items[item_id]
+            label.configure(text=text)
+            if int(time_left) <= 0:
+                for widget in controls:
+                    widget.destroy()
+                controls.clear()
+            return
 
         row_frame = ctk.CTkFrame(self.list_frame)
         row_frame.pack(fill="x", pady=2)
 
-        text = (f"RQ# {item_id} | {item_name} | {description} "
-                f"| Price: {current_price} | TimeLeft: {time_left}")
-        ctk.CTkLabel(row_frame, text=text).pack(side="left", padx=5)
+        label = ctk.CTkLabel(row_frame, text=text)
+        label.pack(side="left", padx=5)
+
+        controls = []
+        if int(time_left) > 0:
+            amount_var = ctk.StringVar()
+            def bid_callback(item=item_id, var=amount_var):
+                return lambda: self.place_bid(item, var.get().strip())
+            button = ctk.CTkButton(row_frame, text="Bid", width=50, command=bid_callback())
+            button.pack(side="right", padx=5)
+            entry = ctk.CTkEntry(row_frame, textvariable=amount_var, width=70)
+            entry.pack(side="right", padx=5)
+            controls = [button, entry]
+
+        self.announced_items[item_id] = (label, controls)
 
-        self.announced_items[item_id] = row_frame
+    def place_bid(self, item_id, amount):
+        try:
+            float(amount)
+        except ValueError:
+            self.user_window.add_log("ERROR: Enter a numeric bid amount.")
+            return
+        self.user_window.send_bid(item_id, amount)
 
 # ----------------------------------------------------------------------
 # ListItemWindow: pop-up for sellers to list items
@@ -204,6 +251,9 @@ class UserWindow(ctk.CTkToplevel):
         # Log area (read-only)
         self.log_text = ctk.CTkTextbox(main_frame, width=360, height=80, state="disabled")
         self.log_text.pack(pady=5)
+        # add_log is called from the UDP thread too; the view drains on the Tk loop
+        self.logs = LogPipeline()
+        self.log_view = LogView(self.log_text, self.logs, max_lines=200)
 
         if self.role.lower() == "seller":
             # Seller UI
@@ -227,10 +277,7 @@ class UserWindow(ctk.CTkToplevel):
 
     # --- Common functions ---
     def add_log(self, message: str):
-        self.log_text.configure(state="normal")
-        self.log_text.insert("end", message + "\n")
-        self.log_text.see("end")
-        self.log_text.configure(state="disabled")
+        self.logs.push("info", message)
 
     def request_deregister(self):
         self.master_app.send_deregister(self.name, self)
@@ -280,9 +327,15 @@ class UserWindow(ctk.CTkToplevel):
     def send_subscribe(self, item_name):
         self.master_app.send_subscribe(self.name, item_name)
 
+    def send_subscribe_many(self, item_names):
+        self.master_app.send_subscribe_many(self.name, item_names)
+
     def send_de_subscribe(self, item_name):
         self.master_app.send_de_subscribe(self.name, item_name)
 
+    def send_bid(self, item_id, amount):
+        self.master_app.send_bid(self.name, item_id, amount, self)
+
     def add_subscription(self, item_name):
         # add to the subscription frame's list
         if hasattr(self, "subscription_frame"):
@@ -294,8 +347,9 @@ class UserWindow(ctk.CTkToplevel):
 
     def add_subscribed_announcement(self, item_id, item_name, description, current_price, time_left):
         """
-        Called by client when an AUCTION_ANNOUNCE arrives. We forward it
-        to the 'BuyerSubscribedAnnouncementsFrame'.
+        Called by client with an item's latest state (from AUCTION_ANNOUNCE,
+        or snapshots and deltas applied). We forward it to the
+        'BuyerSubscribedAnnouncementsFrame'.
         """
         if hasattr(self, "subscribed_announcements_frame"):
             self.subscribed_announcements_frame.update_announcement(
@@ -322,11 +376,69 @@ class ClientApp(ctk.CTk):
         self.sock.bind((SERVER_IP, 0))
         self.local_udp_port = self.sock.getsockname()[1]
 
-        self.requests = {}      # in-flight requests
+        # Session channel: the server connects to this port for auction
+        # results and SYNC (see session_channel.py)
+        self.session = SessionListener(lambda data: self.receive(data, "TCP"), SERVER_IP)
+        self.local_tcp_port = self.session.port
+
+        # Multicast announcements (see multicast.py): the group layout comes
+        # from MCAST_CONFIG; exact subscriptions join their item's group
+        self.mcast_lock = threading.Lock()
+        self.mcast_status = "off"       # off | requested | on | unavailable
+        self.mcast_config = None        # (base_group, groups, port)
+        self.mcast_sock = None
+        self.mcast_groups = {}          # group -> number of (buyer, item) joins using it
+        self.mcast_names = {}           # item_name -> { buyer_name, ... } joined
+        self.mcast_pending = []         # (buyer_name, item_name) waiting for MCAST_CONFIG
+
+        # Delta announcements (see protocol.py): every announced item's state
+        # as of its latest version, and the items with a RESYNC in flight
+        self.announce_lock = threading.Lock()
+        self.announced = {}     # item_id -> {"version", "item_name", "description", "price", "deadline"}
+        self.resyncing = set()
+
+        # Log records from the UDP and retransmit threads, shown by log_view
+        self.logs = LogPipeline()
+
+        # In-flight requests: ids, retransmission and give-up (see reliability.py)
+        self.tracker = RequestTracker(self.transmit_request)
+        self.tracker.start()
         self.user_windows = {}  # name -> UserWindow
 
+        # Wire protocol version in use (see protocol.py); negotiated on REGISTER/LOGIN
+        self.wire_version = PROTOCOL_VERSION
+
+        # opcode -> handler(version, request_info, fields)
+        self.response_handlers = {
+            OP_REGISTERED: self.on_registered,
+            OP_REGISTER_DENIED: self.on_denied,
+            OP_LOGIN_OK: self.on_login_ok,
+            OP_LOGIN_FAIL: self.on_denied,
+            OP_DE_REGISTERED: self.on_deregistered,
+            OP_ITEM_LISTED: self.on_item_listed,
+            OP_LIST_DENIED: self.on_list_denied,
+            OP_SUBSCRIBED: self.on_subscribed,
+            OP_SUBSCRIPTION_DENIED: self.on_subscription_denied,
+            OP_AUCTION_ANNOUNCE: self.on_auction_announce,
+            OP_AUCTION_SNAPSHOT: self.on_auction_snapshot,
+            OP_AUCTION_DELTA: self.on_auction_delta,
+            OP_RESYNC_DENIED: self.on_resync_denied,
+            OP_BID_ACCEPTED: self.on_bid_accepted,
+            OP_BID_REJECTED: self.on_bid_rejected,
+            OP_SESSION_OK: self.on_session_ok,
+            OP_SESSION_DENIED: self.on_session_denied,
+            OP_SYNC: self.on_sync,
+            OP_WINNER: self.on_winner,
+            OP_SOLD: self.on_sold,
+            OP_NON_OFFER: self.on_non_offer,
+            OP_MCAST_CONFIG: self.on_mcast_config,
+            OP_MCAST_OK: self.on_mcast_ok,
+            OP_MCAST_DENIED: self.on_mcast_denied,
+        }
+
         self.listening = True
         threading.Thread(target=self.listen_server, daemon=True).start()
+        self.session.start()
 
         main_frame = ctk.CTkFrame(self)
         main_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -352,37 +464,69 @@ class ClientApp(ctk.CTk):
 
         self.log_text = ctk.CTkTextbox(main_frame, width=450, height=80, state="disabled")
         self.log_text.pack(pady=5)
+        self.log_view = LogView(self.log_text, self.logs)
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def on_close(self):
         self.listening = False
+        self.tracker.stop()
         self.sock.close()
+        self.session.close()
+        if self.mcast_sock:
+            self.mcast_sock.close()
         for w in list(self.user_windows.values()):
             w.close_window()
         if self.server_process:
             self.server_process.terminate()
         self.destroy()
 
-    def add_log(self, msg: str):
-        self.log_text.configure(state="normal")
-        self.log_text.insert("end", msg + "\n")
-        self.log_text.see("end")
-        self.log_text.configure(state="disabled")
+    def add_log(self, msg: str, kind="info"):
+        self.logs.push(kind, msg)
 
     # ----- Sending (UDP) -----
+    def send_command(self, opcode, rq, *fields):
+        data = encode(self.wire_version, opcode, rq, fields)
+        self.sock.sendto(data, (SERVER_IP, SERVER_PORT))
+
+    def transmit_request(self, opcode, rq, fields):
+        self.send_command(opcode, rq, *fields)
+
+    def track(self, opcode, info, *fields, transmit=True):
+        """
+        Sends a command through the request tracker; the reply (or the
+        give-up after retries) comes back through on_request_done.
+        """
+        return self.tracker.submit(opcode, fields, info, self.on_request_done, transmit)
+
+    def send_batch(self, requests):
+        """
+        Sends the first copy of tracked requests (submitted with
+        transmit=False) packed into BATCH datagrams when the negotiated
+        protocol supports it, else one by one. Requests still waiting for a
+        window slot are sent by the tracker when admitted.
+        """
+        frames = [encode(self.wire_version, r.opcode, r.rq, r.fields) for r in requests if r.rq is not None]
+        if self.wire_version >= BATCH_MIN_VERSION and len(frames) > 1:
+            # The envelope itself is untracked; each inner command is
+            datagrams = pack_batches(self.wire_version, 0, frames)
+        else:
+            datagrams = frames
+        for data in datagrams:
+            self.sock.sendto(data, (SERVER_IP, SERVER_PORT))
+
     def register_user(self):
         name = self.name_var.get().strip()
         role = self.role_var.get().strip()
         if not name:
             self.add_log("ERROR: Name cannot be empty.")
             return
-        rq = str(random.randint(1000, 9999))
-        tcp_port = str(random.randint(40001, 50000))
-        msg = f"REGISTER {rq} {name} {role} {SERVER_IP} {self.local_udp_port} {tcp_port}"
-        self.sock.sendto(msg.encode(), (SERVER_IP, SERVER_PORT))
-        self.requests[rq] = {"type": "register", "name": name, "role": role, "tcp_port": tcp_port}
-        self.add_log(f"(UDP) Sent REGISTER (RQ={rq}) for {name} ({role}).")
+        tcp_port = str(self.local_tcp_port)
+        # REGISTER/LOGIN offer our highest protocol version; the reply settles it
+        self.wire_version = PROTOCOL_VERSION
+        request = self.track(OP_REGISTER, {"type": "register", "name": name, "role": role, "tcp_port": tcp_port},
+                             name, role, SERVER_IP, self.local_udp_port, tcp_port)
+        self.add_log(f"(UDP) Sent REGISTER (RQ={request.rq}) for {name} ({role}).")
 
     def login_user(self):
         name = self.name_var.get().strip()
@@ -390,160 +534,488 @@ class ClientApp(ctk.CTk):
         if not name:
             self.add_log("ERROR: Name cannot be empty.")
             return
-        rq = str(random.randint(1000, 9999))
-        msg = f"LOGIN {rq} {name} {role}"
-        self.sock.sendto(msg.encode(), (SERVER_IP, SERVER_PORT))
-        self.requests[rq] = {"type": "login", "name": name, "role": role}
-        self.add_log(f"(UDP) Sent LOGIN (RQ={rq}) for {name} ({role}).")
+        self.wire_version = PROTOCOL_VERSION
+        request = self.track(OP_LOGIN, {"type": "login", "name": name, "role": role}, name, role)
+        self.add_log(f"(UDP) Sent LOGIN (RQ={request.rq}) for {name} ({role}).")
 
     def send_deregister(self, name, user_window):
-        rq = str(random.randint(1000, 9999))
-        msg = f"DE-REGISTER {rq} {name}"
-        self.sock.sendto(msg.encode(), (SERVER_IP, SERVER_PORT))
-        self.requests[rq] = {"type": "deregister", "name": name, "window": user_window}
-        self.add_log(f"(UDP) Sent DE-REGISTER (RQ={rq}) for {name}.")
+        request = self.track(OP_DE_REGISTER, {"type": "deregister", "name": name, "window": user_window}, name)
+        self.add_log(f"(UDP) Sent DE-REGISTER (RQ={request.rq}) for {name}.")
 
     def send_list_item(self, user_name, item_name, item_desc, start_price, duration, user_window):
-        rq = str(random.randint(1000, 9999))
-        msg = f"LIST_ITEM {rq} {user_name} {item_name} {item_desc} {start_price} {duration}"
-        self.sock.sendto(msg.encode(), (SERVER_IP, SERVER_PORT))
-        self.requests[rq] = {
+        request = self.track(OP_LIST_ITEM, {
             "type": "list_item",
             "user_name": user_name,
             "item_name": item_name,
             "start_price": start_price,
             "duration": duration,
             "window": user_window
-        }
-        self.add_log(f"(UDP) Sent LIST_ITEM (RQ={rq}) for item '{item_name}'.")
+        }, user_name, item_name, item_desc, start_price, duration)
+        self.add_log(f"(UDP) Sent LIST_ITEM (RQ={request.rq}) for item '{item_name}'.")
 
     def send_subscribe(self, buyer_name, item_name):
-        rq = str(random.randint(1000, 9999))
-        msg = f"SUBSCRIBE {rq} {buyer_name} {item_name}"
-        self.sock.sendto(msg.encode(), (SERVER_IP, SERVER_PORT))
-        self.requests[rq] = {
+        request = self.track(OP_SUBSCRIBE, {
             "type": "subscribe",
             "buyer_name": buyer_name,
             "item_name": item_name
-        }
-        self.add_log(f"(UDP) Sent SUBSCRIBE (RQ={rq}) for {buyer_name} -> {item_name}.")
+        }, buyer_name, item_name)
+        self.add_log(f"(UDP) Sent SUBSCRIBE (RQ={request.rq}) for {buyer_name} -> {item_name}.")
+
+    def send_subscribe_many(self, buyer_name, item_names):
+        requests = []
+        for item_name in item_names:
+            requests.append(self.track(OP_SUBSCRIBE, {
+                "type": "subscribe",
+                "buyer_name": buyer_name,
+                "item_name": item_name
+            }, buyer_name, item_name, transmit=False))
+        self.send_batch(requests)
+        self.add_log(f"(UDP) Sent {len(requests)} SUBSCRIBE commands for {buyer_name} in one batch.")
 
     def send_de_subscribe(self, buyer_name, item_name):
-        rq = str(random.randint(1000, 9999))
-        msg = f"DE-SUBSCRIBE {rq} {buyer_name} {item_name}"
-        self.sock.sendto(msg.encode(), (SERVER_IP, SERVER_PORT))
-        self.requests[rq] = {
+        request = self.track(OP_DE_SUBSCRIBE, {
             "type": "unsubscribe",
             "buyer_name": buyer_name,
             "item_name": item_name
-        }
-        self.add_log(f"(UDP) Sent DE-SUBSCRIBE (RQ={rq}) for {buyer_name} -> {item_name}.")
+        }, buyer_name, item_name)
+        self.add_log(f"(UDP) Sent DE-SUBSCRIBE (RQ={request.rq}) for {buyer_name} -> {item_name}.")
+
+    def send_bid(self, buyer_name, item_id, amount, user_window):
+        request = self.track(OP_BID, {
+            "type": "bid",
+            "item_id": item_id,
+            "amount": amount,
+            "window": user_window
+        }, buyer_name, item_id, amount)
+        self.add_log(f"(UDP) Sent BID (RQ={request.rq}) for {buyer_name} -> {item_id} at {amount}.")
 
-    # ----- Receiving (UDP) -----
+    # ----- Receiving (UDP and session channel) -----
     def listen_server(self):
         while self.listening:
             try:
-                data, addr = self.sock.recvfrom(2048)
-                response = data.decode()
-                self.handle_server_response(response)
-            except:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
                 break
+            self.receive(data)
 
-    def handle_server_response(self, response: str):
-        self.add_log(f"(UDP) Received: {response}")
-        parts = response.split()
-        if len(parts) < 2:
+    def receive(self, data, channel="UDP"):
+        # A handler bug must not end a receive loop: drop this message only
+        try:
+            self.handle_server_response(data, channel)
+        except Exception as e:
+            self.add_log(f"({channel}) Dropped server message, handler failed: {e!r}", "error")
+
+    def handle_server_response(self, data: bytes, channel="UDP"):
+        message = decode(data)
+        if message is None:
+            self.add_log(f"({channel}) Received unreadable message ({len(data)} bytes)")
+            return
+        version, opcode, rq, fields = message
+        self.add_log(f"({channel}) Received: {describe(version, opcode, rq, fields)}", command_name(opcode))
+        if opcode == OP_BATCH:
+            # Multi-status reply or packed announcements: handle each message
+            for frame in fields:
+                self.handle_server_response(frame, channel)
+            return
+        if rq:
+            # A reply: the tracker hands it to on_request_done, once
+            self.tracker.complete(rq, (version, opcode, fields))
+        else:
+            self.dispatch(version, opcode, None, fields)
+
+    def on_request_done(self, request, reply):
+        if reply is None:
+            message = (f"(UDP) No reply to {command_name(request.opcode)} (RQ={request.rq}) "
+                       f"after {request.attempts} attempts; giving up.")
+            self.add_log(message)
+            user_window = request.info.get("window")
+            if user_window:
+                user_window.add_log(message)
+            if request.info.get("type") in ("mcast_info", "mcast_join"):
+                # Unanswered: fall back to unicast as if refused
+                self.on_mcast_denied(None, request.info, ["NoReply"])
+            elif request.info.get("type") == "resync":
+                # The next gap asks again
+                with self.announce_lock:
+                    self.resyncing.discard(request.info["item_id"])
             return
+        version, opcode, fields = reply
+        self.dispatch(version, opcode, request.info, fields)
 
-        cmd = parts[0].upper()
-        rq = parts[1]
-        request_info = self.requests.pop(rq, None)
-
-        if cmd == "REGISTERED" and request_info:
-            if request_info["type"] == "register":
-                name = request_info["name"]
-                role = request_info["role"]
-                tcp_port = request_info["tcp_port"]
-                self.open_user_window(name, role, tcp_port)
-
-        elif cmd == "REGISTER-DENIED":
-            pass
-
-        elif cmd == "LOGIN_OK" and request_info:
-            if request_info["type"] == "login":
-                name = request_info["name"]
-                role = request_info["role"]
-                tcp_port = str(random.randint(40001, 50000))
-                self.open_user_window(name, role, tcp_port)
-
-        elif cmd == "LOGIN_FAIL":
-            pass
-
-        elif cmd == "DE-REGISTERED" and request_info:
-            if request_info["type"] == "deregister":
-                name = request_info["name"]
-                user_window = request_info["window"]
-                user_window.add_log("De-registered successfully. Closing window.")
-                user_window.close_window()
-                if name in self.user_windows:
-                    del self.user_windows[name]
-
-        elif cmd == "ITEM_LISTED" and request_info:
-            if request_info["type"] == "list_item":
-                item_name = request_info["item_name"]
-                start_price = request_info["start_price"]
-                duration = request_info["duration"]
-                user_window = request_info["window"]
-                user_window.add_log(f"Item '{item_name}' listed successfully.")
-                user_window.add_my_item(item_name, start_price, duration)
-
-        elif cmd == "LIST-DENIED" and request_info:
-            if request_info["type"] == "list_item":
-                reason = " ".join(parts[2:]) if len(parts) > 2 else "UnknownReason"
-                user_window = request_info["window"]
-                user_window.add_log(f"Item listing denied: {reason}")
-
-        elif cmd == "SUBSCRIBED" and request_info:
-            # Could be subscribe or unsubscribe
-            if request_info["type"] == "subscribe":
-                buyer_name = request_info["buyer_name"]
-                item_name = request_info["item_name"]
-                user_window = self.user_windows.get(buyer_name)
-                if user_window:
-                    user_window.add_log(f"Subscribed to {item_name} successfully.")
-                    user_window.add_subscription(item_name)
-            elif request_info["type"] == "unsubscribe":
-                buyer_name = request_info["buyer_name"]
-                item_name = request_info["item_name"]
-                user_window = self.user_windows.get(buyer_name)
-                if user_window:
-                    user_window.add_log(f"De-subscribed from {item_name} successfully.")
-                    user_window.remove_subscription(item_name)
-
-        elif cmd == "SUBSCRIPTION-DENIED" and request_info:
-            reason = " ".join(parts[2:]) if len(parts) > 2 else "UnknownReason"
-            if request_info["type"] in ["subscribe", "unsubscribe"]:
-                buyer_name = request_info["buyer_name"]
-                item_name = request_info["item_name"]
-                user_window = self.user_windows.get(buyer_name)
-                if user_window:
-                    user_window.add_log(f"Subscription command denied: {reason}")
-
-        elif cmd == "AUCTION_ANNOUNCE":
-            # e.g. AUCTION_ANNOUNCE <item_id> <item_name> <description> <current_price> <time_left>
-            if len(parts) < 6:
+    def listen_multicast(self):
+        while self.listening:
+            try:
+                data, addr = self.mcast_sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                break
+            try:
+                self.handle_multicast(data)
+            except Exception as e:
+                self.add_log(f"(MCAST) Dropped group message, handler failed: {e!r}", "error")
+
+    def handle_multicast(self, data):
+        # A group carries every item name hashed onto it; keep the joined ones
+        message = decode(data)
+        if message is None:
+            return
+        version, opcode, rq, fields = message
+        if opcode == OP_BATCH:
+            for frame in fields:
+                self.handle_multicast(frame)
+            return
+        if opcode == OP_AUCTION_SNAPSHOT:
+            item_name = fields[2]
+        elif opcode == OP_AUCTION_DELTA:
+            item_name = fields[1]
+        else:
+            return
+        with self.mcast_lock:
+            buyers = list(self.mcast_names.get(item_name, ()))
+        if not buyers:
+            return
+        self.add_log(f"(MCAST) Received: {describe(version, opcode, rq, fields)}", command_name(opcode))
+        if opcode == OP_AUCTION_SNAPSHOT:
+            self.apply_snapshot(fields, buyers)
+        else:
+            self.apply_delta(fields, buyers)
+
+    def dispatch(self, version, opcode, request_info, fields):
+        handler = self.response_handlers.get(opcode)
+        if handler is None:
+            return
+        handler(version, request_info, fields)
+
+    def on_registered(self, version, request_info, fields):
+        if request_info and request_info["type"] == "register":
+            self.wire_version = version
+            name = request_info["name"]
+            role = request_info["role"]
+            tcp_port = request_info["tcp_port"]
+            self.open_user_window(name, role, tcp_port)
+            if role.lower() == "buyer":
+                self.request_multicast()
+
+    def on_login_ok(self, version, request_info, fields):
+        if request_info and request_info["type"] == "login":
+            self.wire_version = version
+            name = request_info["name"]
+            role = request_info["role"]
+            self.open_user_window(name, role, self.local_tcp_port)
+            if role.lower() == "buyer":
+                # LOGIN dropped this buyer's joins on the server; SYNC re-joins them
+                self.leave_multicast_all(name)
+                self.request_multicast()
+            # Tell the server where this client's session channel listens now
+            request = self.track(OP_SESSION, {"type": "session", "name": name}, name, self.local_tcp_port)
+            self.add_log(f"(UDP) Sent SESSION (RQ={request.rq}) for {name} on TCP port {self.local_tcp_port}.")
+
+    def on_denied(self, version, request_info, fields):
+        pass
+
+    def on_deregistered(self, version, request_info, fields):
+        if request_info and request_info["type"] == "deregister":
+            name = request_info["name"]
+            user_window = request_info["window"]
+            user_window.add_log("De-registered successfully. Closing window.")
+            user_window.close_window()
+            if name in self.user_windows:
+                del self.user_windows[name]
+            self.leave_multicast_all(name)
+
+    def on_item_listed(self, version, request_info, fields):
+        if request_info and request_info["type"] == "list_item":
+            item_name = request_info["item_name"]
+            start_price = request_info["start_price"]
+            duration = request_info["duration"]
+            user_window = request_info["window"]
+            user_window.add_log(f"Item '{item_name}' listed successfully.")
+            user_window.add_my_item(item_name, start_price, duration)
+
+    def on_list_denied(self, version, request_info, fields):
+        if request_info and request_info["type"] == "list_item":
+            reason = fields[0] or "UnknownReason"
+            user_window = request_info["window"]
+            user_window.add_log(f"Item listing denied: {reason}")
+
+    def on_subscribed(self, version, request_info, fields):
+        if not request_info:
+            return
+        # Could be subscribe or unsubscribe
+        if request_info["type"] == "subscribe":
+            buyer_name = request_info["buyer_name"]
+            item_name = request_info["item_name"]
+            user_window = self.user_windows.get(buyer_name)
+            if user_window:
+                user_window.add_log(f"Subscribed to {item_name} successfully.")
+                user_window.add_subscription(item_name)
+            self.join_multicast(buyer_name, item_name)
+        elif request_info["type"] == "unsubscribe":
+            buyer_name = request_info["buyer_name"]
+            item_name = request_info["item_name"]
+            user_window = self.user_windows.get(buyer_name)
+            if user_window:
+                user_window.add_log(f"De-subscribed from {item_name} successfully.")
+                user_window.remove_subscription(item_name)
+            self.leave_multicast(buyer_name, item_name)
+
+    def on_subscription_denied(self, version, request_info, fields):
+        if request_info and request_info["type"] in ["subscribe", "unsubscribe"]:
+            reason = fields[0] or "UnknownReason"
+            buyer_name = request_info["buyer_name"]
+            user_window = self.user_windows.get(buyer_name)
+            if user_window:
+                user_window.add_log(f"Subscription command denied: {reason}")
+
+    def on_auction_announce(self, version, request_info, fields):
+        # fields: item_id, item_name, description, current_price, time_left
+        self.show_item(*fields)
+
+    def on_auction_snapshot(self, version, request_info, fields):
+        # Unsolicited, or the reply to our RESYNC
+        buyers = request_info["buyers"] if request_info and request_info["type"] == "resync" else None
+        self.apply_snapshot(fields, buyers)
+
+    def on_auction_delta(self, version, request_info, fields):
+        self.apply_delta(fields)
+
+    def on_resync_denied(self, version, request_info, fields):
+        if not request_info or request_info["type"] != "resync":
+            return
+        item_id = request_info["item_id"]
+        with self.announce_lock:
+            self.resyncing.discard(item_id)
+            # NoSuchItem: the auction closed and its last delta was lost
+            known = self.announced.pop(item_id, None)
+        if known is not None and fields[0] == "NoSuchItem":
+            self.show_item(item_id, known["item_name"], known["description"], known["price"], 0,
+                           request_info["buyers"])
+
+    def on_bid_accepted(self, version, request_info, fields):
+        if request_info and request_info["type"] == "bid":
+            item_id, price, time_left = fields
+            request_info["window"].add_log(f"Bid on {item_id} accepted: you lead at {price} "
+                                           f"({time_left}s left).")
+
+    def on_bid_rejected(self, version, request_info, fields):
+        if request_info and request_info["type"] == "bid":
+            reason, price = fields
+            request_info["window"].add_log(f"Bid on {request_info['item_id']} rejected: {reason} "
+                                           f"(current price {price}).")
+
+    def on_session_ok(self, version, request_info, fields):
+        if request_info and request_info["type"] == "session":
+            user_window = self.user_windows.get(request_info["name"])
+            if user_window:
+                user_window.add_log(f"Session channel open on TCP port {self.local_tcp_port}.")
+
+    def on_session_denied(self, version, request_info, fields):
+        if request_info and request_info["type"] == "session":
+            user_window = self.user_windows.get(request_info["name"])
+            if user_window:
+                user_window.add_log(f"Session channel refused: {fields[0]}")
+
+    def on_sync(self, version, request_info, fields):
+        # fields: name, {"subscriptions", "items", "listings"} JSON
+        name, state = fields
+        user_window = self.user_windows.get(name)
+        if not user_window:
+            return
+        try:
+            state = json.loads(state)
+        except ValueError:
+            return
+        for item_name in state.get("subscriptions", []):
+            user_window.add_subscription(item_name)
+            self.join_multicast(name, item_name)
+        for item_id, item_name, description, price, time_left, item_version in state.get("items", []):
+            self.apply_snapshot([item_id, item_version, item_name, description, price, time_left], [name])
+        if user_window.role.lower() == "seller":
+            for _, item_name, _, price, time_left in state.get("listings", []):
+                user_window.add_my_item(item_name, price, time_left)
+        user_window.add_log(f"Synced {len(state.get('subscriptions', []))} subscriptions, "
+                            f"{len(state.get('items', []))} items, {len(state.get('listings', []))} listings.")
+
+    def on_winner(self, version, request_info, fields):
+        buyer_name, item_id, item_name, price, seller_name = fields
+        user_window = self.user_windows.get(buyer_name)
+        if user_window:
+            user_window.add_log(f"You won {item_name} ({item_id}) at {price} from {seller_name}.")
+
+    def on_sold(self, version, request_info, fields):
+        seller_name, item_id, item_name, price, buyer_name = fields
+        user_window = self.user_windows.get(seller_name)
+        if user_window:
+            user_window.add_log(f"Sold {item_name} ({item_id}) to {buyer_name} at {price}.")
+
+    def on_non_offer(self, version, request_info, fields):
+        seller_name, item_id, item_name = fields
+        user_window = self.user_windows.get(seller_name)
+        if user_window:
+            user_window.add_log(f"Auction for {item_name} ({item_id}) closed without bids.")
+
+    # ----- Announcements (snapshots and deltas) -----
+    def show_item(self, item_id, item_name, description, price, time_left, buyers=None):
+        # buyers None: every buyer window (they share this client's port)
+        if buyers is None:
+            windows = [uw for uw in self.user_windows.values() if uw.role.lower() == "buyer"]
+        else:
+            windows = [self.user_windows.get(name) for name in buyers]
+        for uw in windows:
+            if uw:
+                uw.add_subscribed_announcement(item_id, item_name, description, price, time_left)
+
+    def apply_snapshot(self, fields, buyers=None):
+        """
+        Replaces what we know of an item (a snapshot is always complete,
+        and after a server restart versions start again from 1).
+        """
+        item_id, item_version, item_name, description, price, time_left = fields
+        with self.announce_lock:
+            self.resyncing.discard(item_id)
+            if int(time_left) > 0:
+                self.announced[item_id] = {"version": int(item_version), "item_name": item_name,
+                                           "description": description, "price": price,
+                                           "deadline": time.time() + int(time_left)}
+            else:
+                self.announced.pop(item_id, None)
+        self.show_item(item_id, item_name, description, price, time_left, buyers)
+
+    def apply_delta(self, fields, buyers=None):
+        """
+        Applies an AUCTION_DELTA on top of the previous version. A missed
+        version, or an item we hold no snapshot of, is fetched with RESYNC.
+        """
+        item_id, item_name, item_version, changed, price, time_left = fields
+        item_version, changed = int(item_version), int(changed)
+        with self.announce_lock:
+            known = self.announced.get(item_id)
+            if known is not None and item_version <= known["version"]:
+                # A repeat, or a keepalive confirming what we have
                 return
-            item_id = parts[1]
-            item_name = parts[2]
-            description = parts[3]
-            current_price = parts[4]
-            time_left = parts[5]
-
-            # Typically the server sends this only to the correct buyer,
-            # but we can loop over all buyers if needed:
-            for uw in self.user_windows.values():
-                if uw.role.lower() == "buyer":
-                    uw.add_subscribed_announcement(item_id, item_name, description, current_price, time_left)
+            gap = known is None or not changed or item_version != known["version"] + 1
+            if not gap:
+                known["version"] = item_version
+                if changed & CHANGED_PRICE:
+                    known["price"] = price
+                if changed & CHANGED_DEADLINE:
+                    known["deadline"] = time.time() + int(time_left)
+                if changed & CHANGED_CLOSED:
+                    del self.announced[item_id]
+                    time_left = 0
+                else:
+                    time_left = max(0, math.ceil(known["deadline"] - time.time()))
+        if gap:
+            self.request_resync(item_id, buyers)
+            return
+        self.show_item(item_id, known["item_name"], known["description"], known["price"], time_left, buyers)
+
+    def request_resync(self, item_id, buyers=None):
+        if buyers is None:
+            buyers = [name for name, uw in self.user_windows.items() if uw.role.lower() == "buyer"]
+        with self.announce_lock:
+            if not buyers or item_id in self.resyncing:
+                return
+            self.resyncing.add(item_id)
+        request = self.track(OP_RESYNC, {"type": "resync", "item_id": item_id, "buyers": buyers},
+                             buyers[0], item_id)
+        self.add_log(f"(UDP) Sent RESYNC (RQ={request.rq}) for {item_id}: missed an update.")
+
+    # ----- Multicast groups -----
+    def request_multicast(self):
+        with self.mcast_lock:
+            if self.mcast_status != "off":
+                return
+            self.mcast_status = "requested"
+        self.track(OP_MCAST_INFO, {"type": "mcast_info"})
+
+    def on_mcast_config(self, version, request_info, fields):
+        base, groups, port = fields
+        try:
+            sock = receiver_socket(int(port))
+        except OSError as e:
+            self.add_log(f"(MCAST) Cannot listen on port {port} ({e}); announcements stay unicast.")
+            with self.mcast_lock:
+                self.mcast_status = "unavailable"
+                self.mcast_pending = []
+            return
+        with self.mcast_lock:
+            self.mcast_config = (base, int(groups), int(port))
+            self.mcast_sock = sock
+            self.mcast_status = "on"
+            pending, self.mcast_pending = self.mcast_pending, []
+        threading.Thread(target=self.listen_multicast, daemon=True).start()
+        self.add_log(f"(MCAST) Announcements via {groups} groups from {base}, port {port}.")
+        for buyer_name, item_name in pending:
+            self.join_multicast(buyer_name, item_name)
+
+    def join_multicast(self, buyer_name, item_name):
+        """
+        Joins item_name's group, then asks the server (MCAST_JOIN) to stop
+        unicasting it to buyer_name. Patterns, and any failure, stay unicast.
+        """
+        if is_pattern(item_name):
+            return
+        with self.mcast_lock:
+            if self.mcast_status in ("off", "requested"):
+                self.mcast_pending.append((buyer_name, item_name))
+                return
+            if self.mcast_status != "on" or buyer_name in self.mcast_names.get(item_name, ()):
+                return
+            base, groups, _ = self.mcast_config
+            group = group_address(item_name, base, groups)
+            if not self.mcast_groups.get(group):
+                try:
+                    join_group(self.mcast_sock, group, self.sock.getsockname()[0])
+                except OSError as e:
+                    self.add_log(f"(MCAST) Cannot join {group} ({e}); {item_name} stays unicast.")
+                    return
+            self.mcast_groups[group] = self.mcast_groups.get(group, 0) + 1
+            self.mcast_names.setdefault(item_name, set()).add(buyer_name)
+        self.track(OP_MCAST_JOIN, {"type": "mcast_join", "buyer_name": buyer_name, "item_name": item_name},
+                   buyer_name, item_name)
+
+    def leave_multicast(self, buyer_name, item_name):
+        with self.mcast_lock:
+            buyers = self.mcast_names.get(item_name)
+            if not buyers or buyer_name not in buyers:
+                return
+            buyers.discard(buyer_name)
+            if not buyers:
+                del self.mcast_names[item_name]
+            base, groups, _ = self.mcast_config
+            group = group_address(item_name, base, groups)
+            self.mcast_groups[group] -= 1
+            if not self.mcast_groups[group]:
+                del self.mcast_groups[group]
+                try:
+                    leave_group(self.mcast_sock, group, self.sock.getsockname()[0])
+                except OSError:
+                    pass
+
+    def leave_multicast_all(self, buyer_name):
+        with self.mcast_lock:
+            names = [name for name, buyers in self.mcast_names.items() if buyer_name in buyers]
+        for item_name in names:
+            self.leave_multicast(buyer_name, item_name)
+
+    def on_mcast_ok(self, version, request_info, fields):
+        if request_info and request_info["type"] == "mcast_join":
+            user_window = self.user_windows.get(request_info["buyer_name"])
+            if user_window:
+                user_window.add_log(f"Announcements for {request_info['item_name']} now arrive by multicast.")
+
+    def on_mcast_denied(self, version, request_info, fields):
+        if not request_info:
+            return
+        reason = fields[0]
+        if request_info["type"] == "mcast_info":
+            with self.mcast_lock:
+                self.mcast_status = "unavailable"
+                self.mcast_pending = []
+            self.add_log(f"(MCAST) Multicast not used ({reason}); announcements stay unicast.")
+        elif request_info["type"] == "mcast_join":
+            # The server keeps unicasting this item, so the group is not needed
+            self.leave_multicast(request_info["buyer_name"], request_info["item_name"])
 
     def open_user_window(self, name, role, tcp_port):
         # If a window for this user already exists, close it
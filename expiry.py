@@ -0,0 +1,78 @@
+import heapq
+import math
+import threading
+import time
+
+def time_left(item, now=None):
+    """
+    Whole seconds until item.end_time, never negative.
+    """
+    if now is None:
+        now = time.time()
+    return max(0, math.ceil(item.end_time - now))
+
+# ----------------------------
+# ExpiryScheduler
+# ----------------------------
+class ExpiryScheduler:
+    """
+    Min-heap of (deadline, key). The expiry thread sleeps until the earliest
+    deadline instead of ticking every second, so the work done per wakeup is
+    proportional to the number of auctions actually closing.
+
+    Entries are never removed in place: if a deadline moves, schedule the key
+    again and let the owner ignore stale pops (compare against its own
+    end_time).
+
+    Event-loop owners can set on_earliest(deadline) to re-arm a timer
+    instead of parking a thread in wait_due().
+    """
+    def __init__(self):
+        self.heap = []
+        self.cond = threading.Condition()
+        self.on_earliest = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, key, deadline):
+        with self.cond:
+            heapq.heappush(self.heap, (deadline, key))
+            # Only a new earliest deadline changes how long the waiter sleeps
+            if self.heap[0][1] == key:
+                self.cond.notify()
+                if self.on_earliest is not None:
+                    self.on_earliest(deadline)
+
+    def pop_due(self, now=None):
+        if now is None:
+            now = time.time()
+        due = []
+        with self.cond:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[1])
+        return due
+
+    def wait_due(self, max_wait=None):
+        """
+        Blocks until the earliest deadline has passed (or max_wait elapses,
+        or wake() is called) and returns the keys that are due.
+        """
+        with self.cond:
+            if self.heap:
+                delay = self.heap[0][0] - time.time()
+                if max_wait is not None:
+                    delay = min(delay, max_wait)
+            else:
+                delay = max_wait
+            if delay is None or delay > 0:
+                self.cond.wait(delay)
+        return self.pop_due()
+
+    def next_deadline(self):
+        with self.cond:
+            return self.heap[0][0] if self.heap else None
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
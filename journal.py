@@ -0,0 +1,278 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+from records import User, Item, Subscription, to_json
+from snapshot import SnapshotError, SnapshotReader, write_snapshot, read_json_snapshot
+
+JOURNAL_FILE = "auction.journal"
+SNAPSHOT_FILE = "auction_snapshot.bin"
+
+FSYNC_MODES = ("always", "interval", "never")
+STORAGE_BACKENDS = ("journal", "sqlite")
+
+# ----------------------------
+# Replay
+# ----------------------------
+def apply_record(store, record):
+    """
+    Re-applies one journal record to an AuctionStore.
+    """
+    op = record["op"]
+    if op == "register":
+        store.add_user(User.from_dict(record["user"]))
+    elif op == "deregister":
+        store.remove_user(record["name"])
+    elif op == "list_item":
+        store.add_item(Item.from_dict(record["item"]))
+    elif op == "expire":
+        store.remove_item(record["item_id"])
+    elif op == "bid":
+        item = store.get_item(record["item_id"])
+        if item is not None:
+            store.record_bid(item, record["price"], record["bidder"], record["end_time"])
+    elif op == "subscribe":
+        store.add_subscription(Subscription.from_dict(record["sub"]))
+    elif op == "de_subscribe":
+        store.remove_subscription(record["buyer_name"], record["item_name"])
+
+def read_records(path):
+    """
+    Returns (records, valid_length) for a journal file. A torn last line
+    (crash mid-append) ends the replay instead of failing it; valid_length
+    is the byte offset just past the last intact record. A bad line with
+    records after it is not a crash artifact: it raises SnapshotError rather
+    than drop the records that follow.
+    """
+    records = []
+    valid_length = 0
+    if not os.path.exists(path):
+        return records, valid_length
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("no line end")
+                records.append(json.loads(line))
+            except ValueError as e:
+                if f.read(1):
+                    raise SnapshotError(f"{path}: corrupt record at byte {valid_length} ({e})") from e
+                break
+            valid_length += len(line)
+    return records, valid_length
+
+# ----------------------------
+# Storage backends
+# ----------------------------
+# The engine persists through one of these. Both provide:
+#   recover(store) -> bool, open(sync_thread), close(), append(op, **fields),
+#   sync(), compact(store, lock), running, records_since_snapshot,
+#   fsync_mode, fsync_interval, metrics, profiler
+def open_storage(backend="journal", journal_path=JOURNAL_FILE, snapshot_path=SNAPSHOT_FILE,
+                 db_path=None, **kwargs):
+    if backend == "sqlite":
+        from sqlite_storage import SqliteStorage, DB_FILE
+        return SqliteStorage(db_path or DB_FILE, **kwargs)
+    if backend != "journal":
+        raise ValueError(f"backend must be one of {STORAGE_BACKENDS}")
+    return Journal(journal_path, snapshot_path, **kwargs)
+
+# ----------------------------
+# Journal
+# ----------------------------
+class Journal:
+    """
+    Append-only write-ahead log of state changes plus periodic snapshots.
+
+    Each mutation appends one JSON line with a sequence number. Durability
+    is controlled by fsync_mode:
+    - "always":   flush and fsync on every append
+    - "interval": group commit, one flush+fsync per fsync_interval seconds
+    - "never":    leave it to the OS
+
+    rotate() + write_snapshot() compact the log into the (binary, see
+    snapshot.py) snapshot file; recover() loads the snapshot and replays
+    whatever journal follows it.
+    """
+    def __init__(self, path=JOURNAL_FILE, snapshot_path=SNAPSHOT_FILE,
+                 fsync_mode="interval", fsync_interval=0.05):
+        if fsync_mode not in FSYNC_MODES:
+            raise ValueError(f"fsync_mode must be one of {FSYNC_MODES}")
+        self.path = path
+        self.old_path = path + ".old"
+        self.snapshot_path = snapshot_path
+        # Snapshots written before the binary format, converted on first compaction
+        self.json_snapshot_path = os.path.splitext(snapshot_path)[0] + ".json"
+        self.fsync_mode = fsync_mode
+        self.fsync_interval = fsync_interval
+
+        self.lock = threading.Lock()
+        self.file = None
+        self.seq = 0
+        self.dirty = False
+        self.records_since_snapshot = 0
+        self.running = False
+        self.metrics = None     # optional metrics.Metrics for fsync timings
+        self.profiler = None    # optional profiler.Profiler for fsync spans
+
+    # ----- Startup -----
+
+    def recover(self, store):
+        """
+        Loads the latest snapshot into store and replays the journal tail.
+        Returns False when there was nothing on disk to recover. Raises
+        SnapshotError, leaving the files untouched, for corruption anywhere
+        but the journal's last line.
+        """
+        found = False
+        snap_seq = 0
+        if os.path.exists(self.snapshot_path):
+            # A corrupt snapshot raises SnapshotError instead of starting empty
+            with SnapshotReader(self.snapshot_path) as snapshot:
+                snap_seq = snapshot.seq
+                for user in snapshot.users():
+                    store.add_user(user)
+                for item in snapshot.items():
+                    store.add_item(item)
+                for sub in snapshot.subscriptions():
+                    store.add_subscription(sub)
+            found = True
+        elif self.json_snapshot_path != self.snapshot_path and os.path.exists(self.json_snapshot_path):
+            snapshot = read_json_snapshot(self.json_snapshot_path)
+            snap_seq = snapshot["seq"]
+            for user in snapshot["users"]:
+                store.add_user(User.from_dict(user))
+            for item in snapshot["items"]:
+                store.add_item(Item.from_dict(item))
+            for sub in snapshot["subscriptions"]:
+                store.add_subscription(Subscription.from_dict(sub))
+            # Counts as pending work so the next compaction writes the binary form
+            self.records_since_snapshot += 1
+            found = True
+
+        self.seq = snap_seq
+        # .old exists only if a compaction died before its snapshot landed
+        for path in (self.old_path, self.path):
+            records, valid_length = read_records(path)
+            if os.path.exists(path) and os.path.getsize(path) != valid_length:
+                # Cut the torn tail so new appends start on a clean line
+                with open(path, "r+b") as f:
+                    f.truncate(valid_length)
+            for record in records:
+                found = True
+                if record["seq"] <= snap_seq:
+                    continue
+                apply_record(store, record)
+                self.seq = record["seq"]
+                self.records_since_snapshot += 1
+        return found
+
+    def open(self, sync_thread=True):
+        """
+        sync_thread=False leaves group commits to the caller (the asyncio
+        server schedules sync() on its own loop).
+        """
+        self.file = open(self.path, "a")
+        self.running = True
+        if self.fsync_mode == "interval" and sync_thread:
+            threading.Thread(target=self.sync_loop, daemon=True).start()
+
+    def close(self):
+        self.running = False
+        self.sync()
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    # ----- Writing -----
+
+    def append(self, op, **fields):
+        """
+        fields may hold records (User, Item, Subscription); they are
+        written in their to_dict() form.
+        """
+        record = {"seq": 0, "op": op}
+        record.update(fields)
+        with self.lock:
+            self.seq += 1
+            record["seq"] = self.seq
+            self.file.write(json.dumps(record, separators=(",", ":"), default=to_json) + "\n")
+            self.records_since_snapshot += 1
+            if self.fsync_mode == "always":
+                started = time.perf_counter()
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                if self.metrics is not None:
+                    self.metrics.observe("journal.fsync", time.perf_counter() - started)
+                if self.profiler is not None:
+                    self.profiler.record("persist.fsync", started)
+            else:
+                self.dirty = True
+
+    def sync(self):
+        with self.lock:
+            if not self.dirty or not self.file:
+                return
+            started = time.perf_counter()
+            self.file.flush()
+            if self.fsync_mode != "never":
+                os.fsync(self.file.fileno())
+            self.dirty = False
+            if self.metrics is not None:
+                self.metrics.observe("journal.fsync", time.perf_counter() - started)
+            if self.profiler is not None:
+                self.profiler.record("persist.fsync", started)
+
+    def sync_loop(self):
+        while self.running:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    # ----- Compaction -----
+
+    def compact(self, store, lock=None):
+        """
+        Snapshots store and truncates the log. Only the copy and the rotation
+        happen under lock (the one guarding store); the write does not.
+        """
+        with lock or contextlib.nullcontext():
+            state = store.snapshot_state()
+            seq = self.rotate()
+        self.write_snapshot(state, seq)
+
+    def rotate(self):
+        """
+        Closes the current journal and starts an empty one. Returns the last
+        sequence number covered by the rotated segment. Call this under the
+        same lock that guards the state being snapshotted.
+        """
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            if os.path.exists(self.old_path):
+                # Previous snapshot never landed; keep both segments
+                with open(self.old_path, "a") as old, open(self.path, "r") as cur:
+                    old.write(cur.read())
+                    old.flush()
+                    os.fsync(old.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self.file = open(self.path, "a")
+            self.dirty = False
+            self.records_since_snapshot = 0
+            return self.seq
+
+    def write_snapshot(self, state, seq):
+        """
+        Atomically replaces the snapshot with state ({"users", "items",
+        "subscriptions"}) covering every record up to seq, then drops the
+        rotated journal segment.
+        """
+        write_snapshot(self.snapshot_path, state, seq)
+        if os.path.exists(self.old_path):
+            os.remove(self.old_path)
@@ -0,0 +1,488 @@
+import argparse
+import json
+import os
+import random
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from auction_engine import SERVER_IP, SERVER_PORT
+from protocol import (decode, encode, PROTOCOL_VERSION, TEXT_VERSION, MAX_DATAGRAM,
+                      OP_BATCH, OP_REGISTER, OP_LOGIN, OP_LIST_ITEM, OP_SUBSCRIBE,
+                      OP_DE_SUBSCRIBE, OP_SEARCH, OP_BROWSE, OP_BID, OP_BID_ACCEPTED, OP_AUCTION_ANNOUNCE,
+                      OP_AUCTION_SNAPSHOT, OP_AUCTION_DELTA, CHANGED_PRICE, CHANGED_CLOSED, OP_STATS,
+                      OP_STATS_REPLY, DENIALS)
+
+# ----------------------------
+# Load generator / benchmark
+# ----------------------------
+# Simulates many buyers and sellers over the real UDP protocol and reports
+# throughput and latency percentiles as JSON:
+#
+#   python loadgen.py --spawn --buyers 2000 --sellers 200 --duration 20
+#
+# Phases: every user REGISTERs, buyers SUBSCRIBE to some of the catalog's
+# item names, then for --duration seconds a weighted mix of commands runs
+# with at most --concurrency requests outstanding. Sellers list catalog
+# names (so announcements fan out to the subscribed buyers); SUBSCRIBE and
+# DE-SUBSCRIBE churn on names nobody lists, so they never trigger catch-up
+# announcements that would skew delivery latency. Each LIST_ITEM carries its
+# send time in the description, which gives announcement delivery latency
+# (listing sent -> buyer received). SEARCH / BROWSE (not in the default mix)
+# query catalog names in a random order, first page only. BID outbids the
+# last offer on one of the first --hot-items live items the buyers have
+# heard of (anti-sniping keeps a hot item open while bids keep coming).
+#
+# Requests are not retransmitted: anything unanswered after --timeout is
+# counted as lost.
+
+MIX_OPS = {
+    "register": OP_REGISTER,
+    "login": OP_LOGIN,
+    "list_item": OP_LIST_ITEM,
+    "subscribe": OP_SUBSCRIBE,
+    "de_subscribe": OP_DE_SUBSCRIBE,
+    "search": OP_SEARCH,
+    "browse": OP_BROWSE,
+    "bid": OP_BID,
+}
+SEARCH_ORDERS = ("ending", "price", "price_desc")
+DEFAULT_MIX = "login=4,list_item=2,subscribe=2,de_subscribe=2,register=1"
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in MIX_OPS:
+            raise ValueError(f"unknown command in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentiles(samples):
+    """
+    Latency summary in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "p999": at(0.999),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+# ----------------------------
+# LoadGenerator
+# ----------------------------
+class LoadGenerator:
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, buyers=1000, sellers=100, sockets=32,
+                 concurrency=64, mix=None, names=50, subs_per_buyer=5, item_duration=2,
+                 timeout=2.0, version=PROTOCOL_VERSION, seed=None, hot_items=1):
+        self.server = (host, port)
+        self.concurrency = concurrency
+        self.mix = mix or parse_mix(DEFAULT_MIX)
+        self.subs_per_buyer = subs_per_buyer
+        self.item_duration = item_duration
+        self.timeout = timeout
+        self.version = version
+        self.random = random.Random(seed)
+
+        # Users share a pool of sockets: announcements go to a user's
+        # registered port, and thousands of sockets would hit fd limits.
+        self.socks = []
+        self.selector = selectors.DefaultSelector()
+        for _ in range(sockets):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((host, 0))
+            sock.setblocking(False)
+            self.socks.append(sock)
+            self.selector.register(sock, selectors.EVENT_READ)
+
+        # Unique per run, so repeated runs against one server do not collide
+        self.run_id = f"{os.getpid()}{self.random.randrange(1000)}"
+        self.sellers = [(f"s{i}-{self.run_id}", "Seller", i % sockets) for i in range(sellers)]
+        self.buyers = [(f"b{i}-{self.run_id}", "Buyer", i % sockets) for i in range(buyers)]
+        self.buyer_socks = {name: sock_index for name, _, sock_index in self.buyers}
+        self.catalog = [f"item{k}" for k in range(names)]
+        self.churn_names = [f"churn{k}" for k in range(names)]
+        self.churn_subscribed = set()   # (buyer, churn name) believed subscribed
+        self.extra_users = 0
+        self.hot_items = hot_items
+        self.live_items = {}    # item_id -> highest price offered or announced, in order heard
+        self.bid_on = set()     # item ids this run has bid on
+
+        self.next_rq = 1
+        self.pending = {}       # rq -> (op name, sent_at)
+        self.cond = threading.Condition()
+        self.running = False
+        self.measuring = False
+
+        self.latencies = {}     # op name -> [seconds]
+        self.denied = {}        # op name -> count
+        self.lost = {}          # op name -> count
+        self.completed = 0
+        self.announce_latencies = []
+
+    # ----- Sending -----
+
+    def send(self, op_name, fields, sock_index):
+        """
+        Sends one command, blocking while --concurrency requests are
+        outstanding.
+        """
+        with self.cond:
+            while len(self.pending) >= self.concurrency:
+                self.cond.wait(0.05)
+                self.sweep()
+            rq = self.next_rq
+            self.next_rq += 1
+            self.pending[rq] = (op_name, time.perf_counter())
+        data = encode(self.version, MIX_OPS[op_name], rq, fields)
+        self.socks[sock_index].sendto(data, self.server)
+
+    def sweep(self):
+        # Caller holds self.cond
+        cutoff = time.perf_counter() - self.timeout
+        expired = [rq for rq, (_, sent_at) in self.pending.items() if sent_at < cutoff]
+        for rq in expired:
+            op_name, _ = self.pending.pop(rq)
+            if self.measuring:
+                self.lost[op_name] = self.lost.get(op_name, 0) + 1
+
+    def wait_idle(self):
+        deadline = time.perf_counter() + self.timeout
+        with self.cond:
+            while self.pending and time.perf_counter() < deadline:
+                self.cond.wait(0.05)
+            self.sweep()
+
+    # ----- Receiving -----
+
+    def receive_loop(self):
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                while True:
+                    try:
+                        data = key.fileobj.recv(MAX_DATAGRAM)
+                    except (BlockingIOError, OSError):
+                        break
+                    self.handle(data, time.perf_counter())
+
+    def handle(self, data, now):
+        message = decode(data)
+        if message is None:
+            return
+        version, opcode, rq, fields = message
+        if opcode == OP_BATCH:
+            for frame in fields:
+                self.handle(frame, now)
+            return
+        if opcode == OP_AUCTION_ANNOUNCE:
+            self.on_announce(fields)
+            return
+        if opcode == OP_AUCTION_SNAPSHOT and not rq:
+            # Same fields as AUCTION_ANNOUNCE after the version
+            self.on_announce(fields[:1] + fields[2:])
+            return
+        if opcode == OP_AUCTION_DELTA:
+            self.on_delta(fields)
+            return
+        if opcode == OP_BID_ACCEPTED:
+            self.on_price(fields[0], float(fields[1]))
+        try:
+            rq = int(rq)
+        except (TypeError, ValueError):
+            return
+        with self.cond:
+            entry = self.pending.pop(rq, None)
+            if entry is None:
+                return
+            self.cond.notify()
+            if not self.measuring:
+                return
+            op_name, sent_at = entry
+            self.latencies.setdefault(op_name, []).append(now - sent_at)
+            self.completed += 1
+            if opcode in DENIALS:
+                self.denied[op_name] = self.denied.get(op_name, 0) + 1
+
+    def on_price(self, item_id, price):
+        with self.cond:
+            if item_id in self.live_items:
+                self.live_items[item_id] = max(self.live_items[item_id], price)
+
+    def on_announce(self, fields):
+        with self.cond:
+            if int(fields[4]) <= 0:
+                self.live_items.pop(fields[0], None)
+            else:
+                price = float(fields[3])
+                self.live_items[fields[0]] = max(self.live_items.get(fields[0], price), price)
+        # Closing announcements (time left 0) carry the original send time,
+        # and so do re-announcements after bids
+        if not self.measuring or int(fields[4]) <= 0 or fields[0] in self.bid_on:
+            return
+        try:
+            listed_at = float(fields[2])
+        except ValueError:
+            return
+        latency = time.time() - listed_at
+        with self.cond:
+            self.announce_latencies.append(latency)
+
+    def on_delta(self, fields):
+        # Deltas carry no description (the send time), so they are not timed
+        item_id, _, _, changed, price, _ = fields
+        with self.cond:
+            if changed & CHANGED_CLOSED:
+                self.live_items.pop(item_id, None)
+            elif changed & CHANGED_PRICE:
+                self.live_items[item_id] = max(self.live_items.get(item_id, price), price)
+
+    # ----- Workload -----
+
+    def register(self, user):
+        name, role, sock_index = user
+        port = self.socks[sock_index].getsockname()[1]
+        self.send("register", (name, role, self.server[0], port, 0), sock_index)
+
+    def setup(self):
+        for user in self.sellers + self.buyers:
+            self.register(user)
+        self.wait_idle()
+        for name, _, sock_index in self.buyers:
+            for item_name in self.random.sample(self.catalog, min(self.subs_per_buyer, len(self.catalog))):
+                self.send("subscribe", (name, item_name), sock_index)
+        self.wait_idle()
+
+    def run_one(self, op_name):
+        rand = self.random
+        if op_name == "register":
+            self.extra_users += 1
+            role = rand.choice(("Buyer", "Seller"))
+            self.register((f"r{self.extra_users}-{self.run_id}", role, rand.randrange(len(self.socks))))
+        elif op_name == "login":
+            name, role, sock_index = rand.choice(self.buyers + self.sellers if rand.random() < 0.5
+                                                 else self.buyers)
+            self.send("login", (name, role), sock_index)
+        elif op_name == "list_item":
+            name, _, sock_index = rand.choice(self.sellers)
+            fields = (name, rand.choice(self.catalog), f"{time.time():.6f}",
+                      round(rand.uniform(1, 500), 2), self.item_duration)
+            self.send("list_item", fields, sock_index)
+        elif op_name == "search":
+            fields = (rand.choice(SEARCH_ORDERS), "-", 20, rand.choice(self.catalog))
+            self.send("search", fields, rand.randrange(len(self.socks)))
+        elif op_name == "bid":
+            with self.cond:
+                targets = list(self.live_items)[:self.hot_items] if self.hot_items else list(self.live_items)
+                if targets:
+                    item_id = rand.choice(targets)
+                    amount = self.live_items[item_id] = self.live_items[item_id] + 1
+                    self.bid_on.add(item_id)
+            if not targets:
+                # Nothing heard of yet: list something to bid on
+                return self.run_one("list_item")
+            name, _, sock_index = rand.choice(self.buyers)
+            self.send("bid", (name, item_id, amount), sock_index)
+        elif op_name == "browse":
+            self.send("browse", (rand.choice(SEARCH_ORDERS), "-", 20), rand.randrange(len(self.socks)))
+        else:
+            key = (rand.choice(self.buyers)[0], rand.choice(self.churn_names))
+            if op_name == "de_subscribe" and self.churn_subscribed:
+                key = self.churn_subscribed.pop()
+            elif op_name == "subscribe":
+                self.churn_subscribed.add(key)
+            self.send(op_name, key, self.buyer_socks[key[0]])
+
+    def run(self, duration):
+        self.running = True
+        receiver = threading.Thread(target=self.receive_loop, daemon=True)
+        receiver.start()
+        try:
+            started = time.perf_counter()
+            self.setup()
+            setup_time = time.perf_counter() - started
+
+            ops = list(self.mix)
+            weights = [self.mix[op] for op in ops]
+            self.measuring = True
+            started = time.perf_counter()
+            deadline = started + duration
+            while time.perf_counter() < deadline:
+                for op_name in self.random.choices(ops, weights, k=64):
+                    self.run_one(op_name)
+            sent_time = time.perf_counter() - started
+            self.wait_idle()
+            # Let the last announcements land
+            time.sleep(min(1.0, self.timeout))
+            self.measuring = False
+        finally:
+            self.running = False
+            receiver.join()
+        return self.results(setup_time, sent_time)
+
+    def results(self, setup_time, elapsed):
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        lost = sum(self.lost.values())
+        return {
+            "config": {
+                "server": f"{self.server[0]}:{self.server[1]}",
+                "protocol_version": self.version,
+                "buyers": len(self.buyers),
+                "sellers": len(self.sellers),
+                "sockets": len(self.socks),
+                "concurrency": self.concurrency,
+                "mix": self.mix,
+                "catalog_names": len(self.catalog),
+                "subs_per_buyer": self.subs_per_buyer,
+                "item_duration": self.item_duration,
+                "timeout": self.timeout,
+            },
+            "setup_seconds": round(setup_time, 3),
+            "duration_seconds": round(elapsed, 3),
+            "requests": {
+                "completed": self.completed,
+                "lost": lost,
+                "denied": sum(self.denied.values()),
+                "throughput_per_second": round(self.completed / elapsed, 1) if elapsed else 0,
+            },
+            "latency_ms": {
+                "all": percentiles(all_latencies),
+                **{op: percentiles(values) for op, values in sorted(self.latencies.items())},
+            },
+            "denied_by_command": self.denied,
+            "lost_by_command": self.lost,
+            "announcement_latency_ms": percentiles(self.announce_latencies),
+        }
+
+def fetch_stats(host, port, version=PROTOCOL_VERSION, timeout=1.0):
+    """
+    The server's own metrics (STATS command), or None if it does not answer.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(encode(version, OP_STATS, 1), (host, port))
+        message = decode(sock.recvfrom(MAX_DATAGRAM)[0])
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    if message is None or message[1] != OP_STATS_REPLY:
+        return None
+    return json.loads(message[3][0])
+
+# ----------------------------
+# Local server
+# ----------------------------
+def spawn_server(host, port, buyers, sellers, extra_args):
+    """
+    Starts server.py headless in a scratch directory (so its journal and
+    snapshot do not touch the working tree) with limits raised for the run.
+    Returns (process, scratch directory).
+    """
+    workdir = tempfile.mkdtemp(prefix="auction-bench-")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    cmd = [sys.executable, script, "--headless", "--quiet", "--host", host, "--port", str(port),
+           "--keepalive", "0", "--max-users", str(10 * (buyers + sellers) + 1000),
+           "--max-items-per-seller", "1000000"] + extra_args
+    proc = subprocess.Popen(cmd, cwd=workdir)
+
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.settimeout(0.2)
+    try:
+        for _ in range(50):
+            probe.sendto(encode(TEXT_VERSION, OP_LOGIN, 1, ("probe", "Buyer")), (host, port))
+            try:
+                probe.recvfrom(MAX_DATAGRAM)
+                return proc, workdir
+            except socket.timeout:
+                if proc.poll() is not None:
+                    break
+        stop_server(proc, workdir)
+        raise RuntimeError("server did not come up")
+    finally:
+        probe.close()
+
+def stop_server(proc, workdir):
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+# ----------------------------
+# Entry point
+# ----------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Auction server load generator / benchmark")
+    parser.add_argument("--host", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--spawn", action="store_true",
+                        help="start a local headless server.py for the run (and stop it after)")
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="extra argument for the spawned server, e.g. --server-arg=--asyncio")
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--sellers", type=int, default=100)
+    parser.add_argument("--sockets", type=int, default=32,
+                        help="UDP sockets shared by the simulated users")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="max outstanding requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="command weights: register, login, list_item, subscribe, de_subscribe, "
+                             "search, browse, bid")
+    parser.add_argument("--names", type=int, default=50,
+                        help="distinct item names sellers list")
+    parser.add_argument("--subs-per-buyer", type=int, default=5)
+    parser.add_argument("--item-duration", type=int, default=2,
+                        help="auction duration (s) of listed items")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds of measured load after setup")
+    parser.add_argument("--timeout", type=float, default=2.0,
+                        help="seconds before an unanswered request counts as lost")
+    parser.add_argument("--text", action="store_true",
+                        help="use the text protocol instead of binary")
+    parser.add_argument("--protocol", type=int, default=PROTOCOL_VERSION,
+                        help="binary protocol version to offer, e.g. 2 for full announcements instead of deltas")
+    parser.add_argument("--hot-items", type=int, default=1,
+                        help="bids target the first N live items heard of (0 = any)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = None
+    if args.spawn:
+        server = spawn_server(args.host, args.port, args.buyers, args.sellers, args.server_arg)
+        print(f"Spawned server on {args.host}:{args.port}", file=sys.stderr)
+    try:
+        generator = LoadGenerator(args.host, args.port, args.buyers, args.sellers, args.sockets,
+                                  args.concurrency, parse_mix(args.mix), args.names,
+                                  args.subs_per_buyer, args.item_duration, args.timeout,
+                                  TEXT_VERSION if args.text else args.protocol, args.seed, args.hot_items)
+        results = generator.run(args.duration)
+        # With --workers this is whichever worker the kernel picked
+        results["server_stats"] = fetch_stats(args.host, args.port, generator.version)
+    finally:
+        if server is not None:
+            stop_server(*server)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
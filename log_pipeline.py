@@ -0,0 +1,230 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# ----------------------------
+# LogPipeline
+# ----------------------------
+class LogPipeline:
+    """
+    Producers (UDP, expiry, publisher threads) push (timestamp, kind,
+    message) records; each consumer (a Tk LogView, a LogSink) owns a
+    bounded deque and drains it in batches on its own schedule. deque
+    appends are atomic, so push() takes no lock unless rate limiting is on.
+
+    kind groups related messages (a command name, "info", ...) for the
+    optional per-kind controls:
+    - rate_limits: kind -> max records per second (token bucket, burst of
+      one second's worth); "*" applies to every kind not listed
+    - sampling: kind -> keep 1 record in N; "*" as above
+    Dropped records are counted and reported in the next admitted record of
+    that kind. If a consumer falls behind, its deque drops the oldest.
+
+    message may also be a callable returning the text, for hot paths: it is
+    only called once the record is admitted and someone is listening.
+    """
+    def __init__(self, rate_limits=None, sampling=None, queue_limit=10000):
+        self.rate_limits = rate_limits or {}
+        self.sampling = sampling or {}
+        self.queue_limit = queue_limit
+        self.consumers = []
+
+        self.lock = threading.Lock()
+        self.buckets = {}       # kind -> [tokens, last_refill]
+        self.seen = {}          # kind -> records offered (for sampling)
+        self.suppressed = {}    # kind -> records dropped since last admitted
+
+    def subscribe(self, maxlen=None):
+        consumer = deque(maxlen=maxlen or self.queue_limit)
+        self.consumers.append(consumer)
+        return consumer
+
+    def unsubscribe(self, consumer):
+        if consumer in self.consumers:
+            self.consumers.remove(consumer)
+
+    def push(self, kind, message):
+        if not self.consumers:
+            return
+        if self.rate_limits or self.sampling:
+            suppressed = self.admit(kind)
+            if suppressed is None:
+                return
+        else:
+            suppressed = 0
+        if callable(message):
+            message = message()
+        if suppressed:
+            message = f"{message} (+{suppressed} {kind} messages suppressed)"
+        record = (time.time(), kind, message)
+        for consumer in self.consumers:
+            consumer.append(record)
+
+    def admit(self, kind):
+        """
+        Returns None to drop the record, else how many were dropped before it.
+        """
+        with self.lock:
+            every = self.sampling.get(kind, self.sampling.get("*", 1))
+            if every > 1:
+                seen = self.seen.get(kind, 0)
+                self.seen[kind] = seen + 1
+                if seen % every:
+                    self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+                    return None
+            rate = self.rate_limits.get(kind, self.rate_limits.get("*", 0))
+            if rate > 0:
+                now = time.monotonic()
+                bucket = self.buckets.setdefault(kind, [rate, now])
+                bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+                    return None
+                bucket[0] -= 1
+            return self.suppressed.pop(kind, 0)
+
+def drain(consumer, limit):
+    records = []
+    while consumer and len(records) < limit:
+        records.append(consumer.popleft())
+    return records
+
+def format_record(record):
+    stamp, _, message = record
+    return f"{time.strftime('%H:%M:%S', time.localtime(stamp))} {message}"
+
+def start_sinks(pipeline, quiet=False, log_file=None, prefix=""):
+    """
+    Headless logging: stdout unless quiet, plus a rotating file if given.
+    Returns the started sinks; stop() them on shutdown to flush the tail.
+    """
+    sinks = []
+    if not quiet:
+        sinks.append(LogSink(pipeline, prefix=prefix))
+    if log_file:
+        sinks.append(LogSink(pipeline, log_file, prefix=prefix))
+    for sink in sinks:
+        sink.start()
+    return sinks
+
+# ----------------------------
+# LogView (Tk)
+# ----------------------------
+class LogView:
+    """
+    Feeds a read-only CTkTextbox from a pipeline on the Tk main loop: every
+    interval_ms it inserts up to `batch` new lines in one edit and trims the
+    box to the last max_lines, so it never grows without bound.
+    """
+    def __init__(self, textbox, pipeline, max_lines=500, interval_ms=100, batch=200):
+        self.textbox = textbox
+        self.pipeline = pipeline
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.batch = batch
+        self.consumer = pipeline.subscribe(maxlen=max_lines)
+        self.lines = 0
+        self.textbox.after(self.interval_ms, self.tick)
+
+    def tick(self):
+        records = drain(self.consumer, self.batch)
+        if records:
+            text = "".join(record[2] + "\n" for record in records)
+            self.textbox.configure(state="normal")
+            self.textbox.insert("end", text)
+            self.lines += len(records)
+            if self.lines > self.max_lines:
+                excess = self.lines - self.max_lines
+                self.textbox.delete("1.0", f"{excess + 1}.0")
+                self.lines = self.max_lines
+            self.textbox.see("end")
+            self.textbox.configure(state="disabled")
+        try:
+            self.textbox.after(self.interval_ms, self.tick)
+        except Exception:
+            # Widget destroyed with its window
+            self.pipeline.unsubscribe(self.consumer)
+
+# ----------------------------
+# LogSink (stdout / rotating file)
+# ----------------------------
+class LogSink:
+    """
+    Writes pipeline records from its own thread, flushing once per batch.
+    With a path the file is rotated at max_bytes, keeping `backups` old
+    copies (path.1 is the newest); without one it writes to stdout.
+    """
+    def __init__(self, pipeline, path=None, prefix="", max_bytes=10 * 1024 * 1024, backups=3,
+                 interval=0.2, batch=1000):
+        self.pipeline = pipeline
+        self.path = path
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        self.batch = batch
+        self.consumer = pipeline.subscribe()
+        self.stream = None
+        self.size = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.open()
+        self.running = True
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.pipeline.unsubscribe(self.consumer)
+        self.write(drain(self.consumer, len(self.consumer)))
+        if self.path:
+            self.stream.close()
+
+    def open(self):
+        if self.path:
+            self.stream = open(self.path, "a", encoding="utf-8")
+            self.size = self.stream.tell()
+        else:
+            self.stream = sys.stdout
+
+    def rotate(self):
+        self.stream.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open()
+
+    def write_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            while True:
+                records = drain(self.consumer, self.batch)
+                if not records:
+                    break
+                self.write(records)
+
+    def write(self, records):
+        if not records:
+            return
+        text = "".join(f"{self.prefix}{format_record(record)}\n" for record in records)
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+        except (OSError, ValueError):
+            return  # stdout closed / disk full: logging must not take the server down
+        if self.path:
+            self.size += len(text.encode("utf-8"))
+            if self.size >= self.max_bytes:
+                self.rotate()
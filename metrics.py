@@ -0,0 +1,139 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds (roughly 1-2.5-5 per decade)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# ----------------------------
+# Histogram
+# ----------------------------
+class Histogram:
+    """
+    Fixed-bucket latency histogram: O(log buckets) to record, constant
+    memory. Percentiles are reported as the upper bound of the bucket they
+    fall in (the overflow bucket reports the observed max).
+    """
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        """
+        Summary in milliseconds plus the non-empty buckets ("le" bounds).
+        """
+        ms = 1000.0
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count * ms, 4) if self.count else 0.0,
+            "p50": round(self.percentile(0.50) * ms, 4),
+            "p99": round(self.percentile(0.99) * ms, 4),
+            "p999": round(self.percentile(0.999) * ms, 4),
+            "max": round(self.max * ms, 4),
+            "buckets": {
+                (f"{self.bounds[i] * ms:g}" if i < len(self.bounds) else "inf"): count
+                for i, count in enumerate(self.counts) if count
+            },
+        }
+
+# ----------------------------
+# Metrics
+# ----------------------------
+class Metrics:
+    """
+    Counters, latency histograms and gauges for one engine. Counters and
+    histograms are updated from several threads, so they share a lock;
+    gauges are callables sampled only when a snapshot is taken.
+
+    Names are dotted: "received.LOGIN", "denied.REGISTER.NameInUse",
+    "command.LIST_ITEM" (histogram), "journal.fsync" (histogram), ...
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+            latency = {name: h.snapshot() for name, h in sorted(self.histograms.items())}
+        gauges = {}
+        for name, read in sorted(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        return {
+            "time": round(time.time(), 3),
+            "uptime": round(time.time() - self.started, 3),
+            "counters": counters,
+            "gauges": gauges,
+            "latency_ms": latency,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), separators=(",", ":"))
+
+# ----------------------------
+# Periodic dump
+# ----------------------------
+def dump_metrics(metrics, path):
+    """
+    Writes the snapshot atomically (tmp file + replace), so readers never
+    see a half-written file.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(metrics.snapshot(), f, indent=2)
+    os.replace(tmp, path)
+
+def dump_loop(metrics, path, interval, is_running):
+    while is_running():
+        time.sleep(interval)
+        try:
+            dump_metrics(metrics, path)
+        except OSError:
+            pass
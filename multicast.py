@@ -0,0 +1,125 @@
+import ipaddress
+import socket
+import sys
+import zlib
+
+from protocol import DELTA_MIN_VERSION
+
+MULTICAST_BASE = "239.255.77.0"     # administratively scoped (RFC 2365)
+MULTICAST_GROUPS = 64
+MULTICAST_PORT = 5001
+MULTICAST_TTL = 1
+# Group traffic (snapshots and deltas, BATCH-packed) is encoded once for
+# every member, at this version; buyers negotiated below it stay on unicast
+MULTICAST_VERSION = DELTA_MIN_VERSION
+# Linux delivers every joined group to every socket on the port unless this
+# is cleared (not exported by the socket module)
+IP_MULTICAST_ALL = 49
+
+def group_address(item_name, base=MULTICAST_BASE, groups=MULTICAST_GROUPS):
+    """
+    The group carrying item_name's announcements: base + crc32(name) mod
+    groups. Clients compute it themselves from MCAST_CONFIG.
+    """
+    return str(ipaddress.IPv4Address(base) + zlib.crc32(item_name.encode()) % groups)
+
+# ----------------------------
+# MulticastGroups (server)
+# ----------------------------
+class MulticastGroups:
+    """
+    Optional multicast fan-out for AUCTION_ANNOUNCE. Item names hash onto
+    `groups` consecutive groups from `base`, all on one UDP port, so an
+    announcement goes out once per group instead of once per subscriber.
+
+    A buyer's (exact) subscription moves to its group only once the client
+    has joined it and said so (MCAST_JOIN); every other subscriber, pattern
+    subscriptions included, keeps getting unicast. DE-SUBSCRIBE,
+    DE-REGISTER and LOGIN (a new client process) drop the buyer's joins.
+
+    The engine lock guards `joined`; send() is only called by the publisher.
+    """
+    def __init__(self, base=MULTICAST_BASE, groups=MULTICAST_GROUPS, port=MULTICAST_PORT, ttl=MULTICAST_TTL,
+                 interface="0.0.0.0"):
+        address = ipaddress.IPv4Address(base)
+        if not address.is_multicast:
+            raise ValueError(f"{base} is not a multicast address")
+        self.base = str(address)
+        self.groups = groups
+        self.port = port
+        self.ttl = ttl
+        self.interface = interface
+        self.joined = {}        # buyer_name -> { item_name, ... }
+        self.sock = None
+
+    def open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        # Members on this host (loopback tests, a co-located client) hear it too
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.interface))
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def group_for(self, item_name):
+        return group_address(item_name, self.base, self.groups)
+
+    # ----- Membership -----
+
+    def join(self, buyer_name, item_name):
+        self.joined.setdefault(buyer_name, set()).add(item_name)
+
+    def leave(self, buyer_name, item_name):
+        names = self.joined.get(buyer_name)
+        if names is not None:
+            names.discard(item_name)
+            if not names:
+                del self.joined[buyer_name]
+
+    def forget(self, buyer_name):
+        self.joined.pop(buyer_name, None)
+
+    def covers(self, buyer_name, item_name):
+        names = self.joined.get(buyer_name)
+        return names is not None and item_name in names
+
+    def member_count(self):
+        return sum(len(names) for names in self.joined.values())
+
+    # ----- Sending -----
+
+    def send(self, data, group):
+        if self.sock is None:
+            raise OSError("multicast socket closed")
+        self.sock.sendto(data, (group, self.port))
+
+# ----------------------------
+# Receiving (client)
+# ----------------------------
+def receiver_socket(port):
+    """
+    A socket for group traffic on port; several clients on one host can
+    each open one.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if sys.platform.startswith("linux"):
+        sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+    sock.bind(("", port))
+    return sock
+
+def membership(group, interface="0.0.0.0"):
+    # struct ip_mreq for IP_ADD_MEMBERSHIP / IP_DROP_MEMBERSHIP
+    return socket.inet_aton(group) + socket.inet_aton(interface)
+
+def join_group(sock, group, interface="0.0.0.0"):
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership(group, interface))
+
+def leave_group(sock, group, interface="0.0.0.0"):
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, membership(group, interface))
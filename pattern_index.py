@@ -0,0 +1,106 @@
+import fnmatch
+import re
+
+# Characters that make a subscription a pattern rather than an exact name
+WILDCARDS = "*?["
+
+def is_pattern(name):
+    return any(char in name for char in WILDCARDS)
+
+def literal_prefix(pattern):
+    for index, char in enumerate(pattern):
+        if char in WILDCARDS:
+            return pattern[:index]
+    return pattern
+
+def compile_pattern(pattern):
+    return re.compile(fnmatch.translate(pattern))
+
+# ----------------------------
+# PatternIndex
+# ----------------------------
+class TrieNode:
+    __slots__ = ("children", "buyers", "globs")
+
+    def __init__(self):
+        self.children = {}      # char -> TrieNode
+        self.buyers = set()     # buyers of "<path>*"
+        self.globs = {}         # other patterns whose literal prefix is <path> -> [regex, {buyers}]
+
+class PatternIndex:
+    """
+    Glob subscriptions ("laptop*", "*book", "lap?op", "gpu-[34]090"), keyed
+    by their literal prefix (the part before the first wildcard) in a
+    character trie.
+
+    match(name) walks the trie along name, so it touches one node per
+    character: "<prefix>*" subscriptions are answered from the nodes
+    themselves, and only globs filed under a prefix of name are tested.
+    Cost depends on the name length, not on how many patterns exist.
+    """
+    def __init__(self):
+        self.root = TrieNode()
+        self.count = 0          # (pattern, buyer) pairs
+
+    def add(self, pattern, buyer):
+        prefix = literal_prefix(pattern)
+        node = self.root
+        for char in prefix:
+            node = node.children.setdefault(char, TrieNode())
+        if pattern == prefix + "*":
+            buyers = node.buyers
+        else:
+            buyers = node.globs.setdefault(pattern, [compile_pattern(pattern), set()])[1]
+        if buyer not in buyers:
+            buyers.add(buyer)
+            self.count += 1
+
+    def remove(self, pattern, buyer):
+        prefix = literal_prefix(pattern)
+        path = [self.root]
+        for char in prefix:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        node = path[-1]
+        if pattern == prefix + "*":
+            buyers = node.buyers
+        else:
+            entry = node.globs.get(pattern)
+            if entry is None:
+                return
+            buyers = entry[1]
+        if buyer not in buyers:
+            return
+        buyers.discard(buyer)
+        self.count -= 1
+        if not buyers and pattern in node.globs:
+            del node.globs[pattern]
+        # Prune nodes left with nothing under them
+        for depth in range(len(prefix), 0, -1):
+            node = path[depth]
+            if node.children or node.buyers or node.globs:
+                break
+            del path[depth - 1].children[prefix[depth - 1]]
+
+    def match(self, name):
+        """
+        Every buyer with a pattern matching name.
+        """
+        found = set()
+        node = self.root
+        index = 0
+        while True:
+            if node.buyers:
+                found |= node.buyers
+            for regex, buyers in node.globs.values():
+                if regex.match(name):
+                    found |= buyers
+            if index == len(name):
+                break
+            node = node.children.get(name[index])
+            if node is None:
+                break
+            index += 1
+        return found
@@ -0,0 +1,212 @@
+import heapq
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+# ----------------------------
+# Profiler
+# ----------------------------
+class Profiler:
+    """
+    Opt-in runtime profiling, switched on and off without a restart (the
+    PROFILE admin command or SIGUSR1).
+
+    While active it collects:
+    - timing spans around command dispatch, persistence, announcement
+      flushes, expiry and UI refreshes (count / total / max per name, plus
+      the slowest individual spans)
+    - sampled stacks of every thread, every `interval` seconds, aggregated
+      in folded form ("a;b;c count"), ready for flamegraph.pl / speedscope
+
+    stop() writes <prefix>.folded and <prefix>.json into out_dir. When
+    inactive, span()/record() cost one attribute check.
+    """
+    def __init__(self, out_dir=".", interval=0.005, slowest=50):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.slowest_kept = slowest
+
+        self.active = False
+        self.lock = threading.Lock()
+        self.started = None
+        self.spans = {}         # name -> [count, total, max]
+        self.slowest = []       # min-heap of (duration, started_at, name)
+        self.stacks = {}        # folded stack -> samples
+        self.samples = 0
+        self.sampler = None
+
+    # ----- Control -----
+
+    def start(self):
+        with self.lock:
+            if self.active:
+                return False
+            self.spans = {}
+            self.slowest = []
+            self.stacks = {}
+            self.samples = 0
+            self.started = time.time()
+            self.active = True
+        self.sampler = threading.Thread(target=self.sample_loop, daemon=True)
+        self.sampler.start()
+        return True
+
+    def stop(self):
+        """
+        Stops profiling and writes the report. Returns the path prefix, or
+        None if profiling was not running.
+        """
+        collected = self.finish()
+        return None if collected is None else self.write(collected)
+
+    def finish(self):
+        """
+        Stops profiling and returns what it collected, for write(), or None
+        if it was not running. Only copies: a caller holding a lock can
+        format and write the report once it has let go.
+        """
+        with self.lock:
+            if not self.active:
+                return None
+            self.active = False
+        self.sampler.join()
+        with self.lock:
+            return {
+                "started": self.started,
+                "stopped": time.time(),
+                "samples": self.samples,
+                "spans": {name: list(span) for name, span in self.spans.items()},
+                "slowest": list(self.slowest),
+                "stacks": dict(self.stacks),
+            }
+
+    def toggle(self):
+        return self.stop() if self.active else self.start()
+
+    def status(self):
+        if not self.active:
+            return "idle"
+        return f"running {time.time() - self.started:.1f}s, {self.samples} samples"
+
+    # ----- Spans -----
+
+    def record(self, name, started):
+        """
+        Closes a span opened at perf_counter() value `started`.
+        """
+        if not self.active:
+            return
+        duration = time.perf_counter() - started
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = [0, 0.0, 0.0]
+            span[0] += 1
+            span[1] += duration
+            if duration > span[2]:
+                span[2] = duration
+            entry = (duration, time.time() - duration, name)
+            if len(self.slowest) < self.slowest_kept:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def span(self, name):
+        return Span(self, name) if self.active else NULL_SPAN
+
+    # ----- Stack sampling -----
+
+    def sample_loop(self):
+        me = threading.get_ident()
+        while self.active:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            folded = []
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                folded.append(";".join(reversed(stack)))
+            with self.lock:
+                self.samples += 1
+                for key in folded:
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    # ----- Report -----
+
+    def report_prefix(self, collected):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(collected["started"]))
+        return os.path.join(self.out_dir, f"profile-{os.getpid()}-{stamp}")
+
+    def write(self, collected):
+        """
+        Writes <prefix>.folded and <prefix>.json from finish()'s result.
+        Returns the prefix.
+        """
+        prefix = self.report_prefix(collected)
+        stacks = sorted(collected["stacks"].items(), key=lambda entry: -entry[1])
+        report = {
+            "started": round(collected["started"], 3),
+            "seconds": round(collected["stopped"] - collected["started"], 3),
+            "sample_interval": self.interval,
+            "samples": collected["samples"],
+            "spans_ms": {
+                name: {"count": count, "total": round(total * 1000, 3),
+                       "mean": round(total / count * 1000, 4), "max": round(peak * 1000, 3)}
+                for name, (count, total, peak) in sorted(collected["spans"].items(),
+                                                         key=lambda entry: -entry[1][1])
+            },
+            "slowest_spans_ms": [
+                {"name": name, "at": round(at, 3), "ms": round(duration * 1000, 3)}
+                for duration, at, name in sorted(collected["slowest"], reverse=True)
+            ],
+        }
+        with open(prefix + ".folded", "w") as f:
+            for key, count in stacks:
+                f.write(f"{key} {count}\n")
+        with open(prefix + ".json", "w") as f:
+            json.dump(report, f, indent=2)
+        return prefix
+
+class Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.started)
+        return False
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+def install_signal_toggle(profiler, on_change=None):
+    """
+    SIGUSR1 starts / stops the profiler (POSIX only; no-op elsewhere).
+    on_change(message) is told what happened.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    def on_signal(signum, frame):
+        result = profiler.toggle()
+        if on_change is not None:
+            on_change("Profiling started" if result is True else f"Profile written to {result}.*")
+    signal.signal(signal.SIGUSR1, on_signal)
@@ -0,0 +1,360 @@
+import struct
+
+# ----------------------------
+# Wire protocol
+# ----------------------------
+# Two encodings share the UDP port:
+#
+#   text   (version 0): "<COMMAND> <rq> <field> <field> ..." split on
+#                       whitespace, as the original clients send it
+#   binary (version 1+): fixed header + length-prefixed / packed fields
+#
+# Binary header (network byte order, 8 bytes):
+#   magic   B   0xA5, never the first byte of a text command
+#   version B   protocol version of the sender
+#   opcode  H
+#   rq      I   request id (0 for unsolicited messages such as announcements)
+#
+# Field types in a schema:
+#   s   H length + UTF-8 bytes (may contain spaces)
+#   S   I length + UTF-8 bytes (for the session channel: may exceed a datagram)
+#   d   float64
+#   i   int32
+#
+# A client offers its highest version in REGISTER/LOGIN; the server answers
+# in min(client, PROTOCOL_VERSION) and uses that version for everything it
+# sends to the client afterwards. Text requests always get text replies.
+#
+# BATCH (version 2+) wraps several complete messages in one datagram:
+#   binary: header + H count + count x (H length + frame)
+#   text:   "BATCH <rq>" line followed by one text message per line
+# A BATCH request is answered by one BATCH of the per-command replies;
+# the server also packs announcements for a buyer into BATCHes.
+#
+# STATS asks the server for its metrics; STATS_REPLY carries them as one
+# compact JSON string (see metrics.py). PROFILE start|stop|status controls
+# the runtime profiler (loopback clients only, see profiler.py).
+#
+# SEARCH / BROWSE page through live items ranked by order (ending | price |
+# price_desc); cursor is "-" for the first page, then the next_cursor of the
+# previous SEARCH_RESULTS ("-" there means no more pages). Results are one
+# compact JSON list of [item_id, item, description, price, time_left].
+#
+# BID offers amount for item_id. BID-ACCEPTED carries the item's new price
+# and time left (a bid in the closing seconds extends the deadline);
+# BID-REJECTED carries the reason and the price to beat.
+#
+# Session channel (see session_channel.py): the server connects to the
+# client's tcp_port and sends length-prefixed frames holding the messages
+# below. SESSION tells the server a logged-in client's current tcp_port
+# (0 for none); SYNC then carries that user's state as one JSON object
+# {"subscriptions", "items", "listings"} (rows as in SEARCH_RESULTS; "items"
+# rows add the item's announced version, see delta announcements). When an
+# auction closes the high bidder gets WINNER and the seller SOLD, or
+# NON_OFFER if nobody bid. These name their recipient first, since users
+# of one client share its ports; without a session channel they fall back
+# to a datagram.
+#
+# Multicast (optional, see multicast.py): MCAST_INFO asks for the group
+# layout, answered by MCAST_CONFIG base_group groups port (or MCAST-DENIED
+# Disabled). An item name's announcements go to base_group + crc32(name) mod
+# groups. A client that has joined the group for one of its exact
+# subscriptions sends MCAST_JOIN buyer item so the server stops unicasting
+# that item to it; until then, and for pattern subscriptions, it stays on
+# unicast.
+#
+# Delta announcements (version 3+): every announced state of an item gets the
+# next version number (per item, from 1). A buyer first gets AUCTION_SNAPSHOT
+# (the full item), then AUCTION_DELTA for each later version, holding only
+# what changed since the previous one: `changed` is a mask of CHANGED_* bits,
+# and price / time_left are 0 unless their bit is set. CHANGED_CLOSED means
+# the auction is over. A delta with changed 0 (keepalive) just restates the
+# current version. A client that sees a version it cannot apply (a gap, or
+# an item it has no snapshot of) sends RESYNC buyer item_id and gets the
+# item's AUCTION_SNAPSHOT back as the reply (RESYNC-DENIED NoSuchItem once
+# it has closed). Older clients keep getting AUCTION_ANNOUNCE.
+
+PROTOCOL_VERSION = 3
+TEXT_VERSION = 0
+BATCH_MIN_VERSION = 2
+DELTA_MIN_VERSION = 3
+
+# AUCTION_DELTA `changed` bits
+CHANGED_PRICE = 1
+CHANGED_DEADLINE = 2
+CHANGED_CLOSED = 4
+MAGIC = 0xA5
+MAX_DATAGRAM = 65535
+# Keep batches inside a typical Ethernet MTU (1500 - IP/UDP headers)
+BATCH_PAYLOAD_LIMIT = 1400
+
+HEADER = struct.Struct(">BBHI")
+FIELD_LEN = struct.Struct(">H")
+LONG_FIELD_LEN = struct.Struct(">I")
+FIELD_PACKERS = {"d": struct.Struct(">d"), "i": struct.Struct(">i")}
+
+OP_REGISTER = 1
+OP_REGISTERED = 2
+OP_REGISTER_DENIED = 3
+OP_LOGIN = 4
+OP_LOGIN_OK = 5
+OP_LOGIN_FAIL = 6
+OP_DE_REGISTER = 7
+OP_DE_REGISTERED = 8
+OP_LIST_ITEM = 9
+OP_ITEM_LISTED = 10
+OP_LIST_DENIED = 11
+OP_SUBSCRIBE = 12
+OP_SUBSCRIBED = 13
+OP_SUBSCRIPTION_DENIED = 14
+OP_DE_SUBSCRIBE = 15
+OP_AUCTION_ANNOUNCE = 16
+OP_BATCH = 17
+OP_STATS = 18
+OP_STATS_REPLY = 19
+OP_PROFILE = 20
+OP_PROFILE_REPLY = 21
+OP_SEARCH = 22
+OP_BROWSE = 23
+OP_SEARCH_RESULTS = 24
+OP_SEARCH_DENIED = 25
+OP_BID = 26
+OP_BID_ACCEPTED = 27
+OP_BID_REJECTED = 28
+OP_SESSION = 29
+OP_SESSION_OK = 30
+OP_SESSION_DENIED = 31
+OP_SYNC = 32
+OP_WINNER = 33
+OP_SOLD = 34
+OP_NON_OFFER = 35
+OP_MCAST_INFO = 36
+OP_MCAST_CONFIG = 37
+OP_MCAST_JOIN = 38
+OP_MCAST_OK = 39
+OP_MCAST_DENIED = 40
+OP_AUCTION_SNAPSHOT = 41
+OP_AUCTION_DELTA = 42
+OP_RESYNC = 43
+OP_RESYNC_DENIED = 44
+
+# opcode -> (text command, field schema)
+MESSAGES = {
+    OP_REGISTER:            ("REGISTER", "sssss"),        # name role ip udp_port tcp_port
+    OP_REGISTERED:          ("REGISTERED", ""),
+    OP_REGISTER_DENIED:     ("REGISTER-DENIED", "s"),     # reason
+    OP_LOGIN:               ("LOGIN", "ss"),              # name role
+    OP_LOGIN_OK:            ("LOGIN_OK", ""),
+    OP_LOGIN_FAIL:          ("LOGIN_FAIL", "s"),          # reason
+    OP_DE_REGISTER:         ("DE-REGISTER", "s"),         # name
+    OP_DE_REGISTERED:       ("DE-REGISTERED", ""),
+    OP_LIST_ITEM:           ("LIST_ITEM", "sssdi"),       # user item description price duration
+    OP_ITEM_LISTED:         ("ITEM_LISTED", ""),
+    OP_LIST_DENIED:         ("LIST-DENIED", "s"),         # reason
+    OP_SUBSCRIBE:           ("SUBSCRIBE", "ss"),          # buyer item-or-glob ("laptop*")
+    OP_SUBSCRIBED:          ("SUBSCRIBED", ""),
+    OP_SUBSCRIPTION_DENIED: ("SUBSCRIPTION-DENIED", "s"), # reason
+    OP_DE_SUBSCRIBE:        ("DE-SUBSCRIBE", "ss"),       # buyer item
+    OP_AUCTION_ANNOUNCE:    ("AUCTION_ANNOUNCE", "sssdi"),# item_id item description price time_left
+    OP_BATCH:               ("BATCH", ""),                # fields are the enclosed raw frames
+    OP_STATS:               ("STATS", ""),
+    OP_STATS_REPLY:         ("STATS_REPLY", "s"),         # metrics JSON
+    OP_PROFILE:             ("PROFILE", "s"),             # start | stop | status
+    OP_PROFILE_REPLY:       ("PROFILE_REPLY", "s"),       # status message
+    OP_SEARCH:              ("SEARCH", "ssis"),           # order cursor limit query
+    OP_BROWSE:              ("BROWSE", "ssi"),            # order cursor limit
+    OP_SEARCH_RESULTS:      ("SEARCH_RESULTS", "iss"),    # total next_cursor results JSON
+    OP_SEARCH_DENIED:       ("SEARCH-DENIED", "s"),       # reason
+    OP_BID:                 ("BID", "ssd"),               # buyer item_id amount
+    OP_BID_ACCEPTED:        ("BID-ACCEPTED", "sdi"),      # item_id price time_left
+    OP_BID_REJECTED:        ("BID-REJECTED", "sd"),       # reason current_price
+    OP_SESSION:             ("SESSION", "ss"),            # name tcp_port
+    OP_SESSION_OK:          ("SESSION_OK", ""),
+    OP_SESSION_DENIED:      ("SESSION-DENIED", "s"),      # reason
+    OP_SYNC:                ("SYNC", "sS"),               # name state JSON
+    OP_WINNER:              ("WINNER", "sssds"),          # buyer item_id item price seller
+    OP_SOLD:                ("SOLD", "sssds"),            # seller item_id item price buyer
+    OP_NON_OFFER:           ("NON_OFFER", "sss"),         # seller item_id item
+    OP_MCAST_INFO:          ("MCAST_INFO", ""),
+    OP_MCAST_CONFIG:        ("MCAST_CONFIG", "sii"),      # base_group groups port
+    OP_MCAST_JOIN:          ("MCAST_JOIN", "ss"),         # buyer item
+    OP_MCAST_OK:            ("MCAST_OK", ""),
+    OP_MCAST_DENIED:        ("MCAST-DENIED", "s"),        # reason
+    OP_AUCTION_SNAPSHOT:    ("AUCTION_SNAPSHOT", "sissdi"),# item_id version item description price time_left
+    OP_AUCTION_DELTA:       ("AUCTION_DELTA", "ssiidi"),  # item_id item version changed price time_left
+    OP_RESYNC:              ("RESYNC", "ss"),             # buyer item_id
+    OP_RESYNC_DENIED:       ("RESYNC-DENIED", "s"),       # reason
+}
+
+TEXT_OPCODES = {name: opcode for opcode, (name, _) in MESSAGES.items()}
+
+# Text forms of these carry no request id
+NO_RQ = {OP_AUCTION_ANNOUNCE, OP_SYNC, OP_WINNER, OP_SOLD, OP_NON_OFFER, OP_AUCTION_DELTA}
+
+# Text forms of these end in free text (a reason, the stats JSON, a query) that may contain spaces
+REASON_TAIL = {OP_REGISTER_DENIED, OP_LOGIN_FAIL, OP_LIST_DENIED, OP_SUBSCRIPTION_DENIED, OP_STATS_REPLY,
+               OP_PROFILE_REPLY, OP_SEARCH, OP_SEARCH_RESULTS, OP_SEARCH_DENIED, OP_SESSION_DENIED, OP_SYNC,
+               OP_MCAST_DENIED, OP_RESYNC_DENIED}
+
+# Replies that refuse a command; fields[0] is the reason
+DENIALS = {OP_REGISTER_DENIED, OP_LOGIN_FAIL, OP_LIST_DENIED, OP_SUBSCRIPTION_DENIED, OP_SEARCH_DENIED,
+           OP_BID_REJECTED, OP_SESSION_DENIED, OP_MCAST_DENIED, OP_RESYNC_DENIED}
+
+def command_name(opcode):
+    return MESSAGES[opcode][0]
+
+# ----------------------------
+# Decoding
+# ----------------------------
+def decode(data):
+    """
+    Returns (version, opcode, rq, fields) or None for anything malformed or
+    unknown. Text fields stay strings; binary fields come back typed. For
+    OP_BATCH, fields is the list of enclosed frames (bytes), undecoded.
+    """
+    if data and data[0] == MAGIC:
+        return decode_binary(data)
+    if data[:5].upper() == b"BATCH":
+        return decode_text_batch(data)
+    return decode_text(data)
+
+def decode_text_batch(data):
+    lines = data.split(b"\n")
+    header = lines[0].split()
+    if len(header) < 2:
+        return None
+    frames = [line for line in lines[1:] if line.strip()]
+    return TEXT_VERSION, OP_BATCH, header[1].decode(errors="replace"), frames
+
+def decode_text(data):
+    try:
+        parts = data.decode().split()
+    except UnicodeDecodeError:
+        return None
+    if len(parts) < 2:
+        return None
+    opcode = TEXT_OPCODES.get(parts[0].upper())
+    if opcode is None:
+        return None
+    if opcode in NO_RQ:
+        rq, fields = None, parts[1:]
+    else:
+        rq, fields = parts[1], parts[2:]
+    schema = MESSAGES[opcode][1]
+    if len(fields) < len(schema):
+        return None
+    if opcode in REASON_TAIL:
+        fields = fields[:len(schema) - 1] + [" ".join(fields[len(schema) - 1:])]
+    return TEXT_VERSION, opcode, rq, fields[:len(schema)]
+
+def decode_binary(data):
+    try:
+        _, version, opcode, rq = HEADER.unpack_from(data)
+        if opcode == OP_BATCH:
+            return version, opcode, rq, decode_batch_body(data)
+        schema = MESSAGES[opcode][1]
+        offset = HEADER.size
+        fields = []
+        for kind in schema:
+            if kind in "sS":
+                prefix = FIELD_LEN if kind == "s" else LONG_FIELD_LEN
+                (length,) = prefix.unpack_from(data, offset)
+                offset += prefix.size
+                end = offset + length
+                if end > len(data):
+                    return None
+                fields.append(data[offset:end].decode())
+                offset = end
+            else:
+                packer = FIELD_PACKERS[kind]
+                fields.append(packer.unpack_from(data, offset)[0])
+                offset += packer.size
+    except (struct.error, KeyError, UnicodeDecodeError):
+        return None
+    if version == TEXT_VERSION:
+        return None
+    return version, opcode, rq, fields
+
+def decode_batch_body(data):
+    (count,) = FIELD_LEN.unpack_from(data, HEADER.size)
+    offset = HEADER.size + FIELD_LEN.size
+    frames = []
+    for _ in range(count):
+        (length,) = FIELD_LEN.unpack_from(data, offset)
+        offset += FIELD_LEN.size
+        frames.append(data[offset:offset + length])
+        offset += length
+    if offset > len(data):
+        raise struct.error("truncated batch")
+    return frames
+
+# ----------------------------
+# Encoding
+# ----------------------------
+def encode(version, opcode, rq, fields=()):
+    if version == TEXT_VERSION:
+        return encode_text(opcode, rq, fields).encode()
+    return encode_binary(version, opcode, rq, fields)
+
+def encode_text(opcode, rq, fields=()):
+    name = MESSAGES[opcode][0]
+    if opcode in NO_RQ:
+        return " ".join([name] + [str(f) for f in fields])
+    return " ".join([name, str(rq)] + [str(f) for f in fields])
+
+def encode_binary(version, opcode, rq, fields=()):
+    schema = MESSAGES[opcode][1]
+    chunks = [HEADER.pack(MAGIC, version, opcode, int(rq or 0))]
+    for kind, value in zip(schema, fields):
+        if kind in "sS":
+            raw = str(value).encode()
+            chunks.append((FIELD_LEN if kind == "s" else LONG_FIELD_LEN).pack(len(raw)))
+            chunks.append(raw)
+        elif kind == "d":
+            chunks.append(FIELD_PACKERS["d"].pack(float(value)))
+        else:
+            chunks.append(FIELD_PACKERS["i"].pack(int(value)))
+    return b"".join(chunks)
+
+def encode_batch(version, rq, frames):
+    if version == TEXT_VERSION:
+        return b"\n".join([f"BATCH {rq}".encode()] + list(frames))
+    chunks = [HEADER.pack(MAGIC, version, OP_BATCH, int(rq or 0)), FIELD_LEN.pack(len(frames))]
+    for frame in frames:
+        chunks.append(FIELD_LEN.pack(len(frame)))
+        chunks.append(frame)
+    return b"".join(chunks)
+
+def pack_batches(version, rq, frames, limit=BATCH_PAYLOAD_LIMIT):
+    """
+    Greedily packs encoded frames into as few BATCH datagrams of at most
+    `limit` bytes as possible (a single oversized frame gets its own).
+    """
+    overhead = HEADER.size + FIELD_LEN.size
+    datagrams = []
+    current = []
+    size = overhead
+    for frame in frames:
+        cost = len(frame) + FIELD_LEN.size
+        if current and size + cost > limit:
+            datagrams.append(encode_batch(version, rq, current))
+            current = []
+            size = overhead
+        current.append(frame)
+        size += cost
+    if current:
+        datagrams.append(encode_batch(version, rq, current))
+    return datagrams
+
+def negotiate(offered_version):
+    return min(offered_version, PROTOCOL_VERSION)
+
+def describe(version, opcode, rq, fields):
+    """
+    Text rendering of any message, for logs.
+    """
+    if opcode == OP_BATCH:
+        text = f"BATCH {rq} [{len(fields)} messages]"
+    else:
+        text = encode_text(opcode, rq, fields)
+    return text if version == TEXT_VERSION else f"{text} [v{version}]"
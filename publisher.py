@@ -0,0 +1,348 @@
+import math
+import struct
+import threading
+import time
+
+from protocol import (encode, pack_batches, OP_AUCTION_ANNOUNCE, OP_AUCTION_SNAPSHOT, OP_AUCTION_DELTA,
+                      BATCH_MIN_VERSION, DELTA_MIN_VERSION, CHANGED_PRICE, CHANGED_DEADLINE, CHANGED_CLOSED)
+from multicast import MULTICAST_VERSION
+
+# ----------------------------
+# ItemVersions
+# ----------------------------
+class ItemVersions:
+    """
+    The last announced state (price, deadline, closed) of every item and its
+    version number, which AUCTION_DELTA's `changed` mask is worked out
+    against. Versions are assigned when the publisher flushes, so changes
+    that land between two flushes make one version.
+
+    Kept in memory only: after a restart every item starts again from a
+    version 1 snapshot, and clients take snapshots as they come. Guarded by
+    the engine lock; price and end_time are passed in as read under the
+    item's stripe, since BID changes them holding only that.
+    """
+    def __init__(self):
+        self.entries = {}   # item_id -> [version, price, end_time, closed]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def advance(self, item_id, price, end_time, closed):
+        """
+        Records an item's current state. Returns (version, changed): changed
+        is None for an item never announced before (version 1), otherwise
+        the CHANGED_* mask against the previous version; 0 if nothing
+        changed, in which case the version stays.
+        """
+        entry = self.entries.get(item_id)
+        if entry is None:
+            self.entries[item_id] = [1, price, end_time, closed]
+            return 1, None
+        changed = 0
+        if price != entry[1]:
+            changed |= CHANGED_PRICE
+        if end_time != entry[2]:
+            changed |= CHANGED_DEADLINE
+        if closed and not entry[3]:
+            changed |= CHANGED_CLOSED
+        if changed:
+            entry[:] = [entry[0] + 1, price, end_time, closed]
+        return entry[0], changed
+
+    def forget(self, item_id):
+        self.entries.pop(item_id, None)
+
+    def snapshot_fields(self, item, now=None):
+        """
+        AUCTION_SNAPSHOT fields for item as last announced (RESYNC). An
+        item not announced yet comes as version 0 with its current state;
+        the snapshot its first announcement brings replaces it.
+        """
+        if now is None:
+            now = time.time()
+        version, price, end_time, _ = self.entries.get(item.item_id) or (0, item.current_price, item.end_time, False)
+        return (item.item_id, version, item.item_name, item.description, price,
+                max(0, math.ceil(end_time - now)))
+
+# ----------------------------
+# AnnouncementPublisher
+# ----------------------------
+class AnnouncementPublisher:
+    """
+    Change-driven AUCTION_ANNOUNCE fan-out.
+
+    The engine calls notify_item() when an item is listed, changes price or
+    closes, and notify_subscription() when a buyer subscribes. Each call
+    queues (buyer, item) pairs for exactly the affected buyers; repeated
+    changes to the same pair before the next flush collapse into one
+    datagram carrying the latest state.
+
+    Buyers at DELTA_MIN_VERSION get an item's full state once, as
+    AUCTION_SNAPSHOT (a new item, a new subscription), and after that
+    AUCTION_DELTA with only the fields changed since the previous version
+    (see ItemVersions). A flush that makes a new version sends it to every
+    subscriber of the item, so their versions never skip. Older buyers keep
+    getting the full AUCTION_ANNOUNCE.
+
+    With engine.multicast set, pairs whose buyer joined the item's group
+    collapse into one copy per item for the group (see multicast.py); the
+    rest stay unicast.
+
+    keepalive_interval > 0 additionally re-announces every live
+    (item, buyer) pair at that rate, so clients that missed a datagram
+    eventually catch up (delta clients get a changed-0 delta naming the
+    current version, and RESYNC if they are behind).
+
+    The threaded server runs publish_loop(); an event loop can instead set
+    wakeup to its own callback and drain with flush_pending().
+    """
+    def __init__(self, engine, keepalive_interval=0, coalesce_delay=0.02):
+        self.engine = engine
+        self.keepalive_interval = keepalive_interval
+        self.coalesce_delay = coalesce_delay
+
+        # (buyer_name, item_id) -> (item, needs a snapshot); buyer None means
+        # every subscriber of the item, resolved at flush time (see notify_changed)
+        self.pending = {}
+        self.versions = ItemVersions()
+        self.cond = threading.Condition()
+        self.running = False
+        self.wakeup = None
+
+    def queue_depth(self):
+        return len(self.pending)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.publish_loop, daemon=True).start()
+        if self.keepalive_interval > 0:
+            threading.Thread(target=self.keepalive_loop, daemon=True).start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    # ----- Producers (called with the engine lock held) -----
+
+    def notify_item(self, item):
+        """
+        Queues item for every buyer subscribed to its name. Pass the Item
+        itself: closed items are announced from it after removal. Returns
+        False if nobody is subscribed (nothing queued).
+        """
+        buyers = self.engine.store.buyers_for(item.item_name)
+        if not buyers:
+            return False
+        with self.cond:
+            for buyer_name in buyers:
+                key = (buyer_name, item.item_id)
+                queued = self.pending.get(key)
+                # A snapshot still owed to a new subscriber stays owed
+                self.pending[key] = (item, queued is not None and queued[1])
+            self.signal()
+        return True
+
+    def notify_subscription(self, buyer_name, item_name):
+        items = self.engine.store.items_matching(item_name)
+        if not items:
+            return
+        with self.cond:
+            for item in items:
+                self.pending[(buyer_name, item.item_id)] = (item, True)
+            self.signal()
+
+    # ----- Producers without the engine lock -----
+
+    def notify_changed(self, item):
+        """
+        notify_item() for callers holding only an item stripe (BID): finding
+        the subscribers reads the subscription indexes, so that waits for
+        flush(), which holds the engine lock. A burst of bids on one item
+        costs one queue entry.
+        """
+        with self.cond:
+            self.pending[(None, item.item_id)] = (item, False)
+            self.signal()
+
+    def signal(self):
+        # Caller holds self.cond
+        if self.wakeup is not None:
+            self.wakeup()
+        else:
+            self.cond.notify()
+
+    # ----- Background tasks -----
+
+    def publish_loop(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+            # Let a burst of changes land before draining
+            if self.coalesce_delay:
+                time.sleep(self.coalesce_delay)
+            self.flush_pending()
+
+    def flush_pending(self):
+        try:
+            self.flush(self.take_pending())
+        except Exception as e:
+            # Lose this batch, not every later announcement
+            self.engine.metrics.incr("announce.flush_failed")
+            self.engine.log(f"(UDP) Announcement flush failed: {e!r}", "announce")
+
+    def take_pending(self):
+        with self.cond:
+            batch = self.pending
+            self.pending = {}
+        return batch
+
+    def flush(self, batch):
+        engine = self.engine
+        started = time.perf_counter()
+        now = time.time()
+        per_addr = {}   # (ip, port) -> (version, [frames])
+        per_group = {}  # multicast group -> { item_id: frame }
+        multicast = engine.multicast
+        deltas = 0
+        with engine.lock:
+            per_item = {}   # item_id -> (item, { buyer_name: needs a snapshot })
+            for (buyer_name, item_id), (item, snapshot) in batch.items():
+                buyers = per_item.setdefault(item_id, (item, {}))[1]
+                if buyer_name is None:
+                    for buyer_name in engine.store.buyers_for(item.item_name):
+                        buyers.setdefault(buyer_name, False)
+                else:
+                    buyers[buyer_name] = buyers.get(buyer_name, False) or snapshot
+            for item_id, (item, buyers) in per_item.items():
+                closed = engine.store.get_item(item_id) is None
+                # One copy per item: a BID changes both under the stripe alone
+                with engine.item_lock(item_id):
+                    price, end_time = item.current_price, item.end_time
+                item_version, changed = self.versions.advance(item_id, price, end_time, closed)
+                if changed:
+                    # Everyone gets the new version, or their next delta would skip one
+                    for buyer_name in engine.store.buyers_for(item.item_name):
+                        buyers.setdefault(buyer_name, False)
+                if closed:
+                    self.versions.forget(item_id)
+                fields = self.item_fields(item, price, end_time, item_version, changed, now)
+                encoded = {}    # (protocol version, opcode) -> frame
+                addressed = set()   # (addr, opcode): buyers sharing a client's port need one copy
+                for buyer_name, owed in buyers.items():
+                    # A snapshot owed to a new subscriber is theirs alone; groups carry versions
+                    if not owed and multicast is not None and multicast.covers(buyer_name, item.item_name):
+                        frames = per_group.setdefault(multicast.group_for(item.item_name), {})
+                        if item_id not in frames:
+                            opcode = OP_AUCTION_SNAPSHOT if changed is None else OP_AUCTION_DELTA
+                            data = self.encode_frame(MULTICAST_VERSION, opcode, fields[opcode])
+                            if data is not None:
+                                frames[item_id] = data
+                        continue
+                    buyer_reg = engine.store.get_user(buyer_name)
+                    if not buyer_reg:
+                        continue
+                    version = buyer_reg.protocol
+                    if version < DELTA_MIN_VERSION:
+                        opcode = OP_AUCTION_ANNOUNCE
+                    elif owed or changed is None:
+                        opcode = OP_AUCTION_SNAPSHOT
+                    else:
+                        opcode = OP_AUCTION_DELTA
+                    if (buyer_reg.addr, opcode) in addressed:
+                        continue
+                    addressed.add((buyer_reg.addr, opcode))
+                    if opcode == OP_AUCTION_DELTA:
+                        deltas += 1
+                    if (version, opcode) not in encoded:
+                        encoded[(version, opcode)] = self.encode_frame(version, opcode, fields[opcode])
+                    data = encoded[(version, opcode)]
+                    if data is None:
+                        continue
+                    per_addr.setdefault(buyer_reg.addr, (version, []))[1].append(data)
+        sent = 0
+        sent_bytes = 0
+        for addr, (version, frames) in per_addr.items():
+            # Pack a buyer's updates into MTU-sized BATCHes when it can read them
+            if version >= BATCH_MIN_VERSION and len(frames) > 1:
+                datagrams = pack_batches(version, 0, frames)
+            else:
+                datagrams = frames
+            try:
+                for data in datagrams:
+                    engine.sendto(data, addr)
+                    sent += 1
+                    sent_bytes += len(data)
+            except (OSError, OverflowError) as e:
+                if not engine.running:
+                    # Socket closed during shutdown
+                    return
+                # One unreachable buyer (an address that does not resolve, say)
+                # must not cost the others their announcements
+                self.send_failed(addr, e)
+        for group, frames in per_group.items():
+            frames = list(frames.values())
+            datagrams = pack_batches(MULTICAST_VERSION, 0, frames) if len(frames) > 1 else frames
+            try:
+                for data in datagrams:
+                    multicast.send(data, group)
+                    sent += 1
+                    sent_bytes += len(data)
+            except OSError as e:
+                if not engine.running:
+                    return
+                self.send_failed(group, e)
+        metrics = engine.metrics
+        if per_group:
+            metrics.incr("announce.multicast_messages", sum(len(frames) for frames in per_group.values()))
+        metrics.incr("announce.messages", sum(len(frames) for _, frames in per_addr.values()))
+        metrics.incr("announce.deltas", deltas)
+        metrics.incr("announce.datagrams", sent)
+        metrics.incr("announce.bytes", sent_bytes)
+        metrics.observe("announce.flush", time.perf_counter() - started)
+        engine.profiler.record("announce.flush", started)
+
+    def send_failed(self, destination, error):
+        self.engine.metrics.incr("announce.send_failed")
+        self.engine.log(f"(UDP) Cannot announce to {destination}: {error!r}", "announce")
+
+    def encode_frame(self, version, opcode, fields):
+        """
+        One announcement frame, or None if fields do not fit the schema (an
+        out-of-range number): that item is skipped, not the whole flush.
+        """
+        try:
+            return encode(version, opcode, None, fields)
+        except (struct.error, ValueError, OverflowError) as e:
+            self.engine.metrics.incr("announce.encode_failed")
+            self.engine.log(f"(UDP) Cannot encode announcement for item {fields[0]}: {e!r}", "announce")
+            return None
+
+    def item_fields(self, item, price, end_time, version, changed, now):
+        """
+        opcode -> fields for each way of announcing item at version, with
+        the price and end_time flush() read for it.
+        """
+        left = max(0, math.ceil(end_time - now))
+        changed = changed or 0
+        return {
+            OP_AUCTION_ANNOUNCE: (item.item_id, item.item_name, item.description, price, left),
+            OP_AUCTION_SNAPSHOT: (item.item_id, version, item.item_name, item.description, price, left),
+            OP_AUCTION_DELTA: (item.item_id, item.item_name, version, changed,
+                               price if changed & CHANGED_PRICE else 0,
+                               left if changed & CHANGED_DEADLINE else 0),
+        }
+
+    def keepalive_loop(self):
+        while self.running:
+            time.sleep(self.keepalive_interval)
+            self.refresh_all()
+
+    def refresh_all(self):
+        with self.engine.lock:
+            for item in self.engine.store.item_list():
+                self.notify_item(item)
@@ -0,0 +1,120 @@
+from protocol import TEXT_VERSION
+
+# ----------------------------
+# Record types
+# ----------------------------
+# State records with typed, parsed-once fields. __slots__ keeps each one to a
+# few pointers (no per-instance dict). to_dict() / from_dict() are the JSON
+# forms used by the journal, legacy files and the sharding IPC; from_dict()
+# accepts the old string-typed ports and prices.
+
+class User:
+    __slots__ = ("name", "role", "ip", "udp_port", "tcp_port", "protocol", "addr")
+
+    def __init__(self, name, role, ip, udp_port, tcp_port, protocol=TEXT_VERSION):
+        self.name = name
+        self.role = role
+        self.ip = ip
+        self.udp_port = int(udp_port)
+        self.tcp_port = int(tcp_port)
+        self.protocol = int(protocol)
+        self.addr = (ip, self.udp_port)     # announcement destination, resolved once
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["role"], data["ip"], data["udp_port"], data["tcp_port"],
+                   data.get("protocol", TEXT_VERSION))
+
+    def to_dict(self):
+        return {"name": self.name, "role": self.role, "ip": self.ip, "udp_port": self.udp_port,
+                "tcp_port": self.tcp_port, "protocol": self.protocol}
+
+    def copy(self):
+        return User(self.name, self.role, self.ip, self.udp_port, self.tcp_port, self.protocol)
+
+    def __eq__(self, other):
+        return isinstance(other, User) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"User({self.name!r}, {self.role!r}, {self.ip!r}, {self.udp_port}, {self.tcp_port})"
+
+class Item:
+    __slots__ = ("item_id", "seller_name", "item_name", "description", "start_price", "duration",
+                 "end_time", "current_price", "high_bidder")
+
+    def __init__(self, item_id, seller_name, item_name, description, start_price, duration, end_time,
+                 current_price=None, high_bidder=None):
+        self.item_id = item_id
+        self.seller_name = seller_name
+        self.item_name = item_name
+        self.description = description
+        self.start_price = float(start_price)
+        self.duration = int(duration)
+        self.end_time = float(end_time)
+        # Highest accepted bid so far; the start price until someone bids
+        self.current_price = self.start_price if current_price is None else float(current_price)
+        self.high_bidder = high_bidder
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["item_id"], data["seller_name"], data["item_name"], data["description"],
+                   data["start_price"], data["duration"], data["end_time"],
+                   data.get("current_price"), data.get("high_bidder"))
+
+    def to_dict(self):
+        return {"item_id": self.item_id, "seller_name": self.seller_name, "item_name": self.item_name,
+                "description": self.description, "start_price": self.start_price,
+                "duration": self.duration, "end_time": self.end_time,
+                "current_price": self.current_price, "high_bidder": self.high_bidder}
+
+    def copy(self):
+        return Item(self.item_id, self.seller_name, self.item_name, self.description,
+                    self.start_price, self.duration, self.end_time, self.current_price, self.high_bidder)
+
+    def __eq__(self, other):
+        return isinstance(other, Item) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Item({self.item_id!r}, {self.item_name!r} by {self.seller_name!r})"
+
+class Subscription:
+    __slots__ = ("buyer_name", "item_name")
+
+    def __init__(self, buyer_name, item_name):
+        self.buyer_name = buyer_name
+        self.item_name = item_name
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["buyer_name"], data["item_name"])
+
+    def to_dict(self):
+        return {"buyer_name": self.buyer_name, "item_name": self.item_name}
+
+    def copy(self):
+        return Subscription(self.buyer_name, self.item_name)
+
+    def __eq__(self, other):
+        return isinstance(other, Subscription) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Subscription({self.buyer_name!r}, {self.item_name!r})"
+
+def validate_ports(user):
+    """
+    Raises ValueError unless user's ports can be sent to: udp_port 1..65535,
+    tcp_port 0..65535 (0: no session channel, see session_channel.session_port).
+    REGISTER checks new users with this; recovery does not, so state written
+    before the check still loads.
+    """
+    if not 0 < user.udp_port <= 65535:
+        raise ValueError(f"udp_port out of range: {user.udp_port}")
+    if not 0 <= user.tcp_port <= 65535:
+        raise ValueError(f"tcp_port out of range: {user.tcp_port}")
+
+def to_json(record):
+    """
+    json.dumps(default=...) hook: serializes records inside journal entries
+    and IPC messages.
+    """
+    return record.to_dict()
@@ -0,0 +1,232 @@
+import heapq
+import random
+import threading
+import time
+from collections import deque
+
+# Request ids share the binary header's uint32 rq field; 0 is reserved for
+# unsolicited messages (announcements, publisher BATCHes).
+RQ_LIMIT = 2 ** 32
+
+# ----------------------------
+# PendingRequest
+# ----------------------------
+class PendingRequest:
+    """
+    One tracked request. info is the caller's own context (what the reply
+    handler needs); callback(request, reply) runs exactly once, with reply
+    set to (version, opcode, fields) or None if the request was abandoned.
+    """
+    def __init__(self, rq, opcode, fields, info, callback):
+        self.rq = rq            # None until admitted into the window
+        self.opcode = opcode
+        self.fields = fields
+        self.info = info
+        self.callback = callback
+        self.attempts = 0
+        self.first_sent = None
+        self.last_sent = None
+        self.deadline = None
+
+# ----------------------------
+# RttEstimator
+# ----------------------------
+class RttEstimator:
+    """
+    Smoothed RTT / variance estimate (RFC 6298). Only first transmissions
+    are sampled (Karn's rule): a reply to a retransmitted request cannot be
+    matched to the send it answers.
+    """
+    def __init__(self, initial_rto=1.0, min_rto=0.2, max_rto=8.0):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+    def backoff(self, attempts):
+        """
+        Timeout for the given attempt number (1 = first send), doubling per
+        retransmission.
+        """
+        return min(self.max_rto, self.rto * (2 ** (attempts - 1)))
+
+# ----------------------------
+# RequestTracker
+# ----------------------------
+class RequestTracker:
+    """
+    Client-side reliability for request/reply commands over UDP.
+
+    - Request ids are a wrapping counter from a random start, skipping any id
+      still in flight, so two outstanding requests never share an id.
+    - At most `window` requests are in flight; the rest wait in a FIFO and go
+      out as replies (or give-ups) free slots.
+    - Unanswered requests are resent after an RTT-derived timeout that
+      doubles on every retry; after max_retries resends the request is
+      dropped and its callback gets None, so nothing lingers forever.
+
+    send(opcode, rq, fields) does the actual transmit. The owner feeds
+    replies to complete() and either calls start() for a timer thread or
+    drives poll() itself.
+    """
+    def __init__(self, send, window=16, max_retries=4, initial_rto=1.0, min_rto=0.2, max_rto=8.0):
+        self.send = send
+        self.window = window
+        self.max_retries = max_retries
+        self.rtt = RttEstimator(initial_rto, min_rto, max_rto)
+
+        self.next_rq = random.randrange(1, RQ_LIMIT)
+        self.inflight = {}      # rq -> PendingRequest
+        self.waiting = deque()  # PendingRequests held back by the window
+        self.timers = []        # heap of (deadline, rq); stale entries skipped
+        self.cond = threading.Condition()
+        self.running = False
+
+    def __len__(self):
+        return len(self.inflight) + len(self.waiting)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.timer_loop, daemon=True).start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    # ----- Request ids -----
+
+    def allocate_rq(self):
+        # Caller holds self.cond
+        while True:
+            rq = self.next_rq
+            self.next_rq = rq + 1 if rq + 1 < RQ_LIMIT else 1
+            if rq not in self.inflight:
+                return rq
+
+    # ----- Sending -----
+
+    def submit(self, opcode, fields, info=None, callback=None, transmit=True):
+        """
+        Tracks a new request and returns it. request.rq is assigned once the
+        window admits it (None while it waits). With transmit=False the
+        caller sends the first copy of an admitted request itself (e.g.
+        inside a BATCH); later admissions and retransmissions go through
+        send().
+        """
+        with self.cond:
+            request = PendingRequest(None, opcode, fields, info, callback)
+            self.waiting.append(request)
+            admitted = self.admit_waiting()
+        for queued in admitted:
+            if transmit or queued is not request:
+                self.transmit(queued)
+        return request
+
+    def arm(self, request):
+        # Caller holds self.cond
+        now = time.monotonic()
+        request.attempts += 1
+        if request.first_sent is None:
+            request.first_sent = now
+        request.last_sent = now
+        request.deadline = now + self.rtt.backoff(request.attempts)
+        heapq.heappush(self.timers, (request.deadline, request.rq))
+
+    def transmit(self, request):
+        try:
+            self.send(request.opcode, request.rq, request.fields)
+        except OSError:
+            pass  # socket closing; the timer gives up on it eventually
+
+    def admit_waiting(self):
+        # Caller holds self.cond; returns the requests to transmit
+        admitted = []
+        while self.waiting and len(self.inflight) < self.window:
+            request = self.waiting.popleft()
+            request.rq = self.allocate_rq()
+            self.inflight[request.rq] = request
+            self.arm(request)
+            admitted.append(request)
+        if admitted:
+            self.cond.notify()
+        return admitted
+
+    # ----- Replies -----
+
+    def complete(self, rq, reply=None):
+        """
+        Matches a reply to its request. Returns the PendingRequest (after
+        running its callback) or None for unknown / already finished ids,
+        e.g. the second reply to a retransmitted command.
+        """
+        try:
+            rq = int(rq)
+        except (TypeError, ValueError):
+            return None
+        with self.cond:
+            request = self.inflight.pop(rq, None)
+            if request is None:
+                return None
+            if request.attempts == 1:
+                self.rtt.sample(time.monotonic() - request.last_sent)
+            admitted = self.admit_waiting()
+        for waiting in admitted:
+            self.transmit(waiting)
+        if request.callback is not None:
+            request.callback(request, reply)
+        return request
+
+    # ----- Timers -----
+
+    def poll(self, now=None):
+        """
+        Resends or abandons every request whose timeout has passed. Returns
+        the next deadline (monotonic) or None when nothing is in flight.
+        """
+        if now is None:
+            now = time.monotonic()
+        resend = []
+        abandoned = []
+        with self.cond:
+            while self.timers and self.timers[0][0] <= now:
+                deadline, rq = heapq.heappop(self.timers)
+                request = self.inflight.get(rq)
+                if request is None or request.deadline != deadline:
+                    continue
+                if request.attempts > self.max_retries:
+                    del self.inflight[rq]
+                    abandoned.append(request)
+                else:
+                    self.arm(request)
+                    resend.append(request)
+            resend.extend(self.admit_waiting())
+            next_deadline = self.timers[0][0] if self.timers else None
+        for request in resend:
+            self.transmit(request)
+        for request in abandoned:
+            if request.callback is not None:
+                request.callback(request, None)
+        return next_deadline
+
+    def timer_loop(self):
+        while True:
+            with self.cond:
+                if not self.running:
+                    return
+                delay = self.timers[0][0] - time.monotonic() if self.timers else None
+                if delay is None or delay > 0:
+                    self.cond.wait(delay)
+                if not self.running:
+                    return
+            self.poll()
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry cost on top of the reply bytes: key tuple, list, dict slot
+ENTRY_OVERHEAD = 200
+
+# ----------------------------
+# ReplyCache
+# ----------------------------
+class ReplyCache:
+    """
+    Encoded replies of recently executed commands, keyed by (client addr,
+    opcode, rq, hash of the fields). A client that retransmits because a
+    reply was lost gets the original answer replayed instead of the command
+    running again (a second LIST_ITEM, an AlreadySubscribed for its own
+    SUBSCRIBE).
+
+    Bounded three ways: entries older than ttl are dropped, and the least
+    recently used ones go once max_entries or max_bytes is exceeded. BIDs
+    run under per-item locks rather than the engine lock, so get() and put()
+    take a lock of their own.
+    """
+    def __init__(self, ttl=30.0, max_entries=8192, max_bytes=4 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # key -> (stored_at, [reply bytes], cost)
+        self.bytes = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                self.discard(key)
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, replies, now=None):
+        if now is None:
+            now = time.monotonic()
+        cost = ENTRY_OVERHEAD + sum(len(data) for data in replies)
+        with self.lock:
+            if key in self.entries:
+                self.discard(key)
+            self.entries[key] = (now, replies, cost)
+            self.bytes += cost
+            self.evict(now)
+
+    def discard(self, key):
+        _, _, cost = self.entries.pop(key)
+        self.bytes -= cost
+
+    def evict(self, now):
+        entries = self.entries
+        while entries:
+            key, (stored_at, _, cost) = next(iter(entries.items()))
+            if (now - stored_at <= self.ttl and len(entries) <= self.max_entries
+                    and self.bytes <= self.max_bytes):
+                break
+            del entries[key]
+            self.bytes -= cost
+            self.evictions += 1
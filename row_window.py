@@ -0,0 +1,75 @@
+# ----------------------------
+# RowWindow
+# ----------------------------
+class RowWindow:
+    """
+    The model behind a VirtualList, free of widgets: keyed records in
+    display (insertion) order and the index of the first visible row.
+    Positions are clamped lazily, so records can come and go while
+    scrolled without the window ever pointing past the end.
+    """
+    def __init__(self, visible_rows):
+        self.visible_rows = visible_rows
+        self.records = {}           # key -> record, in insertion order
+        self.order = []             # keys in display order
+        self.order_stale = False    # rebuilt from records after removals
+        self.top = 0                # index of the first visible row
+
+    def __len__(self):
+        return len(self.records)
+
+    # ----- Keyed updates -----
+
+    def set(self, key, record):
+        if key not in self.records and not self.order_stale:
+            self.order.append(key)
+        self.records[key] = record
+
+    def remove(self, key):
+        """
+        Returns False if key was not there.
+        """
+        if self.records.pop(key, None) is None:
+            return False
+        self.order_stale = True
+        return True
+
+    def replace_all(self, records):
+        self.records = dict(records)
+        self.order_stale = True
+
+    def keys(self):
+        if self.order_stale:
+            self.order = list(self.records)
+            self.order_stale = False
+        return self.order
+
+    # ----- Window -----
+
+    def visible(self):
+        """
+        The records on screen, top first: at most visible_rows of them.
+        """
+        keys = self.keys()
+        self.top = max(0, min(self.top, len(keys) - self.visible_rows))
+        return [self.records[key] for key in keys[self.top:self.top + self.visible_rows]]
+
+    def scrollbar_range(self):
+        """
+        (first, last) visible fractions of the whole list, for a scrollbar.
+        """
+        total = len(self.records)
+        if total <= self.visible_rows:
+            return 0, 1
+        return self.top / total, (self.top + self.visible_rows) / total
+
+    # ----- Scrolling -----
+
+    def scroll_rows(self, rows):
+        self.top = max(0, self.top + rows)
+
+    def scroll_pages(self, pages):
+        self.scroll_rows(pages * self.visible_rows)
+
+    def move_to(self, fraction):
+        self.top = max(0, int(fraction * len(self.records)))
@@ -0,0 +1,302 @@
+import bisect
+import heapq
+import re
+import threading
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+# Result orders: "ending" (soonest deadline first), "price" (cheapest first),
+# "price_desc" (dearest first). The first two keys of an entry are sort keys.
+ORDERS = ("ending", "price", "price_desc")
+ORDER_KEY = {"ending": 0, "price": 1, "price_desc": 1}
+
+DEFAULT_PAGE = 20
+MAX_PAGE = 50
+# Descriptions are cut to this in results, to keep a page in one datagram
+SNIPPET_CHARS = 80
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+def item_tokens(item):
+    return set(tokenize(item.item_name)) | set(tokenize(item.description or ""))
+
+def item_price(item):
+    return item.current_price
+
+def result_row(key, item):
+    """
+    One result as plain values (sort value, item_id, item, description
+    snippet, price, end_time), also the form sharded peers exchange.
+    """
+    return (key[0], key[1], item.item_name, (item.description or "")[:SNIPPET_CHARS], item_price(item),
+            item.end_time)
+
+# ----------------------------
+# Cursors
+# ----------------------------
+# A cursor is the sort key of the last result on the previous page,
+# "<value>/<item_id>"; "-" asks for the first page. Keys are unique (the
+# item id breaks ties), so pages never repeat or skip an item even while
+# listings come and go between requests.
+FIRST_PAGE = "-"
+
+def format_cursor(key):
+    return f"{key[0]!r}/{key[1]}"
+
+def parse_cursor(text):
+    """
+    Returns the key to resume after, None for the first page. Raises
+    ValueError for anything else.
+    """
+    if text == FIRST_PAGE:
+        return None
+    value, sep, item_id = text.rpartition("/")
+    if not sep or not item_id:
+        raise ValueError(f"bad cursor {text!r}")
+    return (float(value), item_id)
+
+# ----------------------------
+# SortedKeys
+# ----------------------------
+class SortedKeys:
+    """
+    Sorted list kept as short sorted blocks plus each block's last key.
+    bisect.insort on one flat list moves half the list per insert or delete
+    (milliseconds at a few hundred thousand keys); here only one block moves.
+    """
+    BLOCK = 512
+
+    def __init__(self):
+        self.blocks = []        # non-empty sorted lists, in order
+        self.maxes = []         # last key of each block
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, key):
+        blocks, maxes = self.blocks, self.maxes
+        self.size += 1
+        if not blocks:
+            blocks.append([key])
+            maxes.append(key)
+            return
+        index = bisect.bisect_left(maxes, key)
+        if index == len(maxes):
+            index -= 1
+            blocks[index].append(key)
+            maxes[index] = key
+        else:
+            bisect.insort(blocks[index], key)
+        block = blocks[index]
+        if len(block) > 2 * self.BLOCK:
+            half = self.BLOCK
+            blocks[index:index + 1] = [block[:half], block[half:]]
+            maxes[index:index + 1] = [block[half - 1], block[-1]]
+
+    def remove(self, key):
+        blocks, maxes = self.blocks, self.maxes
+        index = bisect.bisect_left(maxes, key)
+        if index == len(maxes):
+            return False
+        block = blocks[index]
+        position = bisect.bisect_left(block, key)
+        if block[position] != key:
+            return False
+        del block[position]
+        self.size -= 1
+        if block:
+            maxes[index] = block[-1]
+        else:
+            del blocks[index]
+            del maxes[index]
+        return True
+
+    def after(self, key=None):
+        """
+        Keys greater than key (all keys for None), ascending.
+        """
+        blocks = self.blocks
+        index = 0 if key is None else bisect.bisect_right(self.maxes, key)
+        if index < len(blocks) and key is not None:
+            block = blocks[index]
+            yield from block[bisect.bisect_right(block, key):]
+            index += 1
+        for block in blocks[index:]:
+            yield from block
+
+    def before(self, key=None):
+        """
+        Keys less than key (all keys for None), descending.
+        """
+        blocks = self.blocks
+        index = len(blocks) - 1
+        if key is not None:
+            index = bisect.bisect_left(self.maxes, key)
+            if index < len(blocks):
+                block = blocks[index]
+                yield from reversed(block[:bisect.bisect_left(block, key)])
+            index -= 1
+        for position in range(index, -1, -1):
+            yield from reversed(blocks[position])
+
+# ----------------------------
+# SearchIndex
+# ----------------------------
+class SearchIndex:
+    """
+    Inverted index over item_name and description tokens, plus the live
+    items kept sorted by deadline and by price:
+    - postings: token -> { item_id, ... }
+    - by_end / by_price: SortedKeys of (value, item_id)
+
+    search() intersects postings smallest-first, then ranks whichever side
+    is cheaper: few matches are ranked directly (heapq), many are found by
+    walking the sorted keys from the cursor and keeping members, which stops
+    after about limit * live / matches steps. BROWSE walks the keys alone.
+
+    Intersecting several common tokens is the one cost that grows with the
+    catalog, so those results are cached (up to CACHED_QUERIES) and kept
+    current as items come and go, making later pages and repeats cheap.
+
+    AuctionStore keeps it in step with its items. It has its own lock so
+    sharded peers can query it without taking the engine lock.
+    """
+    CACHED_QUERIES = 64
+    CACHE_MIN_POSTING = 2000    # cache a conjunction if its smallest posting is this big
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = {}      # token -> { item_id, ... }
+        self.entries = {}       # item_id -> (end key, price key, tokens, item)
+        self.by_end = SortedKeys()      # (end_time, item_id)
+        self.by_price = SortedKeys()    # (price, item_id)
+        self.cache = {}         # frozenset(tokens) -> { item_id, ... }, oldest first
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ----- Maintenance -----
+
+    def add(self, item):
+        item_id = item.item_id
+        with self.lock:
+            if item_id in self.entries:
+                self.discard(item_id)
+            tokens = item_tokens(item)
+            end_key = (item.end_time, item_id)
+            price_key = (item_price(item), item_id)
+            self.entries[item_id] = (end_key, price_key, tokens, item)
+            for token in tokens:
+                self.postings.setdefault(token, set()).add(item_id)
+            self.by_end.add(end_key)
+            self.by_price.add(price_key)
+            for query, ids in self.cache.items():
+                if query <= tokens:
+                    ids.add(item_id)
+
+    def remove(self, item_id):
+        with self.lock:
+            self.discard(item_id)
+
+    def refresh(self, item):
+        """
+        Re-sorts an item whose deadline or price changed (its tokens did not).
+        """
+        item_id = item.item_id
+        with self.lock:
+            entry = self.entries.get(item_id)
+            if entry is None:
+                return
+            old_end, old_price, tokens, _ = entry
+            end_key = (item.end_time, item_id)
+            price_key = (item_price(item), item_id)
+            if end_key != old_end:
+                self.by_end.remove(old_end)
+                self.by_end.add(end_key)
+            if price_key != old_price:
+                self.by_price.remove(old_price)
+                self.by_price.add(price_key)
+            self.entries[item_id] = (end_key, price_key, tokens, item)
+
+    def discard(self, item_id):
+        # caller holds self.lock
+        entry = self.entries.pop(item_id, None)
+        if entry is None:
+            return
+        end_key, price_key, tokens, _ = entry
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self.postings[token]
+        self.by_end.remove(end_key)
+        self.by_price.remove(price_key)
+        for ids in self.cache.values():
+            ids.discard(item_id)
+
+    # ----- Queries -----
+
+    def search(self, tokens, order="ending", after=None, limit=DEFAULT_PAGE):
+        """
+        Up to limit items containing every token (all live items if tokens
+        is empty), ranked by order and starting after the key `after`.
+        Returns (total matches, [(key, item), ...]).
+        """
+        which = ORDER_KEY[order]
+        descending = order == "price_desc"
+        with self.lock:
+            keys = self.by_price if which else self.by_end
+            if not tokens:
+                return len(keys), self.walk(keys, None, after, descending, limit)
+            matches = self.matching(tokens)
+            if not matches:
+                return 0, []
+            if len(matches) * len(matches) <= len(keys) * limit:
+                return len(matches), self.rank(matches, which, after, descending, limit)
+            return len(matches), self.walk(keys, matches, after, descending, limit)
+
+    def matching(self, tokens):
+        """
+        Ids of the items holding every token. Callers must not modify it.
+        """
+        query = frozenset(tokens)
+        cached = self.cache.pop(query, None)
+        if cached is not None:
+            self.cache[query] = cached      # most recently used last
+            return cached
+        postings = []
+        for token in query:
+            ids = self.postings.get(token)
+            if not ids:
+                return set()
+            postings.append(ids)
+        if len(postings) == 1:
+            return postings[0]
+        postings.sort(key=len)
+        matches = postings[0].intersection(*postings[1:])
+        if len(postings[0]) >= self.CACHE_MIN_POSTING:
+            if len(self.cache) >= self.CACHED_QUERIES:
+                del self.cache[next(iter(self.cache))]
+            self.cache[query] = matches
+        return matches
+
+    def rank(self, matches, which, after, descending, limit):
+        entries = self.entries
+        keys = [entries[item_id][which] for item_id in matches]
+        if after is not None:
+            keys = [key for key in keys if (key < after if descending else key > after)]
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        return [(key, entries[key[1]][3]) for key in pick(limit, keys)]
+
+    def walk(self, keys, matches, after, descending, limit):
+        entries = self.entries
+        found = []
+        for key in (keys.before(after) if descending else keys.after(after)):
+            if matches is None or key[1] in matches:
+                found.append((key, entries[key[1]][3]))
+                if len(found) == limit:
+                    break
+        return found
@@ -0,0 +1,156 @@
+import customtkinter as ctk
+import queue
+import time
+
+from expiry import time_left
+from virtual_list import VirtualList
+from log_pipeline import LogView
+
+# ----------------------------
+# ServerApp
+# ----------------------------
+class ServerApp(ctk.CTk):
+    """
+    Optional Tk observer for an AuctionEngine. Engine events arrive on
+    engine threads, get queued, and are applied on the Tk main loop as
+    keyed diffs to virtualized panes, so bursts of packets cost one
+    bounded-rate redraw of the visible rows rather than a rebuild.
+    """
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self.title("Server UI")
+        self.geometry("900x600")
+        self.resizable(False, False)
+
+        main_frame = ctk.CTkFrame(self)
+        main_frame.pack(fill="both", expand=True, padx=5, pady=5)
+
+        # Log area (read-only)
+        self.log_text = ctk.CTkTextbox(main_frame, width=880, height=150, state="disabled")
+        self.log_text.pack(pady=5)
+        # Drained in batches on the Tk loop, capped at the last 500 lines
+        self.log_view = LogView(self.log_text, engine.logs)
+
+        # Three virtualized lists: Active Users, Listed Items, Subscriptions
+        container_frame = ctk.CTkFrame(main_frame)
+        container_frame.pack(fill="both", expand=True, padx=5, pady=5)
+
+        # Active Users
+        users_frame = ctk.CTkFrame(container_frame)
+        users_frame.pack(side="left", fill="both", expand=True, padx=5)
+        ctk.CTkLabel(users_frame, text=f"Active Users (Max {engine.max_users})").pack()
+        self.active_users_list = VirtualList(users_frame, format_user, width=250, height=300,
+                                             profiler=engine.profiler, name="ui.redraw.users")
+        self.active_users_list.pack(pady=5, fill="both", expand=True)
+
+        # Listed Items (wider)
+        items_frame = ctk.CTkFrame(container_frame)
+        items_frame.pack(side="left", fill="both", expand=True, padx=5)
+        ctk.CTkLabel(items_frame, text="Listed Items").pack()
+        self.listed_items_list = VirtualList(items_frame, format_item, width=350, height=300,
+                                             profiler=engine.profiler, name="ui.redraw.items")
+        self.listed_items_list.pack(pady=5, fill="both", expand=True)
+
+        # Subscriptions
+        subs_frame = ctk.CTkFrame(container_frame)
+        subs_frame.pack(side="right", fill="both", expand=True, padx=5)
+        ctk.CTkLabel(subs_frame, text="Subscriptions (Buyer -> Item)").pack()
+        self.subscriptions_list = VirtualList(subs_frame, format_subscription, width=250, height=300,
+                                              profiler=engine.profiler, name="ui.redraw.subscriptions")
+        self.subscriptions_list.pack(pady=5, fill="both", expand=True)
+
+        # event -> (pane, lookup(key) -> record or None, load_all() -> {key: record})
+        store = self.engine.store
+        self.panes = {
+            "users_changed": (self.active_users_list, store.get_user,
+                              lambda: {u.name: u for u in store.user_list()}),
+            "items_changed": (self.listed_items_list, store.get_item,
+                              lambda: {i.item_id: i for i in store.item_list()}),
+            "subscriptions_changed": (self.subscriptions_list, lambda key: store.get_subscription(*key),
+                                      lambda: {(s.buyer_name, s.item_name): s
+                                               for s in store.subscription_list()}),
+        }
+        for event in self.panes:
+            self.apply_changes(event, None)
+
+        # Subscribe to engine events, then start it
+        self.events = queue.SimpleQueue()
+        self.engine.add_listener(self.on_engine_event)
+        self.engine.start()
+        self.drain_events()
+        self.tick_items_list()
+
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.engine.remove_listener(self.on_engine_event)
+        self.engine.stop()
+        self.destroy()
+
+    def on_engine_event(self, event, data):
+        # Called from engine threads: only enqueue, never touch widgets here
+        self.events.put((event, data))
+
+    def drain_events(self):
+        dirty = {}   # event -> set of changed keys, or None for a full reload
+        while True:
+            try:
+                event, data = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event in self.panes:
+                if data is None:
+                    dirty[event] = None
+                elif dirty.get(event, ()) is not None:
+                    dirty.setdefault(event, set()).update(data)
+        for event, keys in dirty.items():
+            self.apply_changes(event, keys)
+        self.after(100, self.drain_events)
+
+    def apply_changes(self, event, keys):
+        """
+        Applies a keyed diff to one pane: each changed key is re-read from
+        the store and set or removed; keys=None reloads the whole pane.
+        """
+        pane, lookup, load_all = self.panes[event]
+        started = time.perf_counter()
+        with self.engine.lock:
+            if keys is None:
+                records = load_all()
+            else:
+                records = {key: lookup(key) for key in keys}
+        if keys is None:
+            pane.replace_all(records)
+        else:
+            for key, record in records.items():
+                if record is None:
+                    pane.remove(key)
+                else:
+                    pane.set(key, record)
+        self.engine.profiler.record(f"ui.{event}", started)
+
+    def tick_items_list(self):
+        # Time left is derived from each item's end_time, so only the visible
+        # rows need re-rendering once a second; the engine does no per-second work.
+        self.listed_items_list.request_redraw()
+        self.after(1000, self.tick_items_list)
+
+# ----- Row formatting (visible rows only, see VirtualList) -----
+
+def format_user(user, now):
+    return f"{user.name} ({user.role})  UDP:{user.udp_port}  TCP:{user.tcp_port}"
+
+def format_item(item, now):
+    leader = f" ({item.high_bidder})" if item.high_bidder else ""
+    return (f"ID:{item.item_id} | {item.item_name} by {item.seller_name} | "
+            f"Price: {item.current_price}{leader} | TimeLeft: {time_left(item, now)}")
+
+def format_subscription(sub, now):
+    return f"{sub.buyer_name} -> {sub.item_name}"
+
+def run_ui(engine):
+    ctk.set_appearance_mode("System")
+    ctk.set_default_color_theme("blue")
+    app = ServerApp(engine)
+    app.mainloop()
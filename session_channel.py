@@ -0,0 +1,244 @@
+import select
+import socket
+import struct
+import threading
+from collections import OrderedDict, deque
+
+# ----------------------------
+# Framing
+# ----------------------------
+# A session connection carries a stream of frames: u32 length (network
+# order) + one protocol message, encoded exactly as it would be in a
+# datagram (see protocol.py). Only the server writes; the client reads.
+FRAME_LEN = struct.Struct(">I")
+MAX_FRAME = 16 * 1024 * 1024
+
+SESSION_CONNECTIONS = 64
+SESSION_LANES = 4
+CONNECT_TIMEOUT = 2.0
+SEND_TIMEOUT = 5.0
+
+def session_port(value):
+    """
+    Parses a tcp_port from REGISTER / SESSION. 0 means the client has no
+    session channel. Raises ValueError for anything else out of range.
+    """
+    port = int(value)
+    if not 0 <= port <= 65535:
+        raise ValueError(f"port out of range: {port}")
+    return port
+
+def read_frame(reader):
+    """
+    Next frame from a buffered reader (sock.makefile("rb")), or None once
+    the connection is closed. Raises ValueError for an oversized frame.
+    """
+    header = reader.read(FRAME_LEN.size)
+    if len(header) < FRAME_LEN.size:
+        return None
+    (length,) = FRAME_LEN.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes")
+    data = reader.read(length)
+    return data if len(data) == length else None
+
+# ----------------------------
+# SessionPool (server)
+# ----------------------------
+class SessionLane:
+    """
+    One sender thread with its own queue and connections. A destination
+    always maps to the same lane, so its messages arrive in order.
+    """
+    def __init__(self, pool, capacity):
+        self.pool = pool
+        self.capacity = capacity
+        self.queue = deque()            # (addr, data, fallback)
+        self.connections = OrderedDict()    # addr -> socket, least recently used first
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.send_loop, daemon=True)
+        self.thread.start()
+
+    def put(self, addr, data, fallback):
+        with self.cond:
+            self.queue.append((addr, data, fallback))
+            self.cond.notify()
+
+    def send_loop(self):
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                # Drain what was queued before stop()
+                if not self.queue:
+                    break
+                addr, data, fallback = self.queue.popleft()
+            self.deliver(addr, data, fallback)
+        for addr in list(self.connections):
+            self.close(addr)
+
+    def deliver(self, addr, data, fallback):
+        payload = FRAME_LEN.pack(len(data)) + data
+        # A reused connection may have died since its last use; retry once
+        # on a fresh one before giving up
+        for _ in range(2):
+            sock = self.connection(addr)
+            if sock is None:
+                break
+            try:
+                sock.sendall(payload)
+            except OSError:
+                self.close(addr)
+                continue
+            self.pool.count("session.sent")
+            return
+        self.pool.count("session.undeliverable")
+        if self.pool.on_undeliverable is not None:
+            self.pool.on_undeliverable(addr, data, fallback)
+
+    def connection(self, addr):
+        sock = self.connections.pop(addr, None)
+        if sock is not None:
+            # The client never writes, so readable means it closed (or reset)
+            readable, _, _ = select.select([sock], [], [], 0)
+            if not readable:
+                self.connections[addr] = sock
+                return sock
+            sock.close()
+        while len(self.connections) >= self.capacity:
+            _, oldest = self.connections.popitem(last=False)
+            oldest.close()
+            self.pool.count("session.evicted")
+        try:
+            sock = socket.create_connection(addr, timeout=self.pool.connect_timeout)
+        except OSError:
+            self.pool.count("session.connect_failed")
+            return None
+        sock.settimeout(self.pool.send_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections[addr] = sock
+        self.pool.count("session.connects")
+        return sock
+
+    def close(self, addr):
+        sock = self.connections.pop(addr, None)
+        if sock is not None:
+            sock.close()
+
+class SessionPool:
+    """
+    Server side of the session channel: persistent TCP connections to the
+    clients' registered tcp_ports, opened on first use and kept for every
+    later message to the same (ip, tcp_port), so a session pays for one
+    handshake. Used for what should not ride a single lossy datagram:
+    auction results, winner notices and SYNC (bulk state after LOGIN).
+
+    - At most max_connections stay open; opening one more closes the least
+      recently used.
+    - Destinations hash onto `lanes` sender threads, so a client that is
+      slow to accept stalls only its lane, never the caller: send() only
+      queues.
+    - A message that cannot be written even on a fresh connection goes to
+      on_undeliverable(addr, data, fallback) (the engine retries it as a
+      datagram).
+    """
+    def __init__(self, max_connections=SESSION_CONNECTIONS, lanes=SESSION_LANES,
+                 connect_timeout=CONNECT_TIMEOUT, send_timeout=SEND_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.send_timeout = send_timeout
+        lanes = max(1, min(lanes, max_connections))
+        self.lanes = [SessionLane(self, max(1, max_connections // lanes)) for _ in range(lanes)]
+        self.on_undeliverable = None
+        self.metrics = None     # optional metrics.Metrics
+
+    def start(self):
+        for lane in self.lanes:
+            lane.start()
+
+    def stop(self, timeout=CONNECT_TIMEOUT + SEND_TIMEOUT):
+        """
+        Delivers what is already queued (waiting up to timeout), then closes
+        every connection.
+        """
+        for lane in self.lanes:
+            with lane.cond:
+                lane.running = False
+                lane.cond.notify()
+        for lane in self.lanes:
+            if lane.thread is not None:
+                lane.thread.join(timeout)
+
+    def send(self, addr, data, fallback=None):
+        self.lanes[hash(addr) % len(self.lanes)].put(addr, data, fallback)
+
+    def count(self, name):
+        if self.metrics is not None:
+            self.metrics.incr(name)
+
+    def connection_count(self):
+        return sum(len(lane.connections) for lane in self.lanes)
+
+    def queue_depth(self):
+        return sum(len(lane.queue) for lane in self.lanes)
+
+# ----------------------------
+# SessionListener (client)
+# ----------------------------
+class SessionListener:
+    """
+    Client side: listens on the tcp_port the client registers and passes
+    every frame the server sends to on_message(data), from one reader
+    thread per connection. The server keeps its connection open, so
+    normally there is exactly one.
+    """
+    def __init__(self, on_message, host="127.0.0.1", port=0):
+        self.on_message = on_message
+        self.sock = socket.create_server((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def close(self):
+        self.running = False
+        with self.lock:
+            sockets = [self.sock] + list(self.connections)
+        for sock in sockets:
+            # shutdown() wakes a thread blocked in accept() / recv(); close() alone does not
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            with self.lock:
+                self.connections.add(conn)
+            threading.Thread(target=self.read_loop, args=(conn,), daemon=True).start()
+
+    def read_loop(self, conn):
+        with conn, conn.makefile("rb") as reader:
+            while self.running:
+                try:
+                    data = read_frame(reader)
+                except (OSError, ValueError):
+                    break
+                if data is None:
+                    break
+                self.on_message(data)
+        with self.lock:
+            self.connections.discard(conn)
@@ -0,0 +1,746 @@
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+
+from auction_engine import (AuctionEngine, MAX_USERS, MAX_ITEMS_PER_SELLER,
+                            SERVER_IP, SERVER_PORT, load_users)
+from journal import open_storage
+from log_pipeline import LogPipeline, start_sinks
+from profiler import install_signal_toggle
+from protocol import (MAX_DATAGRAM, command_name,
+                      OP_LIST_ITEM, OP_SUBSCRIBE, OP_DE_SUBSCRIBE, OP_BID, OP_RESYNC, OP_MCAST_JOIN,
+                      OP_REGISTERED, OP_REGISTER_DENIED, OP_DE_REGISTERED, OP_SESSION_OK, OP_SESSION_DENIED)
+from store import AuctionStore
+from records import User, Subscription, to_json, validate_ports
+from pattern_index import is_pattern
+from search_index import result_row
+from session_channel import session_port
+
+USERS_JOURNAL_FILE = "auction-users.journal"
+USERS_SNAPSHOT_FILE = "auction_snapshot-users.bin"
+USERS_DB_FILE = "auction-users.db"
+
+# Commands routed to the shard that owns fields[1] (the item name)
+SHARDED_OPCODES = (OP_LIST_ITEM, OP_SUBSCRIBE, OP_DE_SUBSCRIBE, OP_MCAST_JOIN)
+
+RPC_TIMEOUT = 2.0
+# How long a SEARCH waits for the other shards' pages before answering with what it has
+GATHER_TIMEOUT = 0.25
+# Users per "hello" reply, so a worker's initial replica arrives in pages
+# that stay well under IPC_BUFFER however many users are registered
+HELLO_PAGE = 200
+
+# Forwarded client datagrams skip JSON: a tag byte, the client's address
+# (ip length, port, ip) and then the datagram exactly as received
+FORWARD_TAG = b"F"
+FORWARD_HEADER = struct.Struct("!BH")
+IPC_BUFFER = 1 + FORWARD_HEADER.size + 255 + MAX_DATAGRAM
+
+def shard_of(item_name, shards):
+    # crc32 rather than hash(): str hashes are salted per process
+    return zlib.crc32(item_name.encode()) % shards
+
+def shard_of_item_id(item_id, shards):
+    # Workers only hand out ids congruent to their shard (see new_item_id)
+    return int(item_id) % shards if item_id.isdigit() else None
+
+def worker_inbox(ipc_dir, shard):
+    return os.path.join(ipc_dir, f"worker-{shard}.sock")
+
+def worker_rpc(ipc_dir, shard):
+    return os.path.join(ipc_dir, f"worker-{shard}-rpc.sock")
+
+def worker_query(ipc_dir, shard):
+    return os.path.join(ipc_dir, f"worker-{shard}-query.sock")
+
+def worker_gather(ipc_dir, shard):
+    return os.path.join(ipc_dir, f"worker-{shard}-gather.sock")
+
+def coordinator_path(ipc_dir):
+    return os.path.join(ipc_dir, "coordinator.sock")
+
+def ipc_socket(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    return sock
+
+def ipc_send(sock, path, msg):
+    sock.sendto(json.dumps(msg, default=to_json).encode(), path)
+
+def ipc_recv(sock):
+    data, sender = sock.recvfrom(IPC_BUFFER)
+    return json.loads(data), sender
+
+def pack_forward(addr, data):
+    ip = addr[0].encode()
+    return FORWARD_TAG + FORWARD_HEADER.pack(len(ip), addr[1]) + ip + data
+
+def unpack_forward(packet):
+    size, port = FORWARD_HEADER.unpack_from(packet, 1)
+    start = 1 + FORWARD_HEADER.size
+    return (packet[start:start + size].decode(), port), packet[start + size:]
+
+# ----------------------------
+# Coordinator
+# ----------------------------
+class Coordinator:
+    """
+    Owner of everything that is not partitioned by item name:
+    - registrations (REGISTER / DE-REGISTER are decided here, then
+      broadcast so every worker keeps a read replica for LOGIN and fan-out)
+    - listings per seller across all shards (LIST_ITEM capacity)
+    - session ports (SESSION updates the replicas, and every worker then
+      sends the client a SYNC of its own shard)
+    - the protocol version each user negotiated at its latest LOGIN
+
+    Runs on a thread in the parent process and speaks JSON datagrams over a
+    Unix socket.
+    """
+    def __init__(self, ipc_dir, shards, journal=None, max_users=MAX_USERS,
+                 max_items_per_seller=MAX_ITEMS_PER_SELLER):
+        self.ipc_dir = ipc_dir
+        self.shards = shards
+        self.max_users = max_users
+        self.max_items_per_seller = max_items_per_seller
+        self.journal = journal or open_storage("journal", USERS_JOURNAL_FILE, USERS_SNAPSHOT_FILE)
+        self.store = AuctionStore()
+        self.needs_snapshot = not self.journal.recover(self.store)
+        if self.needs_snapshot:
+            load_users(self.store)
+        self.listing_counts = [{} for _ in range(shards)]  # per shard: seller -> count
+        self.sock = ipc_socket(coordinator_path(ipc_dir))
+        self.running = False
+
+        # Per-worker messages that did not fit in its inbox queue yet
+        self.backlogs = [deque() for _ in range(shards)]
+        self.backlog_cond = threading.Condition()
+
+    def start(self):
+        self.running = True
+        self.journal.open()
+        if self.needs_snapshot:
+            # Persist the import before the first registration is journaled
+            self.journal.compact(self.store)
+            self.needs_snapshot = False
+        threading.Thread(target=self.serve, daemon=True).start()
+        threading.Thread(target=self.backlog_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.backlog_cond:
+            self.backlog_cond.notify_all()
+        self.journal.compact(self.store)
+        self.journal.close()
+        self.sock.close()
+
+    def broadcast(self, msg, skip=None):
+        """
+        Sends msg to every worker but `skip` (the requester, which already
+        applied the change). Never blocks: a worker can be stuck waiting for
+        our RPC reply with its lock held and its inbox full, so a message
+        that does not fit is queued and delivered by backlog_loop, in order.
+        """
+        data = json.dumps(msg, default=to_json).encode()
+        with self.backlog_cond:
+            for shard in range(self.shards):
+                if shard == skip:
+                    continue
+                backlog = self.backlogs[shard]
+                if not backlog:
+                    try:
+                        self.sock.sendto(data, socket.MSG_DONTWAIT, worker_inbox(self.ipc_dir, shard))
+                        continue
+                    except BlockingIOError:
+                        pass
+                    except OSError:
+                        continue  # worker not up yet; it resyncs with "hello"
+                backlog.append(data)
+            self.backlog_cond.notify()
+
+    def backlog_loop(self):
+        while True:
+            with self.backlog_cond:
+                while self.running and not any(self.backlogs):
+                    self.backlog_cond.wait()
+                if not self.running:
+                    return
+                pending = [(shard, backlog[0]) for shard, backlog in enumerate(self.backlogs) if backlog]
+            for shard, data in pending:
+                try:
+                    self.sock.sendto(data, worker_inbox(self.ipc_dir, shard))
+                except OSError:
+                    pass
+                # Pop only once sent, so broadcast() cannot overtake it
+                with self.backlog_cond:
+                    self.backlogs[shard].popleft()
+
+    def serve(self):
+        while self.running:
+            try:
+                msg, sender = ipc_recv(self.sock)
+            except OSError:
+                break
+            except ValueError:
+                continue  # not JSON: nothing to answer
+            reply = self.handle(msg)
+            if reply is not None:
+                reply["token"] = msg.get("token")
+                try:
+                    ipc_send(self.sock, sender, reply)
+                except OSError:
+                    pass
+
+    def handle(self, msg):
+        op = msg["op"]
+        store = self.store
+        if op == "register":
+            user = User.from_dict(msg["user"])
+            if store.get_user(user.name) is not None:
+                return {"ok": False, "reason": "NameInUse"}
+            if store.user_count() >= self.max_users:
+                return {"ok": False, "reason": "ServerFull"}
+            store.add_user(user)
+            self.journal.append("register", user=user)
+            # Broadcast before replying so replicas are ahead of the client
+            # (unless an inbox is full and the message has to wait)
+            self.broadcast({"op": "user_added", "user": user}, msg.get("shard"))
+            return {"ok": True}
+        if op == "deregister":
+            removed = store.remove_user(msg["name"]) is not None
+            if removed:
+                self.journal.append("deregister", name=msg["name"])
+                self.broadcast({"op": "user_removed", "name": msg["name"]}, msg.get("shard"))
+            return {"ok": removed}
+        if op == "session":
+            user = store.get_user(msg["name"])
+            if user is None:
+                return {"ok": False, "reason": "NotFound"}
+            try:
+                port = session_port(msg["tcp_port"])
+            except ValueError:
+                return {"ok": False, "reason": "InvalidPort"}
+            if user.tcp_port != port:
+                user.tcp_port = port
+                self.journal.append("register", user=user)
+            self.broadcast({"op": "session", "user": user}, msg.get("shard"))
+            return {"ok": True, "user": user}
+        if op == "protocol":
+            # Version negotiated at LOGIN: every shard announces in it
+            user = store.get_user(msg["name"])
+            if user is not None and user.protocol != msg["protocol"]:
+                user.protocol = msg["protocol"]
+                self.journal.append("register", user=user)
+                self.broadcast({"op": "protocol", "name": user.name, "protocol": user.protocol}, msg.get("shard"))
+            return None
+        if op == "hello":
+            # Paged by name: a worker asks again after the last name it got
+            self.listing_counts[msg["shard"]] = msg["counts"]
+            after = msg.get("after")
+            users = sorted((user for user in store.user_list() if after is None or user.name > after),
+                           key=lambda user: user.name)
+            return {"ok": True, "users": users[:HELLO_PAGE], "more": len(users) > HELLO_PAGE}
+        if op == "reserve":
+            seller = msg["seller"]
+            total = sum(counts.get(seller, 0) for counts in self.listing_counts)
+            if total >= self.max_items_per_seller:
+                return {"ok": False}
+            counts = self.listing_counts[msg["shard"]]
+            counts[seller] = counts.get(seller, 0) + 1
+            return {"ok": True}
+        if op == "release":
+            counts = self.listing_counts[msg["shard"]]
+            remaining = counts.get(msg["seller"], 0) - 1
+            if remaining > 0:
+                counts[msg["seller"]] = remaining
+            else:
+                counts.pop(msg["seller"], None)
+            return None
+        return {"ok": False, "reason": "UnknownOp"}
+
+# ----------------------------
+# ShardedEngine
+# ----------------------------
+class ShardedEngine(AuctionEngine):
+    """
+    One worker of a multi-process server. All workers bind the same UDP
+    port with SO_REUSEPORT and the kernel spreads clients across them.
+    Items and subscriptions live on shard_of(item_name); commands for
+    another shard are forwarded over its Unix socket and that worker
+    replies to the client directly (from the same shared port).
+
+    BIDs name an item id, which encodes its shard, so each item has a single
+    writer process; within it, bids are serialized by the item's stripe.
+    RESYNC goes the same way, to the worker whose publisher versions the item.
+
+    Pattern subscriptions ("laptop*") can match items on any shard, so the
+    worker that receives one applies it and replicates it to its peers.
+
+    MCAST_JOIN goes to the shard publishing the item, like SUBSCRIBE; a
+    LOGIN clears the buyer's joins on every shard.
+
+    SEARCH / BROWSE ask every peer for its page (scatter-gather) and merge
+    them. Peers answer from their query_loop thread using only the search
+    index's own lock, so a worker waiting on peers while holding its engine
+    lock cannot deadlock with one doing the same.
+    """
+    def __init__(self, shard, shards, ipc_dir, host=SERVER_IP, port=SERVER_PORT, journal=None, **kwargs):
+        journal = journal or open_storage("journal", f"auction-{shard}.journal", f"auction_snapshot-{shard}.bin")
+        self.shard = shard
+        self.shards = shards
+        self.ipc_dir = ipc_dir
+        super().__init__(host, port, journal, **kwargs)
+
+        if self.needs_snapshot:
+            # Legacy import loaded every item; keep only this shard's, with
+            # ids that route BIDs here
+            for item in self.store.item_list():
+                if shard_of(item.item_name, shards) != shard:
+                    self.store.remove_item(item.item_id)
+                elif shard_of_item_id(item.item_id, shards) != shard:
+                    self.store.remove_item(item.item_id)
+                    item.item_id = self.new_item_id()
+                    self.store.add_item(item)
+                    self.expiry.schedule(item.item_id, item.end_time)
+            for sub in self.store.subscription_list():
+                if not is_pattern(sub.item_name) and shard_of(sub.item_name, shards) != shard:
+                    self.store.remove_subscription(sub.buyer_name, sub.item_name)
+
+        self.inbox = ipc_socket(worker_inbox(ipc_dir, shard))
+        self.rpc_sock = ipc_socket(worker_rpc(ipc_dir, shard))
+        self.rpc_sock.settimeout(RPC_TIMEOUT)
+        self.rpc_lock = threading.Lock()
+        self.rpc_token = 0
+        # Sent by peer_loop, never from a handler: handlers hold self.lock
+        self.peer_queue = queue.SimpleQueue()
+        self.query_sock = ipc_socket(worker_query(ipc_dir, shard))
+        self.gather_sock = ipc_socket(worker_gather(ipc_dir, shard))
+        self.gather_lock = threading.Lock()
+        self.gather_token = 0
+        self.metrics.gauge("shard", lambda: self.shard)
+
+    # ----- Coordinator RPC -----
+
+    def call(self, msg):
+        """
+        Synchronous request to the coordinator. Returns None on timeout.
+        """
+        with self.rpc_lock:
+            self.rpc_token += 1
+            msg["token"] = self.rpc_token
+            msg["shard"] = self.shard
+            ipc_send(self.rpc_sock, coordinator_path(self.ipc_dir), msg)
+            while True:
+                try:
+                    reply, _ = ipc_recv(self.rpc_sock)
+                except socket.timeout:
+                    return None
+                if reply.get("token") == self.rpc_token:
+                    return reply
+
+    def notify_coordinator(self, msg):
+        msg["shard"] = self.shard
+        ipc_send(self.rpc_sock, coordinator_path(self.ipc_dir), msg)
+
+    # ----- Lifecycle -----
+
+    def bind_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        return sock
+
+    def start(self):
+        self.sync_users()
+        threading.Thread(target=self.inbox_loop, daemon=True).start()
+        threading.Thread(target=self.peer_loop, daemon=True).start()
+        threading.Thread(target=self.query_loop, daemon=True).start()
+        super().start()
+        self.log(f"(UDP) Worker {self.shard}/{self.shards} ready")
+
+    def sync_users(self):
+        """
+        Reports this shard's listing counts to the coordinator and replaces
+        the user replica with its registrations.
+        """
+        counts = dict(self.store.seller_counts)
+        users = []
+        while True:
+            after = users[-1]["name"] if users else None
+            reply = self.call({"op": "hello", "counts": counts, "after": after})
+            if reply is None:
+                raise RuntimeError("coordinator did not answer")
+            users += reply["users"]
+            if not reply["more"]:
+                break
+        with self.lock:
+            for user in self.store.user_list():
+                self.store.remove_user(user.name)
+            for user in users:
+                self.store.add_user(User.from_dict(user))
+
+    def stop(self):
+        super().stop()
+        self.peer_queue.put(None)
+        self.inbox.close()
+        self.rpc_sock.close()
+        self.query_sock.close()
+        self.gather_sock.close()
+
+    def inbox_loop(self):
+        while True:
+            try:
+                data, _ = self.inbox.recvfrom(IPC_BUFFER)
+            except OSError:
+                break
+            try:
+                if data[:1] == FORWARD_TAG:
+                    addr, frame = unpack_forward(data)
+                    self.handle_datagram(frame, addr)
+                else:
+                    self.handle_inbox(json.loads(data))
+            except Exception as e:
+                # One bad message must not stop this worker's replica updates
+                self.metrics.incr("inbox_failed")
+                self.log(f"(IPC) Dropped inbox message: {e!r}", "error")
+
+    def handle_inbox(self, msg):
+        op = msg["op"]
+        if op == "user_added":
+            user = User.from_dict(msg["user"])
+            with self.lock:
+                self.store.add_user(user)
+            self.emit("users_changed", [user.name])
+        elif op == "session":
+            with self.lock:
+                user = self.apply_session(msg["user"])
+                self.send_sync(user)
+            self.emit("users_changed", [user.name])
+        elif op == "protocol":
+            with self.lock:
+                user = self.store.get_user(msg["name"])
+                if user is not None:
+                    user.protocol = msg["protocol"]
+        elif op == "user_removed":
+            with self.lock:
+                self.store.remove_user(msg["name"])
+                if self.multicast is not None:
+                    self.multicast.forget(msg["name"])
+            self.emit("users_changed", [msg["name"]])
+        elif op == "pattern":
+            self.apply_peer_pattern(msg["action"], msg["buyer"], msg["pattern"])
+        elif op == "mcast_forget":
+            with self.lock:
+                self.multicast.forget(msg["buyer"])
+
+    # ----- Pattern subscription replication -----
+
+    def share_pattern(self, action, buyer_name, pattern):
+        self.peer_queue.put({"op": "pattern", "action": action, "buyer": buyer_name, "pattern": pattern})
+
+    def peer_loop(self):
+        while True:
+            msg = self.peer_queue.get()
+            if msg is None:
+                break
+            for peer in range(self.shards):
+                if peer == self.shard:
+                    continue
+                try:
+                    ipc_send(self.inbox, worker_inbox(self.ipc_dir, peer), msg)
+                except OSError:
+                    pass
+
+    def apply_peer_pattern(self, action, buyer_name, pattern):
+        with self.lock:
+            if action == "subscribe":
+                if not self.store.add_subscription(Subscription(buyer_name, pattern)):
+                    return
+                self.journal.append("subscribe", sub=self.store.get_subscription(buyer_name, pattern))
+                # Catch-up announcements for this shard's matching items
+                self.publisher.notify_subscription(buyer_name, pattern)
+            else:
+                if self.store.remove_subscription(buyer_name, pattern) is None:
+                    return
+                self.journal.append("de_subscribe", buyer_name=buyer_name, item_name=pattern)
+        self.emit("subscriptions_changed", [(buyer_name, pattern)])
+
+    # ----- Search scatter-gather -----
+
+    def search_page(self, tokens, order, after, limit):
+        total, rows = super().search_page(tokens, order, after, limit)
+        if self.shards == 1:
+            return total, rows
+        msg = {"op": "search", "tokens": tokens, "order": order,
+               "after": list(after) if after else None, "limit": limit}
+        for reply in self.gather(msg):
+            total += reply["total"]
+            rows.extend(reply["rows"])
+        rows.sort(key=lambda row: (row[0], row[1]), reverse=order == "price_desc")
+        return total, rows[:limit]
+
+    def gather(self, msg):
+        """
+        Sends msg to every peer's query socket and collects the replies that
+        arrive within GATHER_TIMEOUT.
+        """
+        peers = self.shards - 1
+        replies = []
+        with self.gather_lock:
+            self.gather_token += 1
+            msg["token"] = self.gather_token
+            for peer in range(self.shards):
+                if peer == self.shard:
+                    continue
+                try:
+                    ipc_send(self.gather_sock, worker_query(self.ipc_dir, peer), msg)
+                except OSError:
+                    peers -= 1
+            deadline = time.monotonic() + GATHER_TIMEOUT
+            while len(replies) < peers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.gather_sock.settimeout(remaining)
+                try:
+                    reply, _ = ipc_recv(self.gather_sock)
+                except socket.timeout:
+                    break
+                if reply.get("token") == self.gather_token:
+                    replies.append(reply)
+        if len(replies) < self.shards - 1:
+            self.metrics.incr("search.partial")
+        return replies
+
+    def query_loop(self):
+        while True:
+            try:
+                msg, sender = ipc_recv(self.query_sock)
+            except OSError:
+                break
+            after = tuple(msg["after"]) if msg["after"] else None
+            total, found = self.store.search.search(msg["tokens"], msg["order"], after, msg["limit"])
+            try:
+                ipc_send(self.query_sock, sender, {"token": msg["token"], "total": total,
+                                                   "rows": [result_row(key, item) for key, item in found]})
+            except OSError:
+                pass
+
+    # ----- Routing -----
+
+    def forward(self, message, data, addr):
+        # Commands inside a BATCH are forwarded one by one and answered
+        # individually by their owner.
+        owner = self.owner_of(message[1], message[3])
+        if owner is None or owner == self.shard:
+            return False
+        try:
+            self.inbox.sendto(pack_forward(addr, data), worker_inbox(self.ipc_dir, owner))
+        except OSError as e:
+            # Owner gone or restarting: drop it, the client retries
+            self.metrics.incr(f"forward_failed.{command_name(message[1])}")
+            self.log(f"(IPC) Could not forward to worker {owner}: {e!r}", "error")
+        return True
+
+    def owner_of(self, opcode, fields):
+        """
+        The shard that must run a command, or None if any worker can.
+        """
+        if opcode in (OP_BID, OP_RESYNC):
+            return shard_of_item_id(fields[1], self.shards)
+        if opcode not in SHARDED_OPCODES:
+            return None
+        if opcode != OP_LIST_ITEM and is_pattern(fields[1]):
+            return None
+        return shard_of(fields[1], self.shards)
+
+    # ----- Coordinator-backed handlers -----
+
+    def handle_register(self, rq, name, role, ip, udp_port, tcp_port, addr):
+        try:
+            user = User(name, role, ip, udp_port, tcp_port, self.reply_version)
+            validate_ports(user)
+        except ValueError:
+            self.reply(addr, OP_REGISTER_DENIED, rq, "InvalidPort")
+            self.log(f"(UDP) Denied registration (invalid port): {name}")
+            return
+        reply = self.call({"op": "register", "user": user})
+        if reply is None or not reply["ok"]:
+            reason = reply["reason"] if reply else "CoordinatorUnavailable"
+            self.reply(addr, OP_REGISTER_DENIED, rq, reason)
+            self.log(f"(UDP) Denied registration ({reason}): {name}")
+            return
+        self.store.add_user(user)
+        self.emit("users_changed", [name])
+        self.reply(addr, OP_REGISTERED, rq)
+        self.log(f"(UDP) Registered new user: {name} ({role})")
+
+    def handle_deregister(self, rq, name, addr):
+        reply = self.call({"op": "deregister", "name": name})
+        self.reply(addr, OP_DE_REGISTERED, rq)
+        if reply and reply["ok"]:
+            self.store.remove_user(name)
+            self.emit("users_changed", [name])
+            self.log(f"(UDP) De-registered user: {name}")
+        else:
+            self.log(f"(UDP) De-register requested but user not found: {name}")
+
+    def handle_session(self, rq, name, tcp_port, addr):
+        reply = self.call({"op": "session", "name": name, "tcp_port": tcp_port})
+        if reply is None or not reply["ok"]:
+            reason = reply["reason"] if reply else "CoordinatorUnavailable"
+            self.reply(addr, OP_SESSION_DENIED, rq, reason)
+            self.log(f"(UDP) SESSION denied for {name} ({reason}).")
+            return
+        user = self.apply_session(reply["user"])
+        self.emit("users_changed", [name])
+        self.reply(addr, OP_SESSION_OK, rq)
+        # The other workers SYNC their shards when the broadcast reaches them
+        self.send_sync(user)
+        self.log(f"(UDP) SESSION for {name} on TCP port {user.tcp_port}")
+
+    def apply_session(self, data):
+        # Only the port changes: keep the replica's protocol from its LOGIN
+        user = self.store.get_user(data["name"])
+        if user is None:
+            user = User.from_dict(data)
+            self.store.add_user(user)
+        else:
+            user.tcp_port = data["tcp_port"]
+        return user
+
+    def handle_login(self, rq, name, role, addr):
+        user = self.store.get_user(name)
+        protocol = user.protocol if user else None
+        super().handle_login(rq, name, role, addr)
+        if not (user and user.role == role):
+            return
+        if user.protocol != protocol:
+            # Items on the other shards are announced by their workers
+            self.notify_coordinator({"op": "protocol", "name": name, "protocol": user.protocol})
+        if self.multicast is not None:
+            # MCAST_JOINs were recorded by the shards owning the items
+            self.peer_queue.put({"op": "mcast_forget", "buyer": name})
+
+    def handle_subscribe(self, rq, buyer_name, item_name, addr):
+        existed = self.store.is_subscribed(buyer_name, item_name)
+        super().handle_subscribe(rq, buyer_name, item_name, addr)
+        if is_pattern(item_name) and not existed and self.store.is_subscribed(buyer_name, item_name):
+            self.share_pattern("subscribe", buyer_name, item_name)
+
+    def handle_de_subscribe(self, rq, buyer_name, item_name, addr):
+        existed = self.store.is_subscribed(buyer_name, item_name)
+        super().handle_de_subscribe(rq, buyer_name, item_name, addr)
+        if is_pattern(item_name) and existed:
+            self.share_pattern("de_subscribe", buyer_name, item_name)
+
+    def reserve_listing(self, seller_name):
+        reply = self.call({"op": "reserve", "seller": seller_name})
+        return bool(reply and reply["ok"])
+
+    def release_listing(self, seller_name):
+        self.notify_coordinator({"op": "release", "seller": seller_name})
+
+    def new_item_id(self):
+        # Ids are congruent to the shard number, so they never collide across workers
+        new_id = super().new_item_id()
+        while int(new_id) % self.shards != self.shard or self.store.get_item(new_id) is not None:
+            new_id = super().new_item_id()
+        return new_id
+
+# ----------------------------
+# Process management
+# ----------------------------
+def shard_path(path, shard):
+    base, ext = os.path.splitext(path)
+    return f"{base}-{shard}{ext}"
+
+def worker_main(shard, shards, ipc_dir, host, port, journal_kwargs, engine_kwargs, quiet, log_options):
+    def on_term(signum, frame):
+        # Ignore repeats so a second SIGTERM cannot interrupt the shutdown
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_term)
+
+    journal = open_storage(journal_path=f"auction-{shard}.journal", snapshot_path=f"auction_snapshot-{shard}.bin",
+                           db_path=f"auction-{shard}.db", **journal_kwargs)
+    # One log / metrics file per worker (server.log -> server-0.log):
+    # processes cannot share a rotating file
+    engine_kwargs = dict(engine_kwargs)
+    if engine_kwargs.get("metrics_file"):
+        engine_kwargs["metrics_file"] = shard_path(engine_kwargs["metrics_file"], shard)
+    log_file = log_options.get("log_file")
+    if log_file:
+        log_file = shard_path(log_file, shard)
+    logs = LogPipeline(log_options.get("rate_limits"), log_options.get("sampling"))
+    engine = ShardedEngine(shard, shards, ipc_dir, host, port, journal, logs=logs, **engine_kwargs)
+    sinks = start_sinks(logs, quiet, log_file, prefix=f"[{shard}] ")
+    # Profile one worker with `kill -USR1 <pid>`; the report names its pid
+    install_signal_toggle(engine.profiler, engine.log)
+    engine.start()
+    try:
+        engine.serve_forever()
+    finally:
+        for sink in sinks:
+            sink.stop()
+
+def run_sharded(workers, host=SERVER_IP, port=SERVER_PORT, journal_kwargs=None,
+                engine_kwargs=None, quiet=False, log_options=None):
+    """
+    Starts the coordinator in this process and `workers` ShardedEngine
+    processes on host:port. Blocks until interrupted. Linux only.
+
+    journal_kwargs (backend, fsync_mode, fsync_interval) apply to every
+    shard's storage; engine_kwargs (compact_interval, keepalive_interval) to every
+    ShardedEngine. log_options (rate_limits, sampling, log_file) configure
+    each worker's LogPipeline; worker N writes its own log file.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("multi-worker mode needs SO_REUSEPORT (Linux)")
+    ipc_dir = tempfile.mkdtemp(prefix="auction-ipc-")
+    engine_kwargs = engine_kwargs or {}
+    # Capacity limits are enforced by the coordinator, not the workers
+    coordinator = Coordinator(ipc_dir, workers,
+                              open_storage(journal_path=USERS_JOURNAL_FILE, snapshot_path=USERS_SNAPSHOT_FILE,
+                                           db_path=USERS_DB_FILE, **(journal_kwargs or {})),
+                              engine_kwargs.get("max_users", MAX_USERS),
+                              engine_kwargs.get("max_items_per_seller", MAX_ITEMS_PER_SELLER))
+    coordinator.start()
+
+    procs = []
+    for shard in range(workers):
+        proc = multiprocessing.Process(
+            target=worker_main,
+            args=(shard, workers, ipc_dir, host, port, journal_kwargs or {}, engine_kwargs, quiet,
+                  log_options or {}),
+            daemon=True)
+        proc.start()
+        procs.append(proc)
+
+    def on_term(signum, frame):
+        # Ignore repeats so a second SIGTERM cannot interrupt the shutdown
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_term)
+    try:
+        for proc in procs:
+            proc.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join()
+        coordinator.stop()
+        shutil.rmtree(ipc_dir, ignore_errors=True)
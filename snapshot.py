@@ -0,0 +1,251 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from records import User, Item, Subscription
+
+MAGIC = b"AUCSNAP\0"
+# 2 added current_price / high_bidder to items; version 1 files still load
+FORMAT_VERSION = 2
+
+# magic, format version, reserved, journal seq, users, items, subscriptions,
+# strings, crc32 of everything after the header
+HEADER = struct.Struct("<8sHHQIIIII")
+
+# Record layouts: "s" fields are u32 references into the string table
+# (entry n is stored as n + 1; 0 means None), "d" is a
+# double, "q" a signed 64-bit int. Strings are stored once however many
+# records share them (item names, seller names, ips...).
+USER_FIELDS = (("name", "s"), ("role", "s"), ("ip", "s"), ("udp_port", "s"), ("tcp_port", "s"),
+               ("protocol", "q"))
+ITEM_FIELDS_V1 = (("item_id", "s"), ("seller_name", "s"), ("item_name", "s"), ("description", "s"),
+                  ("start_price", "d"), ("duration", "q"), ("end_time", "d"))
+ITEM_FIELDS = ITEM_FIELDS_V1 + (("current_price", "d"), ("high_bidder", "s"))
+SUBSCRIPTION_FIELDS = (("buyer_name", "s"), ("item_name", "s"))
+
+def record_struct(fields):
+    return struct.Struct("<" + "".join("I" if kind == "s" else kind for _, kind in fields))
+
+USER = record_struct(USER_FIELDS)
+ITEM = record_struct(ITEM_FIELDS)
+ITEM_V1 = record_struct(ITEM_FIELDS_V1)
+SUBSCRIPTION = record_struct(SUBSCRIPTION_FIELDS)
+
+class SnapshotError(ValueError):
+    """
+    A snapshot (or legacy data file) that cannot be trusted. Raised rather
+    than starting from empty state, which would silently drop the catalog.
+    """
+
+# ----------------------------
+# Writing
+# ----------------------------
+def encode_state(state, seq):
+    """
+    Serializes {"users", "items", "subscriptions"} (lists of records)
+    covering journal records up to seq. Layout after the header: user, item and subscription record
+    arrays, then the string offsets (u32 x count+1) and the UTF-8 blob.
+    """
+    strings = {}
+    blob = []
+    offsets = [0]
+
+    def intern(value):
+        if value is None:
+            return 0
+        value = str(value)
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(blob) + 1
+            blob.append(value.encode("utf-8"))
+            offsets.append(offsets[-1] + len(blob[-1]))
+        return index
+
+    def pack(layout, fields, records):
+        out = bytearray()
+        for record in records:
+            out += layout.pack(*[intern(getattr(record, name)) if kind == "s" else getattr(record, name)
+                                 for name, kind in fields])
+        return out
+
+    users = pack(USER, USER_FIELDS, state["users"])
+    items = pack(ITEM, ITEM_FIELDS, state["items"])
+    subs = pack(SUBSCRIPTION, SUBSCRIPTION_FIELDS, state["subscriptions"])
+    body = b"".join([users, items, subs, struct.pack(f"<{len(offsets)}I", *offsets)] + blob)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, seq, len(state["users"]), len(state["items"]),
+                         len(state["subscriptions"]), len(blob), zlib.crc32(body))
+    return header + body
+
+def write_snapshot(path, state, seq):
+    """
+    Atomically replaces path (tmp file + fsync + replace).
+    """
+    data = encode_state(state, seq)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# ----------------------------
+# Reading
+# ----------------------------
+class SnapshotReader:
+    """
+    Memory-mapped view of a snapshot. Opening checks the header and the
+    checksum (one sequential pass, bounded by I/O); nothing is decoded yet.
+    The string table is decoded in one piece on first access, and users() /
+    items() / subscriptions() unpack their record arrays in bulk straight
+    into records.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"{path}: empty file")
+        if len(self.map) < HEADER.size:
+            raise SnapshotError(f"{path}: truncated header")
+        (magic, version, _, self.seq, self.user_count, self.item_count, self.subscription_count,
+         self.string_count, checksum) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: not a binary snapshot")
+        if version not in (1, FORMAT_VERSION):
+            raise SnapshotError(f"{path}: unsupported format version {version}")
+        self.version = version
+        self.item_layout = ITEM if version == FORMAT_VERSION else ITEM_V1
+        if zlib.crc32(memoryview(self.map)[HEADER.size:]) != checksum:
+            raise SnapshotError(f"{path}: checksum mismatch")
+
+        self.users_at = HEADER.size
+        self.items_at = self.users_at + self.user_count * USER.size
+        self.subscriptions_at = self.items_at + self.item_count * self.item_layout.size
+        self.offsets_at = self.subscriptions_at + self.subscription_count * SUBSCRIPTION.size
+        self.blob_at = self.offsets_at + (self.string_count + 1) * 4
+        if self.blob_at > len(self.map):
+            raise SnapshotError(f"{path}: truncated body")
+        self.strings = None
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def load_strings(self):
+        if self.strings is not None:
+            return self.strings
+        offsets = struct.unpack_from(f"<{self.string_count + 1}I", self.map, self.offsets_at)
+        blob = self.map[self.blob_at:self.blob_at + offsets[-1]]
+        if blob.isascii():
+            # One decode for the whole table; byte offsets are char offsets
+            text = blob.decode("ascii")
+            self.strings = [text[offsets[i]:offsets[i + 1]] for i in range(self.string_count)]
+        else:
+            self.strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(self.string_count)]
+        return self.strings
+
+    def section(self, layout, start, count):
+        return layout.iter_unpack(self.map[start:start + count * layout.size])
+
+    # Field order follows USER_FIELDS / ITEM_FIELDS / SUBSCRIPTION_FIELDS
+
+    def users(self):
+        s = [None] + self.load_strings()
+        return (User(s[name], s[role], s[ip], s[udp_port], s[tcp_port], protocol)
+                for name, role, ip, udp_port, tcp_port, protocol
+                in self.section(USER, self.users_at, self.user_count))
+
+    def items(self):
+        s = [None] + self.load_strings()
+        if self.version == 1:
+            return (Item(s[item_id], s[seller_name], s[item_name], s[description], start_price, duration,
+                         end_time)
+                    for item_id, seller_name, item_name, description, start_price, duration, end_time
+                    in self.section(ITEM_V1, self.items_at, self.item_count))
+        return (Item(s[item_id], s[seller_name], s[item_name], s[description], start_price, duration, end_time,
+                     current_price, s[high_bidder])
+                for item_id, seller_name, item_name, description, start_price, duration, end_time,
+                    current_price, high_bidder
+                in self.section(ITEM, self.items_at, self.item_count))
+
+    def subscriptions(self):
+        s = [None] + self.load_strings()
+        return (Subscription(s[buyer_name], s[item_name])
+                for buyer_name, item_name
+                in self.section(SUBSCRIPTION, self.subscriptions_at, self.subscription_count))
+
+def read_json_snapshot(path):
+    """
+    The pre-binary snapshot format: {"seq", "users", "items", "subscriptions"}.
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except ValueError as e:
+        raise SnapshotError(f"{path}: {e}") from e
+
+# ----------------------------
+# Converter
+# ----------------------------
+def convert(out_path, json_snapshot=None):
+    """
+    One-time conversion into a binary snapshot, from a JSON snapshot if
+    given, else from the legacy users/items/subscriptions data files.
+    Returns the state that was written.
+    """
+    if json_snapshot:
+        snapshot = read_json_snapshot(json_snapshot)
+        state = {
+            "users": [User.from_dict(user) for user in snapshot["users"]],
+            "items": [Item.from_dict(item) for item in snapshot["items"]],
+            "subscriptions": [Subscription.from_dict(sub) for sub in snapshot["subscriptions"]],
+        }
+        seq = snapshot["seq"]
+    else:
+        from store import AuctionStore
+        from auction_engine import load_users, load_items, load_subscriptions
+        store = AuctionStore()
+        load_users(store)
+        load_items(store)
+        load_subscriptions(store)
+        state = store.snapshot_state()
+        seq = 0
+    write_snapshot(out_path, state, seq)
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary auction snapshot tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_binary = commands.add_parser("convert", help="write a binary snapshot from JSON state")
+    to_binary.add_argument("--from-json", metavar="SNAPSHOT",
+                           help="JSON snapshot to convert (default: the legacy *_data.json files)")
+    to_binary.add_argument("--output", default="auction_snapshot.bin")
+    check = commands.add_parser("verify", help="check a binary snapshot and print its counts")
+    check.add_argument("path", nargs="?", default="auction_snapshot.bin")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "convert":
+            state = convert(args.output, args.from_json)
+            print(f"Wrote {args.output}: {len(state['users'])} users, {len(state['items'])} items, "
+                  f"{len(state['subscriptions'])} subscriptions")
+        else:
+            with SnapshotReader(args.path) as reader:
+                print(f"{args.path}: format {reader.version}, seq {reader.seq}, {reader.user_count} users, "
+                      f"{reader.item_count} items, {reader.subscription_count} subscriptions, "
+                      f"{reader.string_count} strings, checksum ok")
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"error: {e}")
+
+if __name__ == "__main__":
+    main()
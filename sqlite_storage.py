@@ -0,0 +1,221 @@
+import contextlib
+import sqlite3
+import threading
+import time
+
+from journal import FSYNC_MODES
+from records import User, Item, Subscription
+
+DB_FILE = "auction.db"
+
+USER_COLUMNS = ("name", "role", "ip", "udp_port", "tcp_port", "protocol")
+ITEM_COLUMNS = ("item_id", "seller_name", "item_name", "description", "start_price", "duration", "end_time",
+                "current_price", "high_bidder")
+SUBSCRIPTION_COLUMNS = ("buyer_name", "item_name")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY, role TEXT, ip TEXT, udp_port INTEGER, tcp_port INTEGER, protocol INTEGER
+);
+CREATE TABLE IF NOT EXISTS items (
+    item_id TEXT PRIMARY KEY, seller_name TEXT, item_name TEXT, description TEXT,
+    start_price REAL, duration INTEGER, end_time REAL, current_price REAL, high_bidder TEXT
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    buyer_name TEXT, item_name TEXT, PRIMARY KEY (buyer_name, item_name)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY, value TEXT
+);
+CREATE INDEX IF NOT EXISTS items_by_seller ON items (seller_name);
+CREATE INDEX IF NOT EXISTS items_by_name ON items (item_name);
+CREATE INDEX IF NOT EXISTS subscriptions_by_item ON subscriptions (item_name);
+"""
+
+def insert_sql(table, columns):
+    return (f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})")
+
+# Fixed statement texts: sqlite3 keeps them prepared in its per-connection cache
+INSERT_USER = insert_sql("users", USER_COLUMNS)
+INSERT_ITEM = insert_sql("items", ITEM_COLUMNS)
+INSERT_SUBSCRIPTION = insert_sql("subscriptions", SUBSCRIPTION_COLUMNS)
+DELETE_USER = "DELETE FROM users WHERE name = ?"
+DELETE_ITEM = "DELETE FROM items WHERE item_id = ?"
+DELETE_SUBSCRIPTION = "DELETE FROM subscriptions WHERE buyer_name = ? AND item_name = ?"
+UPDATE_BID = "UPDATE items SET current_price = ?, high_bidder = ?, end_time = ? WHERE item_id = ?"
+# Written in the same transaction as the initial state: a database without
+# it was never seeded, however it got created
+MARK_SEEDED = "INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded', '1')"
+IS_SEEDED = "SELECT 1 FROM meta WHERE key = 'seeded'"
+
+# Columns added after the first schema: (table, column, type)
+ADDED_COLUMNS = (("items", "current_price", "REAL"), ("items", "high_bidder", "TEXT"))
+
+def row_values(record, columns):
+    return tuple(getattr(record, column) for column in columns)
+
+# ----------------------------
+# SqliteStorage
+# ----------------------------
+class SqliteStorage:
+    """
+    Storage backend that keeps users, items and subscriptions as rows of a
+    SQLite database in WAL mode: each mutation is a single-row statement,
+    so there is no snapshot to rewrite. Drop-in for journal.Journal.
+
+    Statements are batched into transactions according to fsync_mode:
+    - "always":   commit (and fsync) every mutation
+    - "interval": group commit, one transaction per fsync_interval seconds
+    - "never":    group commit with synchronous=OFF, left to the OS
+
+    compact() is a WAL checkpoint; the first one on a fresh database also
+    bulk-loads whatever the store was seeded with (legacy JSON import) and
+    marks the database seeded, in one transaction.
+
+    Startup still reads every row: the store's name, search, pattern and
+    expiry indexes all live in memory. What SQLite saves is rewriting a
+    snapshot of the whole state on every compaction.
+    """
+    def __init__(self, path=DB_FILE, fsync_mode="interval", fsync_interval=0.05):
+        if fsync_mode not in FSYNC_MODES:
+            raise ValueError(f"fsync_mode must be one of {FSYNC_MODES}")
+        self.path = path
+        self.fsync_mode = fsync_mode
+        self.fsync_interval = fsync_interval
+
+        self.lock = threading.Lock()
+        self.db = None
+        self.seeded = False     # False until the database holds the full state
+        self.dirty = False
+        self.records_since_snapshot = 0
+        self.running = False
+        self.metrics = None     # optional metrics.Metrics for commit timings
+        self.profiler = None    # optional profiler.Profiler for commit spans
+
+    def connect(self):
+        if self.db is not None:
+            return
+        # Autocommit mode: transactions are opened explicitly in append()
+        self.db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA synchronous={'OFF' if self.fsync_mode == 'never' else 'FULL'}")
+        self.db.executescript(SCHEMA)
+        for table, column, kind in ADDED_COLUMNS:
+            existing = {row[1] for row in self.db.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self.db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        if self.db.execute(IS_SEEDED).fetchone() is None and any(
+                self.db.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                for table in ("users", "items", "subscriptions")):
+            # Seeded before the marker existed
+            self.db.execute(MARK_SEEDED)
+
+    # ----- Startup -----
+
+    def recover(self, store):
+        """
+        Loads every row into store. Returns False for a database that was
+        never seeded (new, or the process died before its first compact()),
+        so the caller imports the legacy data again.
+        """
+        self.connect()
+        if self.db.execute(IS_SEEDED).fetchone() is None:
+            return False
+        for row in self.db.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM users"):
+            store.add_user(User(*row))
+        for row in self.db.execute(f"SELECT {', '.join(ITEM_COLUMNS)} FROM items"):
+            store.add_item(Item(*row))
+        for row in self.db.execute(f"SELECT {', '.join(SUBSCRIPTION_COLUMNS)} FROM subscriptions"):
+            store.add_subscription(Subscription(*row))
+        self.seeded = True
+        return True
+
+    def open(self, sync_thread=True):
+        self.connect()
+        self.running = True
+        if self.fsync_mode != "always" and sync_thread:
+            threading.Thread(target=self.sync_loop, daemon=True).start()
+
+    def close(self):
+        self.running = False
+        self.sync()
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    # ----- Writing -----
+
+    def append(self, op, **fields):
+        with self.lock:
+            if not self.db.in_transaction:
+                self.db.execute("BEGIN")
+            self.apply(op, fields)
+            self.records_since_snapshot += 1
+            if self.fsync_mode == "always":
+                self.commit()
+            else:
+                self.dirty = True
+
+    def apply(self, op, fields):
+        execute = self.db.execute
+        if op == "register":
+            execute(INSERT_USER, row_values(fields["user"], USER_COLUMNS))
+        elif op == "deregister":
+            execute(DELETE_USER, (fields["name"],))
+        elif op == "list_item":
+            execute(INSERT_ITEM, row_values(fields["item"], ITEM_COLUMNS))
+        elif op == "expire":
+            execute(DELETE_ITEM, (fields["item_id"],))
+        elif op == "bid":
+            execute(UPDATE_BID, (fields["price"], fields["bidder"], fields["end_time"], fields["item_id"]))
+        elif op == "subscribe":
+            execute(INSERT_SUBSCRIPTION, row_values(fields["sub"], SUBSCRIPTION_COLUMNS))
+        elif op == "de_subscribe":
+            execute(DELETE_SUBSCRIPTION, (fields["buyer_name"], fields["item_name"]))
+
+    def commit(self):
+        started = time.perf_counter()
+        self.db.execute("COMMIT")
+        self.dirty = False
+        if self.metrics is not None:
+            self.metrics.observe("journal.fsync", time.perf_counter() - started)
+        if self.profiler is not None:
+            self.profiler.record("persist.fsync", started)
+
+    def sync(self):
+        with self.lock:
+            if self.dirty and self.db is not None:
+                self.commit()
+
+    def sync_loop(self):
+        while self.running:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    # ----- Compaction -----
+
+    def compact(self, store, lock=None):
+        """
+        Commits and checkpoints the WAL back into the database file. Only a
+        fresh database needs store (and lock, which guards it) to seed it.
+        """
+        if not self.seeded:
+            with lock or contextlib.nullcontext():
+                state = store.snapshot_state()
+            with self.lock:
+                if not self.db.in_transaction:
+                    self.db.execute("BEGIN")
+                self.db.executemany(INSERT_USER, [row_values(u, USER_COLUMNS) for u in state["users"]])
+                self.db.executemany(INSERT_ITEM, [row_values(i, ITEM_COLUMNS) for i in state["items"]])
+                self.db.executemany(INSERT_SUBSCRIPTION,
+                                    [row_values(s, SUBSCRIPTION_COLUMNS) for s in state["subscriptions"]])
+                self.db.execute(MARK_SEEDED)
+                self.commit()
+            self.seeded = True
+        with self.lock:
+            if self.dirty:
+                self.commit()
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.records_since_snapshot = 0
@@ -0,0 +1,179 @@
+from pattern_index import PatternIndex, is_pattern, compile_pattern
+from search_index import SearchIndex
+
+# ----------------------------
+# AuctionStore: indexed in-memory state
+# ----------------------------
+class AuctionStore:
+    """
+    Users, items and subscriptions with the indexes the handlers need:
+    - users by name, items by item_id
+    - items-per-seller counts (LIST_ITEM capacity check)
+    - item_name -> buyers inverted index (announcement fan-out), plus a
+      PatternIndex trie for wildcard subscriptions ("laptop*")
+    - item_name -> item_ids (catch-up announcements on SUBSCRIBE)
+    - a SearchIndex over item names and descriptions (SEARCH / BROWSE)
+
+    Every mutation goes through the methods below so the indexes never
+    drift from the primary maps. Records are the slotted types in records.py.
+    """
+    def __init__(self):
+        self.users = {}             # name -> User
+        self.items = {}             # item_id -> Item
+        self.subscriptions = {}     # (buyer_name, item_name) -> Subscription
+        self.seller_counts = {}     # seller_name -> number of listed items
+        self.buyers_by_item = {}    # item_name -> { buyer_name, ... }   (exact names)
+        self.patterns = PatternIndex()  # wildcard subscriptions
+        self.items_by_name = {}     # item_name -> { item_id, ... }
+        self.search = SearchIndex() # tokens -> item_ids, items by deadline / price
+
+    # ----- Users -----
+
+    def get_user(self, name):
+        return self.users.get(name)
+
+    def add_user(self, user):
+        self.users[user.name] = user
+
+    def remove_user(self, name):
+        return self.users.pop(name, None)
+
+    def user_count(self):
+        return len(self.users)
+
+    # ----- Items -----
+
+    def get_item(self, item_id):
+        return self.items.get(item_id)
+
+    def add_item(self, item):
+        self.items[item.item_id] = item
+        self.items_by_name.setdefault(item.item_name, set()).add(item.item_id)
+        self.search.add(item)
+        seller = item.seller_name
+        self.seller_counts[seller] = self.seller_counts.get(seller, 0) + 1
+
+    def remove_item(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return None
+        self.search.remove(item_id)
+        ids = self.items_by_name.get(item.item_name)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del self.items_by_name[item.item_name]
+        seller = item.seller_name
+        remaining = self.seller_counts.get(seller, 0) - 1
+        if remaining > 0:
+            self.seller_counts[seller] = remaining
+        else:
+            self.seller_counts.pop(seller, None)
+        return item
+
+    def record_bid(self, item, price, bidder, end_time):
+        """
+        Applies an accepted bid (and any deadline extension) to item. The
+        engine calls this under the item's stripe lock, not the store lock.
+        """
+        item.current_price = price
+        item.high_bidder = bidder
+        item.end_time = end_time
+        self.search.refresh(item)
+
+    def items_named(self, item_name):
+        return [self.items[item_id] for item_id in self.items_by_name.get(item_name, ())]
+
+    def items_matching(self, name_or_pattern):
+        """
+        Items a new subscription covers. Patterns scan the distinct item
+        names once (subscribing is rare next to listing).
+        """
+        if not is_pattern(name_or_pattern):
+            return self.items_named(name_or_pattern)
+        regex = compile_pattern(name_or_pattern)
+        return [self.items[item_id]
+                for item_name, ids in self.items_by_name.items() if regex.match(item_name)
+                for item_id in ids]
+
+    def seller_item_count(self, seller_name):
+        return self.seller_counts.get(seller_name, 0)
+
+    def items_of_seller(self, seller_name):
+        if not self.seller_counts.get(seller_name):
+            return []
+        return [item for item in self.items.values() if item.seller_name == seller_name]
+
+    # ----- Subscriptions -----
+
+    def get_subscription(self, buyer_name, item_name):
+        return self.subscriptions.get((buyer_name, item_name))
+
+    def is_subscribed(self, buyer_name, item_name):
+        return (buyer_name, item_name) in self.subscriptions
+
+    def subscriptions_of(self, buyer_name):
+        """
+        Item names and patterns buyer_name subscribes to (a scan: only SYNC
+        after a login needs this).
+        """
+        return [item_name for buyer, item_name in self.subscriptions if buyer == buyer_name]
+
+    def add_subscription(self, sub):
+        key = (sub.buyer_name, sub.item_name)
+        if key in self.subscriptions:
+            return False
+        self.subscriptions[key] = sub
+        if is_pattern(sub.item_name):
+            self.patterns.add(sub.item_name, sub.buyer_name)
+        else:
+            self.buyers_by_item.setdefault(sub.item_name, set()).add(sub.buyer_name)
+        return True
+
+    def remove_subscription(self, buyer_name, item_name):
+        sub = self.subscriptions.pop((buyer_name, item_name), None)
+        if sub is None:
+            return None
+        if is_pattern(item_name):
+            self.patterns.remove(item_name, buyer_name)
+            return sub
+        buyers = self.buyers_by_item.get(item_name)
+        if buyers is not None:
+            buyers.discard(buyer_name)
+            if not buyers:
+                del self.buyers_by_item[item_name]
+        return sub
+
+    def buyers_for(self, item_name):
+        """
+        Buyers to announce item_name to: exact subscribers plus every
+        matching pattern (one trie walk over the name).
+        """
+        exact = self.buyers_by_item.get(item_name, ())
+        if not self.patterns.count:
+            return exact
+        matched = self.patterns.match(item_name)
+        if exact:
+            matched |= exact
+        return matched
+
+    # ----- Snapshots (persistence / UI) -----
+
+    def user_list(self):
+        return list(self.users.values())
+
+    def item_list(self):
+        return list(self.items.values())
+
+    def subscription_list(self):
+        return list(self.subscriptions.values())
+
+    def snapshot_state(self):
+        """
+        Detached copies of every record, safe to serialize outside the lock.
+        """
+        return {
+            "users": [u.copy() for u in self.users.values()],
+            "items": [i.copy() for i in self.items.values()],
+            "subscriptions": [s.copy() for s in self.subscriptions.values()],
+        }
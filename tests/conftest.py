@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auction_engine import AuctionEngine
+from journal import Journal
+from protocol import PROTOCOL_VERSION, decode, encode
+
+CLIENT = ("127.0.0.1", 40000)
+
+class EngineHarness:
+    """
+    An AuctionEngine driven in-process: datagrams go straight to
+    handle_datagram and everything it sends is collected, decoded, in sent.
+    No threads run; tests flush the publisher and expire items themselves.
+    """
+    def __init__(self, **kwargs):
+        self.engine = AuctionEngine(port=0, journal=Journal(fsync_mode="never"), **kwargs)
+        self.engine.journal.open(sync_thread=False)
+        self.engine.running = True
+        self.engine.sendto = lambda data, addr: self.sent.append((addr, data))
+        self.sent = []
+        self.rq = 0
+
+    def close(self):
+        self.engine.running = False
+        self.engine.journal.close()
+
+    def send(self, opcode, *fields, addr=CLIENT, version=PROTOCOL_VERSION):
+        """
+        Sends one command and returns the decoded replies to it (what was
+        sent back to addr meanwhile).
+        """
+        self.rq += 1
+        start = len(self.sent)
+        self.engine.handle_datagram(encode(version, opcode, self.rq, fields), addr)
+        return [decode(data) for to, data in self.sent[start:] if to == addr]
+
+    def flush(self):
+        """
+        Runs one publisher flush and returns what it sent as (addr, message).
+        """
+        start = len(self.sent)
+        self.engine.publisher.flush_pending()
+        return [(addr, decode(data)) for addr, data in self.sent[start:]]
+
+@pytest.fixture
+def harness(tmp_path, monkeypatch):
+    # The engine's data files are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    harness = EngineHarness()
+    yield harness
+    harness.close()
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from async_server import AsyncAuctionServer
+from auction_engine import AuctionEngine
+from journal import Journal
+from protocol import OP_REGISTER, OP_REGISTERED, PROTOCOL_VERSION, decode, encode
+from records import Item
+
+class Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.replies = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.replies.put_nowait(decode(data))
+
+async def exercise(server):
+    while server.transport is None:
+        await asyncio.sleep(0.001)
+    engine = server.engine
+    address = server.transport.get_extra_info("sockname")
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(Client, remote_addr=address)
+    try:
+        transport.sendto(encode(PROTOCOL_VERSION, OP_REGISTER, 1, ("s1", "Seller", "127.0.0.1", "5000", "0")))
+        reply = await asyncio.wait_for(client.replies.get(), 5)
+        assert (reply[1], reply[2]) == (OP_REGISTERED, 1)
+
+        # Expiry runs as a loop timer armed at the item's deadline
+        item = Item("1", "s1", "lamp", "brass", 5.0, 1, time.time() + 0.05)
+        engine.store.add_item(item)
+        engine.expiry.schedule(item.item_id, item.end_time)
+        for _ in range(200):
+            if engine.store.get_item(item.item_id) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert engine.store.get_item(item.item_id) is None
+    finally:
+        transport.close()
+        server.shutdown()
+
+def test_serves_commands_and_expires_on_the_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = AuctionEngine(host="127.0.0.1", port=0, journal=Journal(fsync_mode="never"))
+    server = AsyncAuctionServer(engine)
+
+    async def main():
+        checks = asyncio.ensure_future(exercise(server))
+        await server.serve()
+        await checks
+    asyncio.run(asyncio.wait_for(main(), 10))
+    assert server.transport.is_closing()
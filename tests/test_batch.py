@@ -0,0 +1,48 @@
+from conftest import CLIENT
+from protocol import (BATCH_PAYLOAD_LIMIT, OP_BATCH, OP_ITEM_LISTED, OP_LIST_DENIED, OP_LIST_ITEM, OP_REGISTER,
+                      OP_REGISTERED, PROTOCOL_VERSION, TEXT_VERSION, decode, encode, encode_batch, pack_batches)
+
+def frames_of(datagrams):
+    frames = []
+    for data in datagrams:
+        version, opcode, rq, fields = decode(data)
+        assert opcode == OP_BATCH
+        frames += fields
+    return frames
+
+def test_batch_round_trip():
+    frames = [encode(PROTOCOL_VERSION, OP_REGISTERED, n, ()) for n in range(5)]
+    assert decode(encode_batch(PROTOCOL_VERSION, 9, frames)) == (PROTOCOL_VERSION, OP_BATCH, 9, frames)
+
+def test_text_batch_round_trip():
+    frames = [b"REGISTERED 1", b"LIST-DENIED 2 Seller at capacity"]
+    version, opcode, rq, fields = decode(encode_batch(TEXT_VERSION, 4, frames))
+    assert (version, opcode, rq, fields) == (TEXT_VERSION, OP_BATCH, "4", frames)
+
+def test_pack_batches_respects_the_limit_and_order():
+    frames = [encode(PROTOCOL_VERSION, OP_LIST_DENIED, n, ["x" * (n % 90)]) for n in range(200)]
+    datagrams = pack_batches(PROTOCOL_VERSION, 0, frames)
+    assert len(datagrams) > 1
+    assert all(len(data) <= BATCH_PAYLOAD_LIMIT for data in datagrams)
+    assert frames_of(datagrams) == frames
+
+def test_oversized_frame_gets_its_own_batch():
+    big = encode(PROTOCOL_VERSION, OP_LIST_DENIED, 1, ["x" * 3000])
+    small = encode(PROTOCOL_VERSION, OP_REGISTERED, 2, ())
+    datagrams = pack_batches(PROTOCOL_VERSION, 0, [small, big, small])
+    assert [frames_of([data]) for data in datagrams] == [[small], [big], [small]]
+
+def test_batch_request_gets_one_batch_of_replies(harness):
+    frames = [
+        encode(PROTOCOL_VERSION, OP_REGISTER, 1, ["s1", "Seller", "127.0.0.1", "5000", "0"]),
+        encode(PROTOCOL_VERSION, OP_LIST_ITEM, 2, ["s1", "lamp", "brass", 5.0, 60]),
+        b"\xa5garbage",
+        encode(PROTOCOL_VERSION, OP_LIST_ITEM, 3, ["nobody", "desk", "oak", 5.0, 60]),
+    ]
+    harness.engine.handle_datagram(encode_batch(PROTOCOL_VERSION, 50, frames), CLIENT)
+    assert len(harness.sent) == 1
+    addr, data = harness.sent[0]
+    assert addr == CLIENT and decode(data)[2] == 50
+    replies = [decode(frame) for frame in frames_of([data])]
+    assert [(r[1], r[2], r[3]) for r in replies] == [(OP_REGISTERED, 1, []), (OP_ITEM_LISTED, 2, []),
+                                                     (OP_LIST_DENIED, 3, ["UserNotFound"])]
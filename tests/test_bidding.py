@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import EngineHarness
+from protocol import OP_BID, OP_BID_ACCEPTED, OP_BID_REJECTED, OP_LIST_ITEM, OP_REGISTER, OP_SUBSCRIBE
+
+def setup_item(harness, duration=60):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    harness.send(OP_REGISTER, "b2", "Buyer", "127.0.0.1", "5002", "0")
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, duration)
+    return harness.engine.store.items_named("lamp")[0]
+
+def bid(harness, buyer, item_id, amount):
+    [reply] = harness.send(OP_BID, buyer, item_id, amount)
+    return reply[1], reply[3]
+
+def test_bid_rules(harness):
+    item = setup_item(harness)
+    assert bid(harness, "b1", item.item_id, 4.0) == (OP_BID_REJECTED, ["BidTooLow", 5.0])
+    assert bid(harness, "b1", item.item_id, 5.0)[0] == OP_BID_ACCEPTED
+    # Later bids must beat the leader
+    assert bid(harness, "b2", item.item_id, 5.0) == (OP_BID_REJECTED, ["BidTooLow", 5.0])
+    assert bid(harness, "b2", item.item_id, float("nan")) == (OP_BID_REJECTED, ["InvalidAmount", 5.0])
+    assert bid(harness, "s1", item.item_id, 9.0) == (OP_BID_REJECTED, ["NotBuyerOrNotFound", 0.0])
+    assert bid(harness, "b2", "404", 9.0) == (OP_BID_REJECTED, ["NoSuchItem", 0.0])
+    assert bid(harness, "b2", item.item_id, 6.0)[0] == OP_BID_ACCEPTED
+    assert (item.current_price, item.high_bidder) == (6.0, "b2")
+
+def test_late_bid_extends_and_outlives_the_old_deadline(harness):
+    engine = harness.engine
+    item = setup_item(harness)
+    item.end_time = time.time() + 1
+    old_deadline = item.end_time
+    assert bid(harness, "b1", item.item_id, 5.0)[0] == OP_BID_ACCEPTED
+    assert item.end_time >= old_deadline + engine.snipe_window - 2
+    # The expiry pass for the old deadline finds it moved and leaves it open
+    engine.expire_items([item.item_id])
+    assert engine.store.get_item(item.item_id) is item
+
+def test_bid_after_deadline_or_expiry_is_rejected(harness):
+    engine = harness.engine
+    item = setup_item(harness)
+    item.end_time = time.time() - 1
+    assert bid(harness, "b1", item.item_id, 9.0) == (OP_BID_REJECTED, ["AuctionClosed", 5.0])
+    engine.expire_items([item.item_id])
+    assert bid(harness, "b1", item.item_id, 9.0) == (OP_BID_REJECTED, ["NoSuchItem", 0.0])
+    assert item.high_bidder is None
+
+@pytest.mark.parametrize("run", range(3))
+def test_bids_racing_expiry_and_flushes(tmp_path, monkeypatch, run):
+    """
+    The receive thread bids while the expiry and publisher threads run, as in
+    the threaded server. Every accepted bid must be journaled before the
+    item's expiry, and the closed item must hold the last accepted bid.
+    """
+    monkeypatch.chdir(tmp_path)
+    harness = EngineHarness(snipe_window=0.02)
+    engine = harness.engine
+    item = setup_item(harness)
+    harness.send(OP_SUBSCRIBE, "b2", "lamp")
+    item.end_time = time.time() + 0.05
+    engine.expiry.schedule(item.item_id, item.end_time)
+    done = threading.Event()
+    accepted = []
+    errors = []
+
+    def bidder():
+        try:
+            place_bids()
+        except Exception as e:
+            errors.append(e)
+            done.set()
+
+    def place_bids():
+        amount = 5.0
+        while not done.is_set():
+            # Accepted bids keep extending the deadline; after a while only
+            # losing ones race the expiry
+            offer = amount if len(accepted) < 200 else 1.0
+            opcode, fields = bid(harness, ("b1", "b2")[len(accepted) % 2], item.item_id, offer)
+            if opcode == OP_BID_ACCEPTED:
+                accepted.append(amount)
+                amount += 1.0
+            elif fields[0] == "NoSuchItem":
+                return
+            elif fields[0] not in ("AuctionClosed", "BidTooLow"):
+                raise AssertionError(fields)
+
+    def expirer():
+        while engine.store.get_item(item.item_id) is not None:
+            engine.expire_items(engine.expiry.pop_due())
+            time.sleep(0.001)
+        done.set()
+
+    def flusher():
+        while not done.is_set():
+            engine.publisher.flush_pending()
+
+    threads = [threading.Thread(target=target) for target in (bidder, expirer, flusher)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+    assert errors == []
+    # The flusher may have stopped before the closing announcement
+    engine.publisher.flush_pending()
+    harness.close()
+
+    with open(engine.journal.path) as f:
+        records = [json.loads(line) for line in f]
+    ops = [(r["op"], r.get("price")) for r in records if r.get("item_id") == item.item_id]
+    assert ops[-1] == ("expire", None)
+    assert [price for op, price in ops[:-1]] == accepted
+    assert item.current_price == (accepted[-1] if accepted else 5.0)
+    assert item.item_id not in engine.publisher.versions.entries
@@ -0,0 +1,142 @@
+import time
+
+from protocol import (CHANGED_CLOSED, CHANGED_DEADLINE, CHANGED_PRICE, OP_AUCTION_ANNOUNCE, OP_AUCTION_DELTA,
+                      OP_AUCTION_SNAPSHOT, OP_BATCH, OP_BID, OP_LIST_ITEM, OP_REGISTER, OP_RESYNC,
+                      OP_RESYNC_DENIED, OP_SUBSCRIBE, decode)
+from publisher import ItemVersions
+from records import Item
+
+B1 = ("127.0.0.1", 5001)
+B2 = ("127.0.0.1", 5002)
+OLD = ("127.0.0.1", 5003)
+
+def test_versions_advance_only_on_change():
+    versions = ItemVersions()
+    assert versions.advance("1", 5.0, 100.0, False) == (1, None)
+    assert versions.advance("1", 5.0, 100.0, False) == (1, 0)
+    assert versions.advance("1", 6.0, 100.0, False) == (2, CHANGED_PRICE)
+    assert versions.advance("1", 7.0, 130.0, False) == (3, CHANGED_PRICE | CHANGED_DEADLINE)
+    assert versions.advance("1", 7.0, 130.0, True) == (4, CHANGED_CLOSED)
+    versions.forget("1")
+    assert len(versions) == 0
+
+def test_snapshot_fields_are_the_last_announced_state():
+    versions = ItemVersions()
+    item = Item("1", "s1", "lamp", "brass", 5.0, 60, 1000.0)
+    assert versions.snapshot_fields(item, now=990.0) == ("1", 0, "lamp", "brass", 5.0, 10)
+    versions.advance("1", 5.0, 1000.0, False)
+    item.current_price = 8.0
+    assert versions.snapshot_fields(item, now=990.0) == ("1", 1, "lamp", "brass", 5.0, 10)
+
+def updates(sent, addr):
+    """
+    (opcode, fields) of the announcements sent to addr, BATCHes unpacked.
+    """
+    found = []
+    for to, message in sent:
+        if to != addr:
+            continue
+        frames = [decode(frame) for frame in message[3]] if message[1] == OP_BATCH else [message]
+        found += [(m[1], m[3]) for m in frames
+                  if m[1] in (OP_AUCTION_ANNOUNCE, OP_AUCTION_SNAPSHOT, OP_AUCTION_DELTA)]
+    return found
+
+def setup(harness):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", *map(str, B1), "0")
+    harness.send(OP_REGISTER, "old", "Buyer", *map(str, OLD), "0", version=2)
+    harness.send(OP_SUBSCRIBE, "b1", "lamp")
+    harness.send(OP_SUBSCRIBE, "old", "lamp", version=2)
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    item = harness.engine.store.items_named("lamp")[0]
+    return item, harness.flush()
+
+def test_snapshot_then_deltas(harness):
+    item, sent = setup(harness)
+    [(opcode, fields)] = updates(sent, B1)
+    assert opcode == OP_AUCTION_SNAPSHOT and fields[:5] == [item.item_id, 1, "lamp", "brass", 5.0]
+    # Older buyers keep the full announcement
+    assert [opcode for opcode, _ in updates(sent, OLD)] == [OP_AUCTION_ANNOUNCE]
+
+    harness.send(OP_BID, "old", item.item_id, 6.0, version=2)
+    harness.send(OP_BID, "old", item.item_id, 7.0, version=2)
+    sent = harness.flush()
+    assert updates(sent, B1) == [(OP_AUCTION_DELTA, [item.item_id, "lamp", 2, CHANGED_PRICE, 7.0, 0])]
+    assert updates(sent, OLD)[0][1][3] == 7.0
+
+def test_new_subscriber_gets_a_snapshot_at_the_current_version(harness):
+    item, _ = setup(harness)
+    harness.send(OP_BID, "b1", item.item_id, 6.0)
+    harness.flush()
+    harness.send(OP_REGISTER, "b2", "Buyer", *map(str, B2), "0")
+    harness.send(OP_SUBSCRIBE, "b2", "lamp")
+    sent = harness.flush()
+    [(opcode, fields)] = updates(sent, B2)
+    assert opcode == OP_AUCTION_SNAPSHOT and fields[1] == 2 and fields[4] == 6.0
+    # Nothing changed for the others
+    assert updates(sent, B1) == []
+
+def test_gap_is_repaired_by_resync(harness):
+    item, _ = setup(harness)
+    for amount in (6.0, 7.0):
+        harness.send(OP_BID, "old", item.item_id, amount, version=2)
+        harness.flush()     # b1 "loses" versions 2 and 3
+    harness.send(OP_BID, "old", item.item_id, 8.0, version=2)
+    [(opcode, fields)] = updates(harness.flush(), B1)
+    assert opcode == OP_AUCTION_DELTA and fields[2] == 4      # b1 had 1: a gap
+    [reply] = harness.send(OP_RESYNC, "b1", item.item_id)
+    assert reply[1] == OP_AUCTION_SNAPSHOT and reply[2] == harness.rq
+    assert reply[3][:5] == [item.item_id, 4, "lamp", "brass", 8.0]
+
+def test_resync_denials(harness):
+    item, _ = setup(harness)
+    [reply] = harness.send(OP_RESYNC, "s1", item.item_id)
+    assert (reply[1], reply[3]) == (OP_RESYNC_DENIED, ["NotBuyerOrNotFound"])
+    [reply] = harness.send(OP_RESYNC, "b1", "404")
+    assert (reply[1], reply[3]) == (OP_RESYNC_DENIED, ["NoSuchItem"])
+
+def test_close_is_a_delta_and_forgets_the_version(harness):
+    engine = harness.engine
+    item, _ = setup(harness)
+    item.end_time = time.time() - 1
+    engine.expire_items([item.item_id])
+    sent = harness.flush()
+    # Moving the deadline into the past to close it also counts as a change
+    closing = CHANGED_CLOSED | CHANGED_DEADLINE
+    assert updates(sent, B1) == [(OP_AUCTION_DELTA, [item.item_id, "lamp", 2, closing, 0.0, 0])]
+    assert item.item_id not in engine.publisher.versions.entries
+    [reply] = harness.send(OP_RESYNC, "b1", item.item_id)
+    assert (reply[1], reply[3]) == (OP_RESYNC_DENIED, ["NoSuchItem"])
+
+def test_unwatched_item_forgets_its_version_at_expiry(harness):
+    engine = harness.engine
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", *map(str, B1), "0")
+    harness.send(OP_LIST_ITEM, "s1", "desk", "oak", 5.0, 60)
+    item = engine.store.items_named("desk")[0]
+    harness.send(OP_BID, "b1", item.item_id, 6.0)
+    harness.flush()
+    assert item.item_id in engine.publisher.versions.entries
+    item.end_time = time.time() - 1
+    engine.expire_items([item.item_id])
+    assert item.item_id not in engine.publisher.versions.entries
+
+def test_versions_and_frames_come_from_one_read(harness, monkeypatch):
+    """
+    A BID landing while flush() works on the item must not split one
+    version between two prices.
+    """
+    engine = harness.engine
+    item, _ = setup(harness)
+    harness.send(OP_BID, "b1", item.item_id, 6.0)
+    advance = engine.publisher.versions.advance
+
+    def advance_then_bid(item_id, price, end_time, closed):
+        result = advance(item_id, price, end_time, closed)
+        with engine.item_lock(item_id):
+            engine.store.record_bid(item, 50.0, "b1", item.end_time)
+        return result
+    monkeypatch.setattr(engine.publisher.versions, "advance", advance_then_bid)
+    sent = harness.flush()
+    assert updates(sent, B1) == [(OP_AUCTION_DELTA, [item.item_id, "lamp", 2, CHANGED_PRICE, 6.0, 0])]
+    assert engine.publisher.versions.entries[item.item_id][:2] == [2, 6.0]
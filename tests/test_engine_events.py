@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import time
+
+from protocol import (OP_BID, OP_DE_REGISTER, OP_DE_SUBSCRIBE, OP_LIST_ITEM, OP_LOGIN, OP_REGISTER, OP_SESSION,
+                      OP_SUBSCRIBE)
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, data):
+        self.events.append((event, data))
+
+    def take(self):
+        events, self.events = self.events, []
+        return events
+
+def test_engine_imports_no_ui():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, auction_engine; sys.exit('tkinter' in sys.modules or 'customtkinter' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+
+def test_mutations_emit_the_events_the_ui_follows(harness):
+    engine = harness.engine
+    recorder = Recorder()
+    engine.add_listener(recorder)
+
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    assert recorder.take() == [("users_changed", ["s1"]), ("users_changed", ["b1"])]
+
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    item = engine.store.items_named("lamp")[0]
+    assert recorder.take() == [("items_changed", [item.item_id])]
+
+    harness.send(OP_SUBSCRIBE, "b1", "lamp")
+    harness.send(OP_DE_SUBSCRIBE, "b1", "lamp")
+    assert recorder.take() == [("subscriptions_changed", [("b1", "lamp")])] * 2
+
+    harness.send(OP_BID, "b1", item.item_id, 6.0)
+    assert recorder.take() == [("items_changed", [item.item_id])]
+
+    harness.send(OP_SESSION, "b1", "6001")
+    assert recorder.take() == [("users_changed", ["b1"])]
+
+    item.end_time = time.time() - 1
+    engine.expire_items([item.item_id])
+    assert recorder.take() == [("items_changed", [item.item_id])]
+
+    harness.send(OP_DE_REGISTER, "b1")
+    assert recorder.take() == [("users_changed", ["b1"])]
+
+def test_no_events_for_commands_that_change_nothing(harness):
+    recorder = Recorder()
+    harness.engine.add_listener(recorder)
+    harness.send(OP_LOGIN, "nobody", "Buyer")
+    harness.send(OP_LIST_ITEM, "nobody", "lamp", "brass", 5.0, 60)
+    harness.send(OP_DE_REGISTER, "nobody")
+    assert recorder.events == []
+
+def test_removed_listener_hears_nothing(harness):
+    recorder = Recorder()
+    harness.engine.add_listener(recorder)
+    harness.engine.remove_listener(recorder)
+    harness.engine.remove_listener(recorder)
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    assert recorder.events == []
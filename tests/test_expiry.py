@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from expiry import ExpiryScheduler
+from protocol import (OP_ITEM_LISTED, OP_LIST_DENIED, OP_LIST_ITEM, OP_LOGIN, OP_LOGIN_OK, OP_REGISTER,
+                      OP_REGISTERED, TEXT_VERSION)
+
+def test_scheduler_pops_due_keys_in_deadline_order():
+    expiry = ExpiryScheduler()
+    for key, deadline in (("c", 30.0), ("a", 10.0), ("b", 20.0)):
+        expiry.schedule(key, deadline)
+    assert expiry.pop_due(now=5.0) == []
+    assert expiry.pop_due(now=25.0) == ["a", "b"]
+    assert len(expiry) == 1
+
+def test_rescheduled_key_pops_twice():
+    # Entries are never moved: the owner ignores the stale one
+    expiry = ExpiryScheduler()
+    expiry.schedule("a", 10.0)
+    expiry.schedule("a", 20.0)
+    assert expiry.pop_due(now=30.0) == ["a", "a"]
+
+def test_expire_items_closes_due_items_only(harness):
+    engine = harness.engine
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    harness.send(OP_LIST_ITEM, "s1", "desk", "oak", 5.0, 60)
+    lamp, desk = sorted(engine.store.item_list(), key=lambda item: item.item_name, reverse=True)
+    lamp.end_time = time.time() - 1
+    engine.expire_items([lamp.item_id, desk.item_id])
+    assert engine.store.get_item(lamp.item_id) is None
+    assert engine.store.get_item(desk.item_id) is desk
+    assert engine.store.seller_item_count("s1") == 1
+
+@pytest.mark.parametrize("duration", ["0", "-5", "2147483648", "1" * 400, "soon"])
+def test_list_item_rejects_out_of_range_durations(harness, duration):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    replies = harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", "5", duration, version=TEXT_VERSION)
+    assert [(r[1], r[3]) for r in replies] == [(OP_LIST_DENIED, ["InvalidDuration"])]
+
+def test_longest_duration_is_accepted(harness):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    replies = harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 2**31 - 1)
+    assert [r[1] for r in replies] == [OP_ITEM_LISTED]
+
+def test_failing_handler_drops_only_its_datagram(harness, monkeypatch):
+    engine = harness.engine
+    assert [r[1] for r in harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")] == [OP_REGISTERED]
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setitem(engine.handlers, OP_LIST_ITEM, broken)
+    assert harness.send(OP_LIST_ITEM, "b1", "lamp", "brass", 5.0, 60) == []
+    assert engine.metrics.counters["failed.LIST_ITEM"] == 1
+    assert [r[1] for r in harness.send(OP_LOGIN, "b1", "Buyer")] == [OP_LOGIN_OK]
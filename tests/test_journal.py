@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from journal import Journal, read_records
+from records import Item, Subscription, User
+from snapshot import SnapshotError
+from store import AuctionStore
+
+def write_history(journal):
+    """
+    Appends a short history to journal and returns the store it describes.
+    """
+    store = AuctionStore()
+    seller = User("s1", "Seller", "127.0.0.1", 5000, 0, 3)
+    buyer = User("b1", "Buyer", "127.0.0.1", 5001, 6001, 3)
+    gone = User("b2", "Buyer", "127.0.0.1", 5002, 0)
+    lamp = Item("1", "s1", "lamp", "a brass lamp", 5.0, 60, 1000.0)
+    desk = Item("2", "s1", "desk", "an oak desk", 50.0, 60, 1100.0)
+    for user in (seller, buyer, gone):
+        journal.append("register", user=user)
+        store.add_user(user.copy())
+    journal.append("deregister", name="b2")
+    store.remove_user("b2")
+    for item in (lamp, desk):
+        journal.append("list_item", item=item)
+        store.add_item(item.copy())
+    journal.append("subscribe", sub=Subscription("b1", "lamp"))
+    store.add_subscription(Subscription("b1", "lamp"))
+    journal.append("bid", item_id="1", bidder="b1", price=7.5, end_time=1010.0)
+    store.record_bid(store.get_item("1"), 7.5, "b1", 1010.0)
+    journal.append("expire", item_id="2")
+    store.remove_item("2")
+    return store
+
+def assert_same_state(recovered, expected):
+    assert sorted(recovered.user_list(), key=lambda u: u.name) == sorted(expected.user_list(), key=lambda u: u.name)
+    assert sorted(recovered.item_list(), key=lambda i: i.item_id) == sorted(expected.item_list(),
+                                                                           key=lambda i: i.item_id)
+    assert recovered.subscription_list() == expected.subscription_list()
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path / "auction.journal"), str(tmp_path / "auction_snapshot.bin"),
+                      fsync_mode="never")
+    journal.open(sync_thread=False)
+    yield journal
+    journal.close()
+
+def reopen(journal):
+    journal.close()
+    fresh = Journal(journal.path, journal.snapshot_path, fsync_mode="never")
+    store = AuctionStore()
+    return fresh, store, fresh.recover(store)
+
+def test_recover_replays_journal(journal):
+    expected = write_history(journal)
+    fresh, store, found = reopen(journal)
+    assert found
+    assert_same_state(store, expected)
+    assert fresh.seq == journal.seq
+
+def test_recover_with_nothing_on_disk(tmp_path):
+    journal = Journal(str(tmp_path / "auction.journal"), str(tmp_path / "auction_snapshot.bin"))
+    assert not journal.recover(AuctionStore())
+
+def test_torn_tail_is_cut_and_ignored(journal):
+    expected = write_history(journal)
+    journal.sync()
+    with open(journal.path, "a") as f:
+        f.write('{"seq": 99, "op": "expire", "item_')
+    fresh, store, _ = reopen(journal)
+    assert_same_state(store, expected)
+    # The torn line is gone, so the next append starts on a clean line
+    records, valid_length = read_records(fresh.path)
+    assert valid_length == os.path.getsize(fresh.path)
+    assert records[-1]["seq"] == fresh.seq
+
+def test_compaction_then_tail(journal):
+    expected = write_history(journal)
+    journal.compact(expected)
+    assert not os.path.exists(journal.old_path)
+    assert os.path.getsize(journal.path) == 0
+    journal.append("de_subscribe", buyer_name="b1", item_name="lamp")
+    expected.remove_subscription("b1", "lamp")
+    fresh, store, found = reopen(journal)
+    assert found
+    assert_same_state(store, expected)
+    assert fresh.records_since_snapshot == 1
+
+def test_interrupted_compaction_keeps_both_segments(journal):
+    expected = write_history(journal)
+    # rotate() without write_snapshot(): a crash before the snapshot landed
+    journal.rotate()
+    journal.append("deregister", name="s1")
+    expected.remove_user("s1")
+    journal.rotate()
+    _, store, _ = reopen(journal)
+    assert_same_state(store, expected)
+
+def test_corrupt_snapshot_is_an_error(journal):
+    write_history(journal)
+    with open(journal.snapshot_path, "wb") as f:
+        f.write(b"not a snapshot")
+    with pytest.raises(SnapshotError):
+        reopen(journal)
+
+def test_bad_line_with_records_after_it_is_an_error(journal):
+    write_history(journal)
+    journal.sync()
+    with open(journal.path, "rb") as f:
+        lines = f.readlines()
+    lines[3] = b'{"seq": 4, "op": "dereg\n'
+    with open(journal.path, "wb") as f:
+        f.writelines(lines)
+    size = os.path.getsize(journal.path)
+    with pytest.raises(SnapshotError, match="corrupt record"):
+        reopen(journal)
+    # Nothing was cut: the records after the bad line are still there
+    assert os.path.getsize(journal.path) == size
+
+def test_unparseable_last_line_counts_as_torn(journal):
+    expected = write_history(journal)
+    journal.sync()
+    with open(journal.path, "a") as f:
+        f.write('{"seq": 99, "op"\n')
+    _, store, _ = reopen(journal)
+    assert_same_state(store, expected)
@@ -0,0 +1,18 @@
+import pytest
+
+from loadgen import DEFAULT_MIX, MIX_OPS, parse_mix, percentiles
+
+def test_parse_mix():
+    assert set(parse_mix(DEFAULT_MIX)) <= set(MIX_OPS)
+    assert parse_mix(" bid=3, search") == {"bid": 3.0, "search": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("bid=1,teleport=2")
+    with pytest.raises(ValueError):
+        parse_mix("bid=heavy")
+
+def test_percentiles_in_milliseconds():
+    assert percentiles([]) == {"count": 0}
+    summary = percentiles([n / 1000 for n in range(1000, 0, -1)])
+    assert summary["count"] == 1000
+    assert (summary["p50"], summary["p90"], summary["p99"], summary["max"]) == (501.0, 901.0, 991.0, 1000.0)
+    assert summary["mean"] == 500.5
@@ -0,0 +1,64 @@
+import auction_engine
+from log_pipeline import LogPipeline, drain
+from protocol import OP_STATS
+
+def test_every_consumer_gets_every_record():
+    pipeline = LogPipeline()
+    first, second = pipeline.subscribe(), pipeline.subscribe()
+    for n in range(3):
+        pipeline.push("info", f"m{n}")
+    assert [r[2] for r in drain(first, 10)] == ["m0", "m1", "m2"]
+    assert [r[2] for r in drain(second, 2)] == ["m0", "m1"]
+    assert len(second) == 1
+
+def test_slow_consumer_drops_the_oldest():
+    pipeline = LogPipeline()
+    consumer = pipeline.subscribe(maxlen=2)
+    for n in range(5):
+        pipeline.push("info", f"m{n}")
+    assert [r[2] for r in drain(consumer, 10)] == ["m3", "m4"]
+
+def test_sampling_reports_what_it_dropped():
+    pipeline = LogPipeline(sampling={"BID": 3})
+    consumer = pipeline.subscribe()
+    for n in range(7):
+        pipeline.push("BID", f"m{n}")
+        pipeline.push("info", f"i{n}")
+    bids = [r[2] for r in drain(consumer, 100) if r[1] == "BID"]
+    assert bids == ["m0", "m3 (+2 BID messages suppressed)", "m6 (+2 BID messages suppressed)"]
+
+def test_rate_limit_caps_a_burst():
+    pipeline = LogPipeline(rate_limits={"*": 5})
+    consumer = pipeline.subscribe()
+    for n in range(100):
+        pipeline.push("LOGIN", f"m{n}")
+    assert 5 <= len(consumer) < 10
+
+def test_no_consumers_no_work():
+    pipeline = LogPipeline(rate_limits={"*": 1})
+    pipeline.push("info", "nobody listens")
+    assert pipeline.buckets == {}
+
+def test_lazy_messages_are_built_only_when_admitted():
+    built = []
+
+    def message(n):
+        return lambda: built.append(n) or f"m{n}"
+    pipeline = LogPipeline(sampling={"BID": 2})
+    pipeline.push("BID", message(0))
+    assert built == []      # no consumers yet
+    consumer = pipeline.subscribe()
+    for n in range(1, 5):
+        pipeline.push("BID", message(n))
+    assert built == [1, 3]
+    assert [r[2] for r in drain(consumer, 10)] == ["m1", "m3 (+1 BID messages suppressed)"]
+
+def test_datagram_log_line_is_not_built_when_dropped(harness, monkeypatch):
+    calls = []
+    monkeypatch.setattr(auction_engine, "describe", lambda *args: calls.append(args) or "described")
+    harness.send(OP_STATS)
+    assert calls == []      # the harness engine's pipeline has no consumers
+    consumer = harness.engine.logs.subscribe()
+    harness.send(OP_STATS)
+    assert len(calls) == 1
+    assert any(record[2].endswith(": described") for record in drain(consumer, 10))
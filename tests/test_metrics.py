@@ -0,0 +1,48 @@
+import json
+
+from metrics import LATENCY_BUCKETS, Histogram, Metrics, dump_metrics
+from protocol import OP_REGISTER, OP_STATS, OP_STATS_REPLY
+
+def test_histogram_percentiles_are_bucket_bounds():
+    histogram = Histogram()
+    for _ in range(99):
+        histogram.record(0.0003)
+    histogram.record(0.2)
+    assert histogram.percentile(0.5) == 0.0005
+    assert histogram.percentile(0.999) == 0.25
+    assert histogram.count == 100 and histogram.max == 0.2
+
+def test_overflow_bucket_reports_the_max():
+    histogram = Histogram()
+    histogram.record(LATENCY_BUCKETS[-1] * 3)
+    assert histogram.percentile(0.5) == LATENCY_BUCKETS[-1] * 3
+    assert histogram.snapshot()["buckets"] == {"inf": 1}
+
+def test_snapshot_holds_counters_gauges_and_latency():
+    metrics = Metrics()
+    metrics.incr("received.LOGIN")
+    metrics.incr("received.LOGIN", 2)
+    metrics.observe("command.LOGIN", 0.001)
+    metrics.gauge("users", lambda: 3)
+    metrics.gauge("broken", lambda: 1 / 0)
+    snapshot = json.loads(metrics.to_json())
+    assert snapshot["counters"] == {"received.LOGIN": 3}
+    assert snapshot["gauges"] == {"broken": None, "users": 3}
+    assert snapshot["latency_ms"]["command.LOGIN"]["count"] == 1
+
+def test_dump_is_complete_json(tmp_path):
+    metrics = Metrics()
+    metrics.incr("x")
+    path = str(tmp_path / "metrics.json")
+    dump_metrics(metrics, path)
+    with open(path) as f:
+        assert json.load(f)["counters"] == {"x": 1}
+
+def test_stats_command_reports_engine_counters(harness):
+    harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    [reply] = harness.send(OP_STATS)
+    assert reply[1] == OP_STATS_REPLY
+    counters = json.loads(reply[3][0])["counters"]
+    assert counters["received.REGISTER"] == 2
+    assert counters["denied.REGISTER-DENIED.NameInUse"] == 1
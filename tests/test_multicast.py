@@ -0,0 +1,146 @@
+import ipaddress
+import socket
+
+import pytest
+
+from conftest import EngineHarness
+from multicast import (MULTICAST_BASE, MULTICAST_GROUPS, MulticastGroups, group_address, join_group,
+                       receiver_socket)
+from protocol import (OP_AUCTION_SNAPSHOT, OP_LIST_ITEM, OP_LOGIN, OP_MCAST_CONFIG, OP_MCAST_DENIED,
+                      OP_MCAST_INFO, OP_MCAST_JOIN, OP_MCAST_OK, OP_REGISTER, OP_SUBSCRIBE, decode)
+
+B1 = ("127.0.0.1", 5001)
+B2 = ("127.0.0.1", 5002)
+
+def test_group_address_is_stable_and_in_range():
+    base = ipaddress.IPv4Address(MULTICAST_BASE)
+    for name in ("lamp", "desk", "é", ""):
+        address = ipaddress.IPv4Address(group_address(name))
+        assert address.is_multicast
+        assert base <= address < base + MULTICAST_GROUPS
+        assert group_address(name) == str(address)
+    assert group_address("lamp", "239.1.0.0", 1) == "239.1.0.0"
+
+def test_base_must_be_multicast():
+    with pytest.raises(ValueError):
+        MulticastGroups(base="10.0.0.1")
+
+def test_membership():
+    groups = MulticastGroups(groups=8)
+    assert groups.group_for("lamp") == group_address("lamp", MULTICAST_BASE, 8)
+    groups.join("b1", "lamp")
+    groups.join("b1", "desk")
+    groups.join("b2", "lamp")
+    assert groups.covers("b1", "lamp") and not groups.covers("b2", "desk")
+    assert groups.member_count() == 3
+    groups.leave("b1", "lamp")
+    groups.leave("b1", "desk")
+    assert "b1" not in groups.joined
+    groups.forget("b2")
+    assert groups.member_count() == 0
+
+def test_send_needs_an_open_socket():
+    with pytest.raises(OSError):
+        MulticastGroups().send(b"data", group_address("lamp"))
+
+class RecordingGroups(MulticastGroups):
+    """
+    MulticastGroups that records what it would send instead of opening a socket.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = []
+
+    def send(self, data, group):
+        self.sent.append((group, decode(data)))
+
+@pytest.fixture
+def groups_harness(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    harness = EngineHarness(multicast=RecordingGroups(groups=8, port=6000))
+    yield harness
+    harness.close()
+
+def setup(harness):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", *map(str, B1), "0")
+    harness.send(OP_REGISTER, "b2", "Buyer", *map(str, B2), "0")
+    harness.send(OP_SUBSCRIBE, "b1", "lamp")
+    harness.send(OP_SUBSCRIBE, "b2", "lamp")
+
+def test_mcast_info(groups_harness):
+    [reply] = groups_harness.send(OP_MCAST_INFO)
+    assert (reply[1], reply[3]) == (OP_MCAST_CONFIG, [MULTICAST_BASE, 8, 6000])
+
+def test_mcast_disabled(harness):
+    [reply] = harness.send(OP_MCAST_INFO)
+    assert (reply[1], reply[3]) == (OP_MCAST_DENIED, ["Disabled"])
+    [reply] = harness.send(OP_MCAST_JOIN, "b1", "lamp")
+    assert (reply[1], reply[3]) == (OP_MCAST_DENIED, ["Disabled"])
+
+def test_mcast_join_denials(groups_harness):
+    harness = groups_harness
+    setup(harness)
+    harness.send(OP_REGISTER, "old", "Buyer", "127.0.0.1", "5003", "0", version=2)
+    harness.send(OP_SUBSCRIBE, "old", "lamp", version=2)
+    harness.send(OP_SUBSCRIBE, "b1", "lamp*")
+    for fields, reason in ((("s1", "lamp"), "NotBuyerOrNotFound"),
+                           (("nobody", "lamp"), "NotBuyerOrNotFound"),
+                           (("old", "lamp"), "ProtocolTooOld"),
+                           (("b1", "lamp*"), "PatternSubscription"),
+                           (("b1", "desk"), "NoSubscription")):
+        [reply] = harness.send(OP_MCAST_JOIN, *fields)
+        assert (reply[1], reply[3]) == (OP_MCAST_DENIED, [reason])
+    assert harness.engine.multicast.member_count() == 0
+
+def test_joined_buyers_get_the_group_instead_of_unicast(groups_harness):
+    harness = groups_harness
+    multicast = harness.engine.multicast
+    setup(harness)
+    [reply] = harness.send(OP_MCAST_JOIN, "b1", "lamp", addr=B1)
+    assert reply[1] == OP_MCAST_OK and multicast.covers("b1", "lamp")
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    sent = harness.flush()
+    assert [addr for addr, _ in sent] == [B2]
+    [(group, message)] = multicast.sent
+    assert group == multicast.group_for("lamp") and message[1] == OP_AUCTION_SNAPSHOT
+
+def test_login_drops_the_joins(groups_harness):
+    harness = groups_harness
+    setup(harness)
+    harness.send(OP_MCAST_JOIN, "b1", "lamp", addr=B1)
+    harness.send(OP_LOGIN, "b1", "Buyer", addr=B1)
+    assert not harness.engine.multicast.covers("b1", "lamp")
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_loopback_delivery(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    port = free_port()
+    groups = MulticastGroups(port=port, interface="127.0.0.1")
+    harness = EngineHarness(multicast=groups)
+    try:
+        receiver = receiver_socket(port)
+        join_group(receiver, groups.group_for("lamp"), "127.0.0.1")
+        groups.open()
+    except OSError as e:
+        pytest.skip(f"no multicast on loopback: {e!r}")
+    receiver.settimeout(2)
+    try:
+        setup(harness)
+        harness.send(OP_MCAST_JOIN, "b1", "lamp", addr=B1)
+        harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+        harness.flush()
+        try:
+            data, _ = receiver.recvfrom(65535)
+        except socket.timeout:
+            pytest.skip("multicast loopback did not deliver")
+        message = decode(data)
+        assert message[1] == OP_AUCTION_SNAPSHOT and message[3][2:5] == ["lamp", "brass", 5.0]
+    finally:
+        receiver.close()
+        groups.close()
+        harness.close()
@@ -0,0 +1,54 @@
+import random
+
+from pattern_index import PatternIndex, compile_pattern, is_pattern, literal_prefix
+
+PATTERNS = ["laptop*", "lap*", "*book", "lap?op", "gpu-[34]090", "*", "l*p", "desk"]
+NAMES = ["laptop", "lapdog", "notebook", "lapxop", "gpu-3090", "gpu-5090", "lamp", "desk", "", "l"]
+
+def brute_force(subscriptions, name):
+    return {buyer for pattern, buyer in subscriptions if compile_pattern(pattern).match(name)}
+
+def test_helpers():
+    assert is_pattern("lap*") and is_pattern("gpu-[34]090") and not is_pattern("laptop")
+    assert literal_prefix("gpu-[34]090") == "gpu-"
+    assert literal_prefix("*book") == ""
+
+def test_match_agrees_with_fnmatch():
+    index = PatternIndex()
+    subscriptions = set()
+    for n, pattern in enumerate(PATTERNS):
+        for buyer in (f"b{n}", f"b{n + 1}"):
+            index.add(pattern, buyer)
+            subscriptions.add((pattern, buyer))
+    for name in NAMES:
+        assert index.match(name) == brute_force(subscriptions, name), name
+
+def test_add_is_idempotent_and_remove_prunes():
+    index = PatternIndex()
+    index.add("lap*", "b1")
+    index.add("lap*", "b1")
+    index.add("lap?op", "b1")
+    assert index.count == 2
+    index.remove("lap*", "b1")
+    index.remove("lap?op", "b1")
+    index.remove("lap?op", "b1")
+    index.remove("never*", "b1")
+    assert index.count == 0
+    assert index.match("laptop") == set()
+    assert index.root.children == {}
+
+def test_randomized_add_remove():
+    rng = random.Random(3)
+    index = PatternIndex()
+    subscriptions = set()
+    for _ in range(500):
+        key = (rng.choice(PATTERNS), f"b{rng.randrange(6)}")
+        if key in subscriptions and rng.random() < 0.5:
+            index.remove(*key)
+            subscriptions.discard(key)
+        else:
+            index.add(*key)
+            subscriptions.add(key)
+        assert index.count == len(subscriptions)
+    for name in NAMES:
+        assert index.match(name) == brute_force(subscriptions, name), name
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+import time
+
+from profiler import NULL_SPAN, Profiler
+from protocol import OP_PROFILE, OP_PROFILE_REPLY
+
+def test_idle_profiler_records_nothing():
+    profiler = Profiler()
+    assert profiler.span("dispatch") is NULL_SPAN
+    profiler.record("dispatch", time.perf_counter())
+    assert profiler.spans == {} and profiler.stop() is None
+
+def test_spans_and_report(tmp_path):
+    profiler = Profiler(out_dir=str(tmp_path), interval=0.001, slowest=2)
+    assert profiler.start() and not profiler.start()
+    for _ in range(3):
+        with profiler.span("dispatch"):
+            time.sleep(0.002)
+    with profiler.span("flush"):
+        pass
+    time.sleep(0.01)
+    prefix = profiler.toggle()
+    assert not profiler.active
+    with open(prefix + ".json") as f:
+        report = json.load(f)
+    assert report["spans_ms"]["dispatch"]["count"] == 3
+    assert report["spans_ms"]["flush"]["count"] == 1
+    # Only the slowest are kept, slowest first
+    assert [span["name"] for span in report["slowest_spans_ms"]] == ["dispatch", "dispatch"]
+    with open(prefix + ".folded") as f:
+        lines = f.read().splitlines()
+    # The sampler caught this thread sleeping
+    assert report["samples"] > 0
+    assert any("test_spans_and_report" in line for line in lines)
+
+def test_profile_command_writes_the_report_outside_the_engine_lock(harness, monkeypatch):
+    engine = harness.engine
+    engine.profiler.out_dir = "."
+    written = threading.Event()
+    lock_free = []
+    write = engine.profiler.write
+
+    def checked_write(collected):
+        # Another thread: fails while the handler still holds the engine lock
+        acquired = engine.lock.acquire(timeout=5)
+        lock_free.append(acquired)
+        if acquired:
+            engine.lock.release()
+        prefix = write(collected)
+        written.set()
+        return prefix
+    monkeypatch.setattr(engine.profiler, "write", checked_write)
+
+    [reply] = harness.send(OP_PROFILE, "start")
+    assert reply[3] == ["started"]
+    [reply] = harness.send(OP_PROFILE, "stop")
+    assert reply[1] == OP_PROFILE_REPLY and reply[3][0].startswith("writing ")
+    assert written.wait(5) and lock_free == [True]
+    prefix = reply[3][0].split()[1].removesuffix(".folded")
+    assert os.path.exists(prefix + ".json") and os.path.exists(prefix + ".folded")
+    [reply] = harness.send(OP_PROFILE, "stop")
+    assert reply[3] == ["not running"]
@@ -0,0 +1,69 @@
+import struct
+
+import pytest
+
+from protocol import (MAGIC, MESSAGES, NO_RQ, OP_AUCTION_ANNOUNCE, OP_BATCH, OP_BID, OP_LIST_DENIED,
+                      OP_LIST_ITEM, OP_REGISTER, PROTOCOL_VERSION, REASON_TAIL, TEXT_VERSION,
+                      decode, encode, negotiate)
+
+SAMPLES = {"s": "lamp", "S": "{\"items\": []}", "d": 12.5, "i": -42}
+
+def sample_fields(opcode):
+    return [SAMPLES[kind] for kind in MESSAGES[opcode][1]]
+
+# BATCH frames wrap other frames and are encoded with encode_batch
+@pytest.mark.parametrize("opcode", sorted(op for op in MESSAGES if op != OP_BATCH))
+@pytest.mark.parametrize("version", [1, PROTOCOL_VERSION])
+def test_binary_round_trip(opcode, version):
+    fields = sample_fields(opcode)
+    assert decode(encode(version, opcode, 77, fields)) == (version, opcode, 77, fields)
+
+@pytest.mark.parametrize("opcode", sorted(op for op in MESSAGES if MESSAGES[op][1] and op != OP_BATCH))
+def test_text_round_trip(opcode):
+    fields = sample_fields(opcode)
+    version, decoded_opcode, rq, decoded = decode(encode(TEXT_VERSION, opcode, 77, fields))
+    assert (version, decoded_opcode) == (TEXT_VERSION, opcode)
+    assert rq == (None if opcode in NO_RQ else "77")
+    assert decoded == [str(f) for f in fields]
+
+def test_text_reason_keeps_its_spaces():
+    data = encode(TEXT_VERSION, OP_LIST_DENIED, 3, ["Seller at capacity"])
+    assert decode(data)[3] == ["Seller at capacity"]
+    assert OP_LIST_DENIED in REASON_TAIL
+
+def test_binary_fields_may_hold_spaces_and_unicode():
+    fields = ["s1", "desk lamp", "brass — 1920s", 5.0, 60]
+    assert decode(encode(PROTOCOL_VERSION, OP_LIST_ITEM, 1, fields))[3] == fields
+
+def test_header_layout():
+    data = encode(PROTOCOL_VERSION, OP_BID, 0x01020304, ["b1", "17", 6.0])
+    assert data[:8] == struct.pack(">BBHI", MAGIC, PROTOCOL_VERSION, OP_BID, 0x01020304)
+
+@pytest.mark.parametrize("value", [2**31, -2**31 - 1])
+def test_int_fields_are_int32(value):
+    with pytest.raises(struct.error):
+        encode(PROTOCOL_VERSION, OP_AUCTION_ANNOUNCE, 0, ["1", "lamp", "", 1.0, value])
+    assert decode(encode(PROTOCOL_VERSION, OP_AUCTION_ANNOUNCE, 0, ["1", "lamp", "", 1.0, 2**31 - 1]))
+
+def test_short_string_fields_are_capped():
+    with pytest.raises(struct.error):
+        encode(PROTOCOL_VERSION, OP_REGISTER, 1, ["x" * 65536, "Buyer", "127.0.0.1", "1", "0"])
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"\xa5",
+    encode(PROTOCOL_VERSION, OP_LIST_ITEM, 1, ["s1", "lamp", "brass", 5.0, 60])[:-1],
+    encode(PROTOCOL_VERSION, OP_REGISTER, 1, ["a", "b", "c", "d", "e"])[:12],
+    struct.pack(">BBHI", MAGIC, PROTOCOL_VERSION, 999, 1),
+    struct.pack(">BBHI", MAGIC, TEXT_VERSION, OP_BID, 1),
+    b"\xa5\x03\x00\x01\x00\x00\x00\x01\x00\x02\xff\xfe",
+    b"NOT_A_COMMAND 1 x",
+    b"BID 1",
+    b"\xff\xfe\xfd",
+])
+def test_malformed_frames_decode_to_none(data):
+    assert decode(data) is None
+
+def test_negotiate_caps_at_server_version():
+    assert negotiate(1) == 1
+    assert negotiate(PROTOCOL_VERSION + 5) == PROTOCOL_VERSION
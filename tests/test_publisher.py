@@ -0,0 +1,61 @@
+import socket
+
+from protocol import (OP_AUCTION_ANNOUNCE, OP_BATCH, OP_BID, OP_LIST_ITEM, OP_REGISTER, OP_SUBSCRIBE,
+                      decode)
+
+B1 = ("127.0.0.1", 5001)
+B2 = ("127.0.0.1", 5002)
+
+def setup_lamp(harness, version=2):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    for name, addr in (("b1", B1), ("b2", B2)):
+        harness.send(OP_REGISTER, name, "Buyer", addr[0], str(addr[1]), "0", version=version)
+        harness.send(OP_SUBSCRIBE, name, "lamp", version=version)
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    return harness.engine.store.items_named("lamp")[0]
+
+def announcements(sent, addr):
+    found = []
+    for to, message in sent:
+        if to != addr:
+            continue
+        frames = [decode(frame) for frame in message[3]] if message[1] == OP_BATCH else [message]
+        found += [m[3] for m in frames if m[1] == OP_AUCTION_ANNOUNCE]
+    return found
+
+def test_changes_between_flushes_collapse(harness):
+    item = setup_lamp(harness)
+    harness.send(OP_BID, "b1", item.item_id, 6.0)
+    harness.send(OP_BID, "b2", item.item_id, 7.0)
+    sent = harness.flush()
+    for addr in (B1, B2):
+        assert [fields[3] for fields in announcements(sent, addr)] == [7.0]
+    assert harness.flush() == []
+
+def test_unreachable_buyer_does_not_cost_the_others(harness):
+    item = setup_lamp(harness)
+    harness.flush()
+    send = harness.engine.sendto
+
+    def sendto(data, addr):
+        if addr == B1:
+            raise socket.gaierror("no such host")
+        send(data, addr)
+    harness.engine.sendto = sendto
+    harness.send(OP_BID, "b2", item.item_id, 6.0)
+    sent = harness.flush()
+    assert [fields[3] for fields in announcements(sent, B2)] == [6.0]
+    assert harness.engine.metrics.counters["announce.send_failed"] == 1
+
+def test_unencodable_item_is_skipped(harness):
+    item = setup_lamp(harness)
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "copper", 5.0, 60)
+    harness.flush()
+    # A time left that does not fit in int32 cannot be encoded
+    item.end_time += 2**32
+    harness.engine.publisher.notify_item(item)
+    other = [i for i in harness.engine.store.items_named("lamp") if i is not item][0]
+    harness.engine.publisher.notify_item(other)
+    sent = harness.flush()
+    assert [fields[0] for fields in announcements(sent, B1)] == [other.item_id]
+    assert harness.engine.metrics.counters["announce.encode_failed"] >= 1
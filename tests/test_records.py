@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from protocol import OP_REGISTER, OP_REGISTER_DENIED, OP_REGISTERED, TEXT_VERSION
+from records import Item, Subscription, User, to_json, validate_ports
+
+@pytest.mark.parametrize("record", [
+    User("b1", "Buyer", "127.0.0.1", 5001, 6001, 3),
+    Item("1", "s1", "lamp", "brass", 5.0, 60, 1000.0, 7.5, "b1"),
+    Subscription("b1", "lamp*"),
+])
+def test_dict_round_trip(record):
+    data = json.loads(json.dumps(record, default=to_json))
+    assert type(record).from_dict(data) == record
+    assert record.copy() == record and record.copy() is not record
+
+def test_records_have_no_instance_dict():
+    with pytest.raises(AttributeError):
+        User("b1", "Buyer", "127.0.0.1", 5001, 0).extra = 1
+
+def test_legacy_string_fields_are_parsed():
+    user = User.from_dict({"name": "b1", "role": "Buyer", "ip": "127.0.0.1", "udp_port": "5001",
+                           "tcp_port": "0"})
+    assert user.addr == ("127.0.0.1", 5001) and user.protocol == TEXT_VERSION
+    item = Item.from_dict({"item_id": "1", "seller_name": "s1", "item_name": "lamp", "description": "",
+                           "start_price": "5", "duration": "60", "end_time": "1000"})
+    assert (item.start_price, item.current_price, item.high_bidder) == (5.0, 5.0, None)
+
+@pytest.mark.parametrize("udp_port, tcp_port", [(0, 0), (65536, 0), (-1, 0), (5000, 65536), (5000, -1)])
+def test_validate_ports_rejects_out_of_range(udp_port, tcp_port):
+    with pytest.raises(ValueError):
+        validate_ports(User("b1", "Buyer", "127.0.0.1", udp_port, tcp_port))
+
+def test_validate_ports_accepts_limits():
+    validate_ports(User("b1", "Buyer", "127.0.0.1", 65535, 0))
+    validate_ports(User("b1", "Buyer", "127.0.0.1", 1, 65535))
+
+@pytest.mark.parametrize("udp_port, tcp_port", [("70000", "0"), ("0", "0"), ("5000", "99999"), ("x", "0")])
+def test_register_denies_invalid_ports(harness, udp_port, tcp_port):
+    replies = harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", udp_port, tcp_port)
+    assert [(r[1], r[3]) for r in replies] == [(OP_REGISTER_DENIED, ["InvalidPort"])]
+    assert harness.engine.store.get_user("b1") is None
+    assert [r[1] for r in harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")] == [OP_REGISTERED]
@@ -0,0 +1,65 @@
+import time
+
+from protocol import OP_LOGIN
+from reliability import RQ_LIMIT, RequestTracker, RttEstimator
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+        self.done = []
+
+    def send(self, opcode, rq, fields):
+        self.sent.append(rq)
+
+    def callback(self, request, reply):
+        self.done.append((request.rq, reply))
+
+def test_window_holds_back_and_admits_in_order():
+    recorder = Recorder()
+    tracker = RequestTracker(recorder.send, window=2)
+    requests = [tracker.submit(OP_LOGIN, ("b1", "Buyer"), callback=recorder.callback) for _ in range(4)]
+    assert [r.rq is not None for r in requests] == [True, True, False, False]
+    assert len(recorder.sent) == 2 and len(tracker) == 4
+    tracker.complete(requests[0].rq, "ok")
+    assert requests[2].rq is not None and recorder.sent[-1] == requests[2].rq
+    assert recorder.done == [(requests[0].rq, "ok")]
+
+def test_late_duplicate_reply_is_ignored():
+    recorder = Recorder()
+    tracker = RequestTracker(recorder.send)
+    request = tracker.submit(OP_LOGIN, (), callback=recorder.callback)
+    assert tracker.complete(request.rq, "first") is request
+    assert tracker.complete(request.rq, "second") is None
+    assert tracker.complete("not a number") is None
+    assert recorder.done == [(request.rq, "first")]
+
+def test_retransmits_then_gives_up():
+    recorder = Recorder()
+    tracker = RequestTracker(recorder.send, max_retries=2, initial_rto=1.0, max_rto=100.0)
+    request = tracker.submit(OP_LOGIN, (), callback=recorder.callback)
+    now = time.monotonic()
+    for _ in range(3):
+        now += 1000.0
+        tracker.poll(now)
+    assert recorder.sent == [request.rq] * 3
+    assert recorder.done == [(request.rq, None)]
+    assert len(tracker) == 0
+
+def test_rq_wraps_and_skips_ids_in_flight():
+    tracker = RequestTracker(lambda *args: None, window=4)
+    tracker.next_rq = RQ_LIMIT - 1
+    first = tracker.submit(OP_LOGIN, ())
+    second = tracker.submit(OP_LOGIN, ())
+    assert (first.rq, second.rq) == (RQ_LIMIT - 1, 1)
+    tracker.next_rq = 1
+    assert tracker.submit(OP_LOGIN, ()).rq == 2
+
+def test_rto_follows_samples_within_bounds():
+    rtt = RttEstimator(initial_rto=1.0, min_rto=0.2, max_rto=8.0)
+    for _ in range(20):
+        rtt.sample(0.01)
+    assert rtt.rto == 0.2
+    rtt.sample(30.0)
+    assert rtt.rto == 8.0
+    assert RttEstimator(initial_rto=1.0, max_rto=8.0).backoff(3) == 4.0
+    assert RttEstimator(initial_rto=1.0, max_rto=8.0).backoff(10) == 8.0
@@ -0,0 +1,84 @@
+from conftest import CLIENT
+from protocol import (OP_ITEM_LISTED, OP_LIST_ITEM, OP_REGISTER, OP_SEARCH, OP_STATS, OP_SUBSCRIBE,
+                      PROTOCOL_VERSION, encode)
+from reply_cache import ENTRY_OVERHEAD, ReplyCache
+from search_index import FIRST_PAGE
+
+def test_get_returns_what_was_put():
+    cache = ReplyCache()
+    cache.put("k", [b"reply"], now=0.0)
+    assert cache.get("k", now=1.0) == [b"reply"]
+    assert cache.get("other", now=1.0) is None
+    assert cache.hits == 1
+
+def test_entries_expire_after_ttl():
+    cache = ReplyCache(ttl=5.0)
+    cache.put("k", [b"reply"], now=0.0)
+    assert cache.get("k", now=6.0) is None
+    assert len(cache) == 0 and cache.bytes == 0
+
+def test_least_recently_used_goes_first():
+    cache = ReplyCache(max_entries=2)
+    cache.put("a", [b"1"], now=0.0)
+    cache.put("b", [b"2"], now=0.0)
+    cache.get("a", now=0.0)
+    cache.put("c", [b"3"], now=0.0)
+    assert cache.get("b", now=0.0) is None
+    assert cache.get("a", now=0.0) == [b"1"]
+    assert cache.evictions == 1
+
+def test_byte_bound():
+    cache = ReplyCache(max_bytes=3 * (ENTRY_OVERHEAD + 100))
+    for n in range(10):
+        cache.put(n, [b"x" * 100], now=0.0)
+    assert len(cache) == 3
+    assert cache.bytes == 3 * (ENTRY_OVERHEAD + 100)
+
+def test_replacing_a_key_keeps_the_byte_count():
+    cache = ReplyCache()
+    cache.put("k", [b"x" * 10], now=0.0)
+    cache.put("k", [b"x" * 20], now=0.0)
+    assert cache.bytes == ENTRY_OVERHEAD + 20
+
+def test_retransmitted_command_is_replayed_not_rerun(harness):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    data = encode(PROTOCOL_VERSION, OP_LIST_ITEM, 500, ["s1", "lamp", "brass", 5.0, 60])
+    harness.engine.handle_datagram(data, CLIENT)
+    first = harness.sent[-1]
+    harness.engine.handle_datagram(data, CLIENT)
+    assert harness.sent[-1] == first
+    assert len(harness.engine.store.items_named("lamp")) == 1
+    assert harness.engine.metrics.counters["replayed.LIST_ITEM"] == 1
+
+def test_same_rq_from_another_client_runs(harness):
+    harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    harness.send(OP_REGISTER, "b2", "Buyer", "127.0.0.1", "5002", "0")
+    for name, addr in (("b1", ("127.0.0.1", 5001)), ("b2", ("127.0.0.1", 5002))):
+        harness.engine.handle_datagram(encode(PROTOCOL_VERSION, OP_SUBSCRIBE, 9, [name, "lamp"]), addr)
+    assert harness.engine.store.is_subscribed("b1", "lamp")
+    assert harness.engine.store.is_subscribed("b2", "lamp")
+    assert "replayed.SUBSCRIBE" not in harness.engine.metrics.counters
+
+def test_new_rq_runs_again(harness):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    assert [r[1] for r in harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)] == [OP_ITEM_LISTED]
+    assert [r[1] for r in harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)] == [OP_ITEM_LISTED]
+    assert len(harness.engine.store.items_named("lamp")) == 2
+
+def test_different_command_with_a_reused_rq_runs(harness):
+    # The text client draws rq at random, so collisions happen
+    harness.send(OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    for item_name in ("lamp", "desk"):
+        harness.engine.handle_datagram(encode(PROTOCOL_VERSION, OP_SUBSCRIBE, 9, ["b1", item_name]), CLIENT)
+    assert harness.engine.store.is_subscribed("b1", "desk")
+    assert "replayed.SUBSCRIBE" not in harness.engine.metrics.counters
+
+def test_read_only_commands_are_not_cached(harness):
+    cached = len(harness.engine.replies)
+    for _ in range(2):
+        harness.engine.handle_datagram(encode(PROTOCOL_VERSION, OP_STATS, 7, []), CLIENT)
+        harness.engine.handle_datagram(encode(PROTOCOL_VERSION, OP_SEARCH, 8, ["price", FIRST_PAGE, 10, "lamp"]),
+                                       CLIENT)
+    assert len(harness.engine.replies) == cached
+    assert harness.engine.metrics.counters["received.SEARCH"] == 2
+    assert not any(name.startswith("replayed.") for name in harness.engine.metrics.counters)
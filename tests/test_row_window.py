@@ -0,0 +1,61 @@
+import pytest
+
+from row_window import RowWindow
+
+def filled(count, visible_rows=5):
+    window = RowWindow(visible_rows)
+    for n in range(count):
+        window.set(n, f"r{n}")
+    return window
+
+def test_short_list_shows_everything():
+    window = filled(3)
+    assert window.visible() == ["r0", "r1", "r2"]
+    assert window.scrollbar_range() == (0, 1)
+    window.scroll_rows(10)
+    assert window.visible() == ["r0", "r1", "r2"] and window.top == 0
+
+def test_scrolling_stays_inside_the_list():
+    window = filled(20)
+    window.scroll_rows(3)
+    assert window.visible() == ["r3", "r4", "r5", "r6", "r7"]
+    assert window.scrollbar_range() == (3 / 20, 8 / 20)
+    window.scroll_pages(10)
+    assert window.visible()[-1] == "r19" and window.top == 15
+    window.scroll_rows(-100)
+    assert window.top == 0
+    window.move_to(0.5)
+    assert window.visible()[0] == "r10"
+    window.move_to(1.0)
+    assert window.visible() == ["r15", "r16", "r17", "r18", "r19"]
+
+def test_updates_keep_their_row_and_inserts_append():
+    window = filled(3)
+    window.set(1, "changed")
+    window.set(9, "new")
+    assert window.keys() == [0, 1, 2, 9]
+    assert window.visible() == ["r0", "changed", "r2", "new"]
+
+@pytest.mark.parametrize("removed", [[0], [3, 4], [19], list(range(12, 20))])
+def test_removal_while_scrolled(removed):
+    window = filled(20)
+    window.scroll_rows(13)
+    for key in removed:
+        assert window.remove(key)
+    assert not window.remove(removed[0])
+    remaining = [f"r{n}" for n in range(20) if n not in removed]
+    rows = window.visible()
+    # Still a full window, ending no later than the last record
+    assert len(rows) == 5
+    assert rows == remaining[window.top:window.top + 5]
+    assert window.top <= len(remaining) - 5
+    # Inserting after a removal still appends
+    window.set("late", "late")
+    assert window.keys()[-1] == "late"
+
+def test_replace_all_resets_the_order():
+    window = filled(10)
+    window.scroll_rows(5)
+    window.replace_all({"a": 1, "b": 2})
+    assert window.visible() == [1, 2] and window.top == 0
+    assert len(window) == 2
@@ -0,0 +1,113 @@
+import json
+import random
+
+import pytest
+
+from protocol import (OP_LIST_DENIED, OP_LIST_ITEM, OP_REGISTER, OP_SEARCH, OP_SEARCH_RESULTS, PROTOCOL_VERSION,
+                      TEXT_VERSION)
+from records import Item
+from search_index import FIRST_PAGE, SearchIndex, SortedKeys, format_cursor, parse_cursor
+
+def test_sorted_keys_match_a_sorted_list():
+    rng = random.Random(5)
+    keys = SortedKeys()
+    keys.BLOCK = 4      # force many block splits and merges
+    expected = []
+    for n in range(2000):
+        if expected and rng.random() < 0.4:
+            key = expected.pop(rng.randrange(len(expected)))
+            assert keys.remove(key)
+        else:
+            key = (rng.randrange(100), str(n))
+            keys.add(key)
+            expected.append(key)
+    expected.sort()
+    assert len(keys) == len(expected)
+    assert list(keys.after()) == expected
+    assert list(keys.before()) == expected[::-1]
+    pivot = expected[len(expected) // 2]
+    assert list(keys.after(pivot)) == [key for key in expected if key > pivot]
+    assert list(keys.before(pivot)) == [key for key in reversed(expected) if key < pivot]
+    assert not keys.remove((1000, "missing"))
+
+def make_index(count, rng):
+    index = SearchIndex()
+    items = {}
+    for n in range(count):
+        words = rng.sample(["red", "blue", "lamp", "desk", "oak", "brass"], 3)
+        item = Item(str(n), "s1", words[0], " ".join(words[1:]), rng.uniform(1, 100), 60, rng.uniform(0, 1000))
+        index.add(item)
+        items[item.item_id] = item
+    return index, items
+
+@pytest.mark.parametrize("order", ["ending", "price", "price_desc"])
+@pytest.mark.parametrize("tokens", [[], ["lamp"], ["red", "oak"]])
+def test_pages_cover_every_match_once_in_order(order, tokens):
+    index, items = make_index(300, random.Random(11))
+    seen = []
+    after = None
+    while True:
+        total, found = index.search(tokens, order, after, limit=7)
+        if not found:
+            break
+        seen += found
+        after = found[-1][0]
+    matching = [item for item in items.values()
+                if all(t in (item.item_name + " " + item.description).split() for t in tokens)]
+    assert total == len(matching) == len(seen)
+    keys = [key for key, _ in seen]
+    assert keys == sorted(keys, reverse=order == "price_desc")
+    assert {item.item_id for _, item in seen} == {item.item_id for item in matching}
+
+def test_cached_query_follows_adds_and_removes():
+    index = SearchIndex()
+    index.CACHE_MIN_POSTING = 1
+    a = Item("1", "s1", "lamp", "red brass", 5.0, 60, 10.0)
+    b = Item("2", "s1", "lamp", "red oak", 6.0, 60, 20.0)
+    index.add(a)
+    assert [item for _, item in index.search(["lamp", "red"])[1]] == [a]
+    index.add(b)
+    index.remove("1")
+    assert [item for _, item in index.search(["lamp", "red"])[1]] == [b]
+
+def test_refresh_moves_an_item():
+    index = SearchIndex()
+    a = Item("1", "s1", "lamp", "", 5.0, 60, 10.0)
+    b = Item("2", "s1", "lamp", "", 6.0, 60, 20.0)
+    index.add(a)
+    index.add(b)
+    a.current_price, a.end_time = 9.0, 30.0
+    index.refresh(a)
+    assert [item for _, item in index.search([], "price")[1]] == [b, a]
+    assert [item for _, item in index.search([], "ending")[1]] == [b, a]
+
+def test_cursor_round_trip():
+    assert parse_cursor(FIRST_PAGE) is None
+    assert parse_cursor(format_cursor((12.5, "17"))) == (12.5, "17")
+    with pytest.raises(ValueError):
+        parse_cursor("garbage")
+
+@pytest.mark.parametrize("price", ["nan", "inf", "-inf", "NaN"])
+def test_list_item_denies_non_finite_prices(harness, price):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    replies = harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", price, "60", version=TEXT_VERSION)
+    assert [(r[1], r[3]) for r in replies] == [(OP_LIST_DENIED, ["InvalidPrice"])]
+    replies = harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", float(price), 60, version=PROTOCOL_VERSION)
+    assert [(r[1], r[3]) for r in replies] == [(OP_LIST_DENIED, ["InvalidPrice"])]
+    assert harness.engine.store.item_list() == []
+
+def test_search_command_pages(harness):
+    harness.send(OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    for n in range(4):
+        harness.send(OP_LIST_ITEM, "s1", f"lamp{n}", "brass lamp", 10.0 + n, 60)
+    ids = []
+    cursor = FIRST_PAGE
+    while True:
+        [reply] = harness.send(OP_SEARCH, "price", cursor, 2, "brass")
+        assert reply[1] == OP_SEARCH_RESULTS
+        total, cursor, rows = reply[3]
+        assert total == 4
+        ids += [row[0] for row in json.loads(rows)]
+        if cursor == FIRST_PAGE:
+            break
+    assert [harness.engine.store.get_item(item_id).current_price for item_id in ids] == [10, 11, 12, 13]
@@ -0,0 +1,170 @@
+import io
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from protocol import (OP_BID, OP_LIST_ITEM, OP_NON_OFFER, OP_REGISTER, OP_SESSION, OP_SESSION_DENIED,
+                      OP_SESSION_OK, OP_SOLD, OP_SUBSCRIBE, OP_SYNC, OP_WINNER, decode)
+from session_channel import FRAME_LEN, MAX_FRAME, SessionListener, SessionPool, read_frame, session_port
+
+B1 = ("127.0.0.1", 5001)
+S1 = ("127.0.0.1", 5000)
+
+def test_session_port_bounds():
+    assert session_port("0") == 0
+    assert session_port(65535) == 65535
+    for value in ("-1", "65536", "tcp"):
+        with pytest.raises(ValueError):
+            session_port(value)
+
+def test_read_frame():
+    stream = io.BytesIO(FRAME_LEN.pack(3) + b"abc" + FRAME_LEN.pack(0) + FRAME_LEN.pack(5) + b"ab")
+    assert read_frame(stream) == b"abc"
+    assert read_frame(stream) == b""
+    # A frame cut short by the close
+    assert read_frame(stream) is None
+    assert read_frame(io.BytesIO(b"\x00")) is None
+    with pytest.raises(ValueError):
+        read_frame(io.BytesIO(FRAME_LEN.pack(MAX_FRAME + 1)))
+
+def test_pool_delivers_in_order_on_one_connection():
+    received = []
+    arrived = threading.Event()
+
+    def on_message(data):
+        received.append(data)
+        if len(received) == 20:
+            arrived.set()
+    listener = SessionListener(on_message)
+    listener.start()
+    pool = SessionPool(lanes=2)
+    pool.start()
+    addr = ("127.0.0.1", listener.port)
+    try:
+        for n in range(20):
+            pool.send(addr, b"frame %d" % n)
+        assert arrived.wait(5)
+        assert received == [b"frame %d" % n for n in range(20)]
+        assert pool.connection_count() == 1
+    finally:
+        pool.stop()
+        listener.close()
+
+def closed_port():
+    # A port nobody listens on: bind one, then release it
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_unreachable_client_falls_back():
+    addr = ("127.0.0.1", closed_port())
+    failed = []
+    pool = SessionPool(lanes=1, connect_timeout=1.0)
+    pool.on_undeliverable = lambda *args: failed.append(args)
+    pool.start()
+    pool.send(addr, b"result", fallback="datagram")
+    pool.stop()
+    assert failed == [(addr, b"result", "datagram")]
+
+class Client:
+    """
+    A client's session listener, collecting decoded frames.
+    """
+    def __init__(self):
+        self.received = []
+        self.cond = threading.Condition()
+        self.listener = SessionListener(self.on_message)
+        self.listener.start()
+        self.port = self.listener.port
+
+    def on_message(self, data):
+        with self.cond:
+            self.received.append(decode(data))
+            self.cond.notify_all()
+
+    def wait(self, count, timeout=5):
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.received) >= count, timeout)
+            return list(self.received)
+
+@pytest.fixture
+def sessions(harness):
+    harness.engine.sessions.start()
+    clients = []
+    yield clients
+    harness.engine.sessions.stop()
+    for client in clients:
+        client.listener.close()
+
+def sold_lamp(harness, buyer_tcp=0, seller_tcp=0, bid=True):
+    harness.send(OP_REGISTER, "s1", "Seller", *map(str, S1), str(seller_tcp))
+    harness.send(OP_REGISTER, "b1", "Buyer", *map(str, B1), str(buyer_tcp))
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    item = harness.engine.store.items_named("lamp")[0]
+    if bid:
+        harness.send(OP_BID, "b1", item.item_id, 7.0)
+    item.end_time = time.time() - 1
+    harness.engine.expire_items([item.item_id])
+    return item
+
+def udp_to(harness, addr, opcodes):
+    return [decode(data) for to, data in harness.sent if to == addr and decode(data)[1] in opcodes]
+
+def test_results_go_by_udp_without_a_session(harness):
+    item = sold_lamp(harness)
+    [winner] = udp_to(harness, B1, (OP_WINNER,))
+    assert winner[3] == ["b1", item.item_id, "lamp", 7.0, "s1"]
+    [sold] = udp_to(harness, S1, (OP_SOLD,))
+    assert sold[3] == ["s1", item.item_id, "lamp", 7.0, "b1"]
+    assert harness.engine.metrics.counters["session.fallback"] == 2
+
+def test_unsold_item_notifies_the_seller(harness):
+    item = sold_lamp(harness, bid=False)
+    [notice] = udp_to(harness, S1, (OP_NON_OFFER, OP_SOLD))
+    assert (notice[1], notice[3]) == (OP_NON_OFFER, ["s1", item.item_id, "lamp"])
+    assert udp_to(harness, B1, (OP_WINNER,)) == []
+
+def test_results_go_over_the_session_channel(harness, sessions):
+    buyer, seller = Client(), Client()
+    sessions += [buyer, seller]
+    item = sold_lamp(harness, buyer.port, seller.port)
+    [winner] = buyer.wait(1)
+    assert (winner[1], winner[3][:2]) == (OP_WINNER, ["b1", item.item_id])
+    [sold] = seller.wait(1)
+    assert (sold[1], sold[3][4]) == (OP_SOLD, "b1")
+    assert udp_to(harness, B1, (OP_WINNER,)) == udp_to(harness, S1, (OP_SOLD,)) == []
+
+def test_session_sends_a_sync(harness, sessions):
+    client = Client()
+    sessions.append(client)
+    harness.send(OP_REGISTER, "s1", "Seller", *map(str, S1), "0")
+    harness.send(OP_REGISTER, "b1", "Buyer", *map(str, B1), "0")
+    harness.send(OP_SUBSCRIBE, "b1", "lamp")
+    harness.send(OP_LIST_ITEM, "s1", "lamp", "brass", 5.0, 60)
+    item = harness.engine.store.items_named("lamp")[0]
+    [reply] = harness.send(OP_SESSION, "b1", str(client.port), addr=B1)
+    assert reply[1] == OP_SESSION_OK
+    assert harness.engine.store.get_user("b1").tcp_port == client.port
+    [sync] = client.wait(1)
+    assert sync[1] == OP_SYNC and sync[3][0] == "b1"
+    state = json.loads(sync[3][1])
+    assert state["subscriptions"] == ["lamp"]
+    assert [row[:4] for row in state["items"]] == [[item.item_id, "lamp", "brass", 5.0]]
+
+def test_session_denials(harness):
+    [reply] = harness.send(OP_SESSION, "nobody", "6000")
+    assert (reply[1], reply[3]) == (OP_SESSION_DENIED, ["NotFound"])
+    harness.send(OP_REGISTER, "b1", "Buyer", *map(str, B1), "0")
+    [reply] = harness.send(OP_SESSION, "b1", "70000")
+    assert (reply[1], reply[3]) == (OP_SESSION_DENIED, ["InvalidPort"])
+
+def test_unreachable_session_falls_back_to_udp(harness, sessions):
+    harness.engine.sessions.connect_timeout = 1.0
+    item = sold_lamp(harness, buyer_tcp=closed_port())
+    harness.engine.sessions.stop()
+    [winner] = udp_to(harness, B1, (OP_WINNER,))
+    assert winner[3][1] == item.item_id
+    assert harness.engine.metrics.counters["session.connect_failed"] >= 1
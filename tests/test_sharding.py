@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from journal import Journal
+from protocol import (OP_AUCTION_ANNOUNCE, OP_DE_REGISTER, OP_DE_REGISTERED, OP_ITEM_LISTED, OP_LIST_DENIED,
+                      OP_LIST_ITEM, OP_LOGIN, OP_LOGIN_OK, OP_REGISTER, OP_REGISTER_DENIED, OP_REGISTERED,
+                      OP_SUBSCRIBE, PROTOCOL_VERSION, TEXT_VERSION, decode, encode)
+from records import User, to_json
+from sharding import (HELLO_PAGE, IPC_BUFFER, Coordinator, ShardedEngine, pack_forward, shard_of,
+                      shard_of_item_id, unpack_forward)
+
+B1 = ("127.0.0.1", 5001)
+
+def test_forward_round_trips_raw_frames():
+    frame = encode(3, OP_LIST_ITEM, 7, ("s1", "lamp", "é" * 6000, 5.0, 60))
+    packet = pack_forward(("127.0.0.1", 5001), frame)
+    assert unpack_forward(packet) == (("127.0.0.1", 5001), frame)
+    # Not inflated: a 12 KB frame stays a 12 KB packet
+    assert len(packet) - len(frame) < 32
+
+def test_largest_forward_fits_the_ipc_buffer():
+    frame = b"\xa5" * 65535
+    assert len(pack_forward(("f" * 255, 65535), frame)) <= IPC_BUFFER
+
+def test_routing_is_stable():
+    assert shard_of("lamp", 4) == shard_of("lamp", 4)
+    assert shard_of_item_id("10", 4) == 2
+    assert shard_of_item_id("x1", 4) is None
+
+def test_hello_pages_through_every_user(tmp_path, monkeypatch):
+    # With an empty journal the coordinator seeds itself from ./users_data.json
+    monkeypatch.chdir(tmp_path)
+    coordinator = Coordinator(str(tmp_path), 2,
+                              journal=Journal(str(tmp_path / "users.journal"), str(tmp_path / "users.bin")))
+    try:
+        names = {f"user{n:05d}-" + "x" * 100 for n in range(3 * HELLO_PAGE + 17)}
+        for name in names:
+            coordinator.store.add_user(User(name, "Buyer", "127.0.0.1", 5000, 0))
+        seen = []
+        after = None
+        while True:
+            reply = coordinator.handle({"op": "hello", "shard": 1, "counts": {"s1": 2}, "after": after})
+            assert len(json.dumps(reply, default=to_json).encode()) < IPC_BUFFER
+            seen += [user.name for user in reply["users"]]
+            if not reply["more"]:
+                break
+            after = seen[-1]
+        assert sorted(seen) == seen
+        assert set(seen) == names and len(seen) == len(names)
+        assert coordinator.listing_counts[1] == {"s1": 2}
+    finally:
+        coordinator.sock.close()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+class Cluster:
+    """
+    A coordinator and its workers in one process, talking over their real
+    Unix sockets. Workers run only their inbox and peer threads; what they
+    send to clients is collected in sent as (shard, addr, data).
+    """
+    def __init__(self, ipc_dir, shards=2):
+        self.ipc_dir = ipc_dir
+        self.shards = shards
+        self.sent = []
+        self.rq = 0
+        self.coordinator = None
+        self.workers = []
+        self.start_coordinator()
+        for shard in range(shards):
+            self.start_worker(shard)
+
+    def start_coordinator(self):
+        journal = Journal("users.journal", "users.bin", fsync_mode="never")
+        self.coordinator = Coordinator(self.ipc_dir, self.shards, journal=journal)
+        self.coordinator.start()
+
+    def start_worker(self, shard):
+        journal = Journal(f"auction-{shard}.journal", f"auction_snapshot-{shard}.bin", fsync_mode="never")
+        worker = ShardedEngine(shard, self.shards, self.ipc_dir, port=0, journal=journal)
+        worker.journal.open(sync_thread=False)
+        worker.running = True
+        worker.sendto = lambda data, addr: self.sent.append((shard, addr, data))
+        worker.sync_users()
+        threading.Thread(target=worker.inbox_loop, daemon=True).start()
+        threading.Thread(target=worker.peer_loop, daemon=True).start()
+        self.workers.append(worker)
+        return worker
+
+    def stop_worker(self, worker):
+        worker.running = False
+        worker.peer_queue.put(None)
+        worker.journal.close()
+        for sock in (worker.inbox, worker.rpc_sock, worker.query_sock, worker.gather_sock):
+            sock.close()
+        self.workers.remove(worker)
+
+    def close(self):
+        if self.coordinator is None:
+            return
+        for worker in list(self.workers):
+            self.stop_worker(worker)
+        self.coordinator.stop()
+        self.coordinator = None
+
+    def send(self, shard, opcode, *fields, addr=B1, version=PROTOCOL_VERSION):
+        """
+        Sends one command to worker `shard` and waits for its reply (from
+        whichever worker ran it). Returns (replying shard, decoded reply).
+        """
+        self.rq += 1
+        rq = self.rq
+        found = []
+
+        def replied():
+            found[:] = [(by, decode(data)) for by, to, data in list(self.sent)
+                        if to == addr and str(decode(data)[2]) == str(rq)]
+            return found
+        self.workers[shard].handle_datagram(encode(version, opcode, rq, fields), addr)
+        assert wait_for(replied)
+        return found[0]
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cluster = Cluster(str(tmp_path))
+    yield cluster
+    cluster.close()
+
+def test_login_version_reaches_every_shard_and_survives_restart(cluster):
+    cluster.send(0, OP_REGISTER, "b1", "Buyer", *map(str, B1), "0")
+    other = cluster.workers[1]
+    assert wait_for(lambda: other.store.get_user("b1") is not None)
+    assert other.store.get_user("b1").protocol == PROTOCOL_VERSION
+
+    # The same buyer comes back with a text-only client
+    _, reply = cluster.send(0, OP_LOGIN, "b1", "Buyer", version=TEXT_VERSION)
+    assert reply[1] == OP_LOGIN_OK
+    assert wait_for(lambda: other.store.get_user("b1").protocol == TEXT_VERSION)
+
+    # Items on the other shard are announced to it as text
+    name = item_on(1)
+    cluster.send(1, OP_SUBSCRIBE, "b1", name, version=TEXT_VERSION)
+    cluster.send(1, OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    cluster.send(1, OP_LIST_ITEM, "s1", name, "brass", 5.0, 60)
+    start = len(cluster.sent)
+    other.publisher.flush_pending()
+    [announcement] = [decode(data) for _, to, data in cluster.sent[start:] if to == B1]
+    assert announcement[:2] == (TEXT_VERSION, OP_AUCTION_ANNOUNCE)
+
+    # After a restart workers reload the version from the coordinator,
+    # which journaled it
+    cluster.close()
+    os.mkdir("restart")
+    restarted = Cluster(os.path.abspath("restart"))
+    try:
+        assert all(worker.store.get_user("b1").protocol == TEXT_VERSION for worker in restarted.workers)
+    finally:
+        restarted.close()
+
+def item_on(shard, shards=2, prefix="lamp"):
+    return next(f"{prefix}{n}" for n in range(100) if shard_of(f"{prefix}{n}", shards) == shard)
+
+def test_command_is_forwarded_to_its_shard(cluster):
+    cluster.send(0, OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    name = item_on(1)
+    # Worker 0 receives it; worker 1 owns the name, runs it and replies
+    by, reply = cluster.send(0, OP_LIST_ITEM, "s1", name, "brass", 5.0, 60)
+    assert (by, reply[1]) == (1, OP_ITEM_LISTED)
+    [item] = cluster.workers[1].store.items_named(name)
+    assert shard_of_item_id(item.item_id, 2) == 1
+    assert cluster.workers[0].store.items_named(name) == []
+    assert cluster.workers[0].metrics.counters["forwarded.LIST_ITEM"] == 1
+
+def test_registration_is_decided_by_the_coordinator(cluster):
+    by, reply = cluster.send(0, OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5001", "0")
+    assert (by, reply[1]) == (0, OP_REGISTERED)
+    assert wait_for(lambda: cluster.workers[1].store.get_user("b1") is not None)
+    # The name is taken on every shard
+    _, reply = cluster.send(1, OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5002", "0", addr=("127.0.0.1", 5002))
+    assert (reply[1], reply[3]) == (OP_REGISTER_DENIED, ["NameInUse"])
+    assert cluster.coordinator.store.get_user("b1").udp_port == 5001
+
+    _, reply = cluster.send(1, OP_DE_REGISTER, "b1")
+    assert reply[1] == OP_DE_REGISTERED
+    assert wait_for(lambda: cluster.workers[0].store.get_user("b1") is None)
+    _, reply = cluster.send(0, OP_REGISTER, "b1", "Buyer", "127.0.0.1", "5002", "0", addr=("127.0.0.1", 5002))
+    assert reply[1] == OP_REGISTERED
+
+def test_server_full_counts_users_on_every_shard(cluster):
+    for n in range(4):
+        cluster.send(n % 2, OP_REGISTER, f"b{n}", "Buyer", "127.0.0.1", str(5001 + n), "0")
+    _, reply = cluster.send(1, OP_REGISTER, "b9", "Buyer", "127.0.0.1", "5009", "0")
+    assert (reply[1], reply[3]) == (OP_REGISTER_DENIED, ["ServerFull"])
+
+def test_listing_capacity_spans_shards_and_is_released_at_expiry(cluster):
+    cluster.send(0, OP_REGISTER, "s1", "Seller", "127.0.0.1", "5000", "0")
+    names = [item_on(0, prefix="lamp"), item_on(1, prefix="lamp"), item_on(0, prefix="desk"),
+             item_on(1, prefix="desk")]
+    for name in names:
+        _, reply = cluster.send(0, OP_LIST_ITEM, "s1", name, "brass", 5.0, 60)
+        assert reply[1] == OP_ITEM_LISTED
+    assert [counts.get("s1") for counts in cluster.coordinator.listing_counts] == [2, 2]
+    _, reply = cluster.send(1, OP_LIST_ITEM, "s1", item_on(1, prefix="sofa"), "oak", 5.0, 60)
+    assert (reply[1], reply[3]) == (OP_LIST_DENIED, ["SellerAtCapacity"])
+
+    # Expiring one on shard 1 frees a slot for any shard
+    worker = cluster.workers[1]
+    [item] = worker.store.items_named(names[1])
+    item.end_time = time.time() - 1
+    worker.expire_items([item.item_id])
+    assert wait_for(lambda: cluster.coordinator.listing_counts[1].get("s1") == 1)
+    _, reply = cluster.send(0, OP_LIST_ITEM, "s1", item_on(0, prefix="sofa"), "oak", 5.0, 60)
+    assert reply[1] == OP_ITEM_LISTED
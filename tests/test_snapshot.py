@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from records import Item, Subscription, User
+from snapshot import HEADER, SnapshotError, SnapshotReader, convert, write_snapshot
+
+STATE = {
+    "users": [User("s1", "Seller", "127.0.0.1", 5000, 0, 3), User("b1", "Buyer", "10.0.0.2", 5001, 6001)],
+    "items": [Item("1", "s1", "lamp", "brass — 1920s", 5.0, 60, 1000.5, 7.5, "b1"),
+              Item("2", "s1", "desk", None, 50.0, 120, 1100.0)],
+    "subscriptions": [Subscription("b1", "lamp"), Subscription("b1", "la*")],
+}
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "state.bin")
+    write_snapshot(path, STATE, 42)
+    with SnapshotReader(path) as snapshot:
+        assert snapshot.seq == 42
+        assert list(snapshot.users()) == STATE["users"]
+        assert list(snapshot.items()) == STATE["items"]
+        assert list(snapshot.subscriptions()) == STATE["subscriptions"]
+
+def test_empty_state(tmp_path):
+    path = str(tmp_path / "state.bin")
+    write_snapshot(path, {"users": [], "items": [], "subscriptions": []}, 0)
+    with SnapshotReader(path) as snapshot:
+        assert list(snapshot.users()) == [] and list(snapshot.items()) == []
+
+@pytest.mark.parametrize("damage", [
+    lambda data: b"",
+    lambda data: data[:HEADER.size - 1],
+    lambda data: b"NOTSNAP\0" + data[8:],
+    lambda data: data[:-1] + bytes([data[-1] ^ 0xFF]),
+    lambda data: data[:len(data) // 2],
+])
+def test_damaged_snapshot_is_refused(tmp_path, damage):
+    path = tmp_path / "state.bin"
+    write_snapshot(str(path), STATE, 1)
+    path.write_bytes(damage(path.read_bytes()))
+    with pytest.raises(SnapshotError):
+        SnapshotReader(str(path)).close()
+
+def test_convert_from_json_snapshot(tmp_path):
+    source = tmp_path / "state.json"
+    source.write_text(json.dumps({
+        "seq": 7,
+        "users": [user.to_dict() for user in STATE["users"]],
+        "items": [item.to_dict() for item in STATE["items"]],
+        "subscriptions": [sub.to_dict() for sub in STATE["subscriptions"]],
+    }))
+    path = str(tmp_path / "state.bin")
+    convert(path, str(source))
+    with SnapshotReader(path) as snapshot:
+        assert snapshot.seq == 7
+        assert list(snapshot.items()) == STATE["items"]
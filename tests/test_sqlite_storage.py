@@ -0,0 +1,146 @@
+import sqlite3
+
+import pytest
+
+from journal import open_storage
+from records import Item, Subscription, User
+from sharding import Coordinator
+from sqlite_storage import SqliteStorage
+from store import AuctionStore
+
+def write_history(storage):
+    storage.append("register", user=User("s1", "Seller", "127.0.0.1", 5000, 0, 3))
+    storage.append("register", user=User("b1", "Buyer", "127.0.0.1", 5001, 6001, 3))
+    storage.append("register", user=User("b2", "Buyer", "127.0.0.1", 5002, 0))
+    storage.append("deregister", name="b2")
+    storage.append("list_item", item=Item("1", "s1", "lamp", "a brass lamp", 5.0, 60, 1000.0))
+    storage.append("list_item", item=Item("2", "s1", "desk", "an oak desk", 50.0, 60, 1100.0))
+    storage.append("subscribe", sub=Subscription("b1", "lamp"))
+    storage.append("subscribe", sub=Subscription("b1", "desk"))
+    storage.append("de_subscribe", buyer_name="b1", item_name="desk")
+    storage.append("bid", item_id="1", bidder="b1", price=7.5, end_time=1010.0)
+    storage.append("expire", item_id="2")
+
+def open_seeded(path, fsync_mode):
+    # As the engine does on a fresh database: seed (here with nothing) first
+    storage = SqliteStorage(path, fsync_mode=fsync_mode)
+    assert not storage.recover(AuctionStore())
+    storage.open(sync_thread=False)
+    storage.compact(AuctionStore())
+    return storage
+
+def recover(path):
+    storage = SqliteStorage(path, fsync_mode="never")
+    store = AuctionStore()
+    found = storage.recover(store)
+    storage.close()
+    return store, found
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "auction.db")
+
+@pytest.mark.parametrize("fsync_mode", ["always", "interval", "never"])
+def test_recover_applies_every_change(db_path, fsync_mode):
+    storage = open_seeded(db_path, fsync_mode)
+    write_history(storage)
+    storage.close()
+
+    store, found = recover(db_path)
+    assert found
+    assert sorted(user.name for user in store.user_list()) == ["b1", "s1"]
+    assert store.get_user("b1") == User("b1", "Buyer", "127.0.0.1", 5001, 6001, 3)
+    assert [item.item_id for item in store.item_list()] == ["1"]
+    lamp = store.get_item("1")
+    assert (lamp.current_price, lamp.high_bidder, lamp.end_time) == (7.5, "b1", 1010.0)
+    assert store.subscription_list() == [Subscription("b1", "lamp")]
+    # Indexes are rebuilt on load
+    assert store.buyers_for("lamp") == {"b1"}
+    assert store.search.search(["brass"])[0] == 1
+
+def test_new_database_reports_nothing_recovered(db_path):
+    store, found = recover(db_path)
+    assert not found and not store.user_list()
+
+def test_uncommitted_group_is_lost_but_the_rest_survives(db_path):
+    storage = open_seeded(db_path, "interval")
+    storage.append("register", user=User("s1", "Seller", "127.0.0.1", 5000, 0))
+    storage.sync()
+    storage.append("register", user=User("b1", "Buyer", "127.0.0.1", 5001, 0))
+    # A crash: the open transaction is never committed
+    storage.db.close()
+    storage.db = None
+
+    store, _ = recover(db_path)
+    assert [user.name for user in store.user_list()] == ["s1"]
+
+def test_first_compaction_seeds_a_fresh_database(db_path):
+    seeded = AuctionStore()
+    seeded.add_user(User("s1", "Seller", "127.0.0.1", 5000, 0))
+    seeded.add_item(Item("1", "s1", "lamp", "brass", 5.0, 60, 1000.0))
+    storage = open_storage("sqlite", db_path=db_path, fsync_mode="never")
+    assert not storage.recover(AuctionStore())
+    storage.open(sync_thread=False)
+    storage.compact(seeded)
+    storage.append("register", user=User("b1", "Buyer", "127.0.0.1", 5001, 0))
+    storage.close()
+
+    store, _ = recover(db_path)
+    assert sorted(user.name for user in store.user_list()) == ["b1", "s1"]
+    assert store.get_item("1") == seeded.get_item("1")
+
+def test_database_is_in_wal_mode(db_path):
+    storage = SqliteStorage(db_path)
+    storage.open(sync_thread=False)
+    storage.close()
+    with sqlite3.connect(db_path) as db:
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_crash_before_the_first_compaction_seeds_again(db_path):
+    seeded = AuctionStore()
+    seeded.add_user(User("s1", "Seller", "127.0.0.1", 5000, 0))
+    storage = SqliteStorage(db_path, fsync_mode="never")
+    assert not storage.recover(AuctionStore())
+    storage.open(sync_thread=False)
+    # The process dies here, with the database file already created
+    storage.close()
+
+    storage = SqliteStorage(db_path, fsync_mode="never")
+    assert not storage.recover(AuctionStore())
+    storage.open(sync_thread=False)
+    storage.compact(seeded)
+    storage.close()
+    store, found = recover(db_path)
+    assert found and [user.name for user in store.user_list()] == ["s1"]
+
+def test_emptied_database_stays_seeded(db_path):
+    storage = open_seeded(db_path, "never")
+    storage.append("register", user=User("b1", "Buyer", "127.0.0.1", 5001, 0))
+    storage.append("deregister", name="b1")
+    storage.close()
+    store, found = recover(db_path)
+    assert found and not store.user_list()
+
+def test_database_from_before_the_seed_marker_counts_as_seeded(db_path):
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE users (name TEXT PRIMARY KEY, role TEXT, ip TEXT, udp_port INTEGER, "
+                   "tcp_port INTEGER, protocol INTEGER)")
+        db.execute("INSERT INTO users VALUES ('s1', 'Seller', '127.0.0.1', 5000, 0, 0)")
+    store, found = recover(db_path)
+    assert found and [user.name for user in store.user_list()] == ["s1"]
+
+def test_coordinator_seeds_sqlite_when_it_starts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "users.db")
+    coordinator = Coordinator(str(tmp_path), 1, journal=SqliteStorage(db_path, fsync_mode="always"))
+    coordinator.start()
+    coordinator.handle({"op": "register", "user": User("b1", "Buyer", "127.0.0.1", 5001, 0).to_dict(),
+                        "shard": 0})
+    coordinator.handle({"op": "deregister", "name": "b1", "shard": 0})
+    # Killed: stop() never runs
+    coordinator.running = False
+    coordinator.sock.close()
+    coordinator.journal.close()
+    # Emptied, not unseeded: the legacy users must not come back
+    store, found = recover(db_path)
+    assert found and not store.user_list()
@@ -0,0 +1,95 @@
+import random
+
+from records import Item, Subscription, User
+from search_index import item_price, item_tokens
+from store import AuctionStore
+
+def make_item(n, name=None, seller="s1", end_time=1000.0, price=10.0):
+    return Item(str(n), seller, name or f"item{n}", f"description of item {n}", price, 60, end_time)
+
+def assert_consistent(store):
+    """
+    Rebuilds every index from the primary maps and compares.
+    """
+    by_name = {}
+    counts = {}
+    for item_id, item in store.items.items():
+        by_name.setdefault(item.item_name, set()).add(item_id)
+        counts[item.seller_name] = counts.get(item.seller_name, 0) + 1
+    assert store.items_by_name == by_name
+    assert store.seller_counts == counts
+
+    buyers = {}
+    for (buyer, item_name) in store.subscriptions:
+        if "*" not in item_name:
+            buyers.setdefault(item_name, set()).add(buyer)
+    assert store.buyers_by_item == buyers
+
+    search = store.search
+    assert set(search.entries) == set(store.items)
+    assert sorted(search.by_end.after()) == sorted((item.end_time, item_id) for item_id, item in store.items.items())
+    assert sorted(search.by_price.after()) == sorted((item_price(item), item_id)
+                                                     for item_id, item in store.items.items())
+    postings = {}
+    for item_id, item in store.items.items():
+        for token in item_tokens(item):
+            postings.setdefault(token, set()).add(item_id)
+    assert search.postings == postings
+
+def test_add_and_remove_items_keep_indexes_in_step():
+    store = AuctionStore()
+    for n in range(20):
+        store.add_item(make_item(n, name=f"lamp{n % 3}", seller=f"s{n % 4}"))
+    assert_consistent(store)
+    for n in range(0, 20, 2):
+        assert store.remove_item(str(n)).item_id == str(n)
+    assert store.remove_item("0") is None
+    assert_consistent(store)
+    assert sorted(item.item_id for item in store.items_named("lamp1")) == ["1", "13", "19", "7"]
+    assert store.seller_item_count("s0") == 0
+    assert store.items_of_seller("s0") == []
+
+def test_record_bid_refreshes_sorted_keys():
+    store = AuctionStore()
+    for n in range(10):
+        store.add_item(make_item(n, end_time=1000.0 + n, price=10.0 + n))
+    item = store.get_item("3")
+    store.record_bid(item, 99.0, "b1", 2000.0)
+    assert_consistent(store)
+    _, found = store.search.search([], order="price_desc", limit=1)
+    assert found[0][1] is item
+    _, found = store.search.search([], order="ending", limit=10)
+    assert found[-1][1] is item
+
+def test_randomized_mutations_stay_consistent():
+    rng = random.Random(7)
+    store = AuctionStore()
+    live = []
+    for n in range(300):
+        action = rng.random()
+        if action < 0.5 or not live:
+            item = make_item(n, name=rng.choice(["lamp", "desk", "chair"]), seller=f"s{rng.randrange(5)}",
+                             end_time=rng.uniform(0, 100), price=rng.uniform(1, 50))
+            store.add_item(item)
+            live.append(item.item_id)
+        elif action < 0.8:
+            item = store.get_item(rng.choice(live))
+            store.record_bid(item, item.current_price + rng.uniform(0, 5), "b", item.end_time + rng.uniform(0, 5))
+        else:
+            store.remove_item(live.pop(rng.randrange(len(live))))
+    assert_consistent(store)
+
+def test_subscriptions_and_buyers_for():
+    store = AuctionStore()
+    store.add_user(User("b1", "Buyer", "127.0.0.1", 5001, 0))
+    assert store.add_subscription(Subscription("b1", "lamp"))
+    assert not store.add_subscription(Subscription("b1", "lamp"))
+    assert store.add_subscription(Subscription("b2", "lamp"))
+    assert store.add_subscription(Subscription("b3", "la*"))
+    assert set(store.buyers_for("lamp")) == {"b1", "b2", "b3"}
+    assert set(store.buyers_for("laptop")) == {"b3"}
+    store.remove_subscription("b1", "lamp")
+    store.remove_subscription("b2", "lamp")
+    store.remove_subscription("b3", "la*")
+    assert not store.buyers_for("lamp")
+    assert_consistent(store)
@@ -0,0 +1,109 @@
+import time
+
+import customtkinter as ctk
+
+from row_window import RowWindow
+
+# ----------------------------
+# VirtualList
+# ----------------------------
+class VirtualList(ctk.CTkFrame):
+    """
+    Scrollable list that owns one label per *visible* row, however many
+    records it holds. Records are keyed (set/remove apply a single-row diff)
+    and rendered on demand through format_row(record, now), so only rows on
+    screen are ever formatted. Redraws are coalesced to at most max_fps per
+    second, and a label is only reconfigured when its text changes. The
+    records and scroll position live in a RowWindow (row_window.py).
+
+    With a profiler, each redraw is recorded as span `name`.
+    """
+    def __init__(self, master, format_row, visible_rows=12, max_fps=10, profiler=None, name="ui.redraw",
+                 **kwargs):
+        super().__init__(master, **kwargs)
+        self.format_row = format_row
+        self.profiler = profiler
+        self.name = name
+        self.visible_rows = visible_rows
+        self.frame_interval = max(1, int(1000 / max_fps))
+
+        self.window = RowWindow(visible_rows)
+        self.redraw_pending = False
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        body = ctk.CTkFrame(self, fg_color="transparent")
+        body.pack(side="left", fill="both", expand=True)
+
+        self.labels = []
+        self.shown = []             # text currently on each label
+        for _ in range(visible_rows):
+            label = ctk.CTkLabel(body, text="", anchor="w")
+            label.pack(fill="x", padx=5, pady=1)
+            self.labels.append(label)
+            self.shown.append("")
+
+        for widget in [self, body] + self.labels:
+            widget.bind("<MouseWheel>", self.on_wheel)
+            widget.bind("<Button-4>", lambda event: self.scroll_rows(-3))
+            widget.bind("<Button-5>", lambda event: self.scroll_rows(3))
+
+    def __len__(self):
+        return len(self.window)
+
+    # ----- Keyed updates -----
+
+    def set(self, key, record):
+        self.window.set(key, record)
+        self.request_redraw()
+
+    def remove(self, key):
+        if self.window.remove(key):
+            self.request_redraw()
+
+    def replace_all(self, records):
+        self.window.replace_all(records)
+        self.request_redraw()
+
+    def keys(self):
+        return self.window.keys()
+
+    # ----- Drawing -----
+
+    def request_redraw(self):
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after(self.frame_interval, self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        started = time.perf_counter()
+        records = self.window.visible()
+        now = time.time()
+        for row, label in enumerate(self.labels):
+            text = self.format_row(records[row], now) if row < len(records) else ""
+            if text != self.shown[row]:
+                self.shown[row] = text
+                label.configure(text=text)
+        self.scrollbar.set(*self.window.scrollbar_range())
+        if self.profiler is not None:
+            self.profiler.record(self.name, started)
+
+    # ----- Scrolling -----
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.window.move_to(float(value))
+        elif action == "scroll":
+            if unit == "pages":
+                self.window.scroll_pages(int(value))
+            else:
+                self.window.scroll_rows(int(value))
+        self.request_redraw()
+
+    def on_wheel(self, event):
+        self.scroll_rows(-3 if event.delta > 0 else 3)
+
+    def scroll_rows(self, rows):
+        self.window.scroll_rows(rows)
+        self.request_redraw()